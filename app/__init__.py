@@ -0,0 +1,4 @@
+import time
+
+# Reference point for startup timing; app/__init__ runs before any app module
+BOOT_T0 = time.perf_counter()
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .candles import Interval, fetch_historical_chunked
+from .indicators import rolling_max, rolling_min, rsi, sma
+from .logger import logger
+from .repositories.portfolios import DEFAULT_INITIAL_CASH
+from .timeutils import end_of_day_ist, start_of_day_ist
+from .trading import apply_fill
+
+SIGNALS = {
+    "sma_cross": {"fast": 20, "slow": 50},
+    "rsi": {"period": 14, "buy_below": 30, "sell_above": 70},
+    "breakout": {"lookback": 20},
+}
+SIZINGS = ("percent_cash", "fixed_qty")
+STORE_COLUMNS = ["t", "o", "h", "l", "c", "v"]
+MAX_EQUITY_POINTS = 500
+
+
+@dataclass(frozen=True)
+class Strategy:
+    signal: str
+    params: Dict[str, float] = field(default_factory=dict)
+    sizing: str = "percent_cash"
+    size: float = 1.0
+    initial_cash: float = DEFAULT_INITIAL_CASH
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Strategy":
+        sig = d.get("signal") or {}
+        sig_type = sig.get("type")
+        if sig_type not in SIGNALS:
+            raise ValueError(f"signal.type must be one of {', '.join(SIGNALS)}")
+        params = dict(SIGNALS[sig_type])
+        for k in params:
+            if k in sig:
+                params[k] = float(sig[k])
+        sizing = d.get("sizing") or {}
+        sizing_type = sizing.get("type", "percent_cash")
+        if sizing_type not in SIZINGS:
+            raise ValueError(f"sizing.type must be one of {', '.join(SIZINGS)}")
+        size = float(sizing.get("value", 1.0))
+        if size <= 0 or (sizing_type == "percent_cash" and size > 1):
+            raise ValueError("sizing.value out of range")
+        cash = float(d.get("initial_cash", DEFAULT_INITIAL_CASH))
+        if cash <= 0:
+            raise ValueError("initial_cash must be positive")
+        return cls(sig_type, params, sizing_type, size, cash)
+
+
+def ohlcv_from_raw(raw: List[list]) -> Dict[str, Any]:
+    rows = [r for r in raw if r and len(r) >= 5]
+    arr = np.array(
+        [[r[1], r[2], r[3], r[4], r[5] if len(r) >= 6 and r[5] else 0] for r in rows],
+        dtype=np.float64,
+    ).reshape(-1, 5)
+    return {
+        "t": [str(r[0]) for r in rows],
+        "o": arr[:, 0],
+        "h": arr[:, 1],
+        "l": arr[:, 2],
+        "c": arr[:, 3],
+        "v": arr[:, 4],
+    }
+
+
+def _hold_state(events: np.ndarray) -> np.ndarray:
+    """+1/-1 entry/exit events -> in-market flag, carried forward between events."""
+    idx = np.where(events != 0, np.arange(len(events)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    return events[idx] == 1
+
+
+def target_position(strategy: Strategy, bars: Dict[str, Any]) -> np.ndarray:
+    c = bars["c"]
+    p = strategy.params
+    if strategy.signal == "sma_cross":
+        fast, slow = sma(c, int(p["fast"])), sma(c, int(p["slow"]))
+        with np.errstate(invalid="ignore"):
+            return fast > slow
+    if strategy.signal == "rsi":
+        r = rsi(c, int(p["period"]))
+        with np.errstate(invalid="ignore"):
+            events = np.where(
+                r < p["buy_below"], 1, np.where(r > p["sell_above"], -1, 0)
+            )
+        return _hold_state(events)
+    # breakout: close beyond the previous lookback-bar high/low
+    n = int(p["lookback"])
+    hi = np.roll(rolling_max(bars["h"], n), 1)
+    lo = np.roll(rolling_min(bars["l"], n), 1)
+    hi[:1] = lo[:1] = np.nan
+    with np.errstate(invalid="ignore"):
+        events = np.where(c > hi, 1, np.where(c < lo, -1, 0))
+    return _hold_state(events)
+
+
+def _ffill(values: np.ndarray, mask: np.ndarray, initial: float) -> np.ndarray:
+    idx = np.where(mask, np.arange(len(values)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], initial)
+
+
+def run_backtest(
+    strategy: Strategy, bars: Dict[str, Any], include_trades: bool = True
+) -> Dict[str, Any]:
+    close = bars["c"]
+    n = len(close)
+    if n == 0:
+        raise ValueError("No candles in range")
+    state = target_position(strategy, bars)
+    # Signals are evaluated on arrays; only bars where the target flips are visited
+    changes = np.flatnonzero(np.diff(state.astype(np.int8), prepend=0))
+
+    cash, realized_pl, qty, avg = strategy.initial_cash, 0.0, 0, 0.0
+    qty_at = np.zeros(n)
+    cash_at = np.zeros(n)
+    mark = np.zeros(n, dtype=bool)
+    trades: List[Dict[str, Any]] = []
+    for i in changes:
+        price = round(float(close[i]), 2)
+        if price <= 0:
+            continue
+        if state[i]:
+            if strategy.sizing == "fixed_qty":
+                q = int(strategy.size)
+            else:
+                q = int(cash * strategy.size // price)
+            if q <= 0 or round(q * price, 2) > cash:
+                continue
+            side = "BUY"
+        else:
+            if qty == 0:
+                continue
+            q, side = qty, "SELL"
+        fill = apply_fill(cash, realized_pl, qty, avg, side, q, price)  # type: ignore
+        cash, realized_pl, qty, avg = (
+            fill.cash,
+            fill.realized_pl,
+            fill.quantity,
+            fill.avg_price,
+        )
+        qty_at[i], cash_at[i], mark[i] = qty, cash, True
+        trades.append(
+            {
+                "t": bars["t"][i],
+                "side": side,
+                "quantity": q,
+                "price": price,
+                "amount": fill.amount,
+                "realized_pl": fill.realized,
+            }
+        )
+
+    equity = (
+        _ffill(cash_at, mark, strategy.initial_cash) + _ffill(qty_at, mark, 0.0) * close
+    )
+    peak = np.maximum.accumulate(equity)
+    sells = [t for t in trades if t["side"] == "SELL"]
+    final = float(equity[-1])
+    years = _span_years(bars["t"][0], bars["t"][-1])
+    total_return = final / strategy.initial_cash - 1.0
+    out: Dict[str, Any] = {
+        "bars": n,
+        "trades": len(trades),
+        "final_equity": round(final, 2),
+        "realized_pl": round(realized_pl, 2),
+        "open_quantity": qty,
+        "total_return": round(total_return, 6),
+        "cagr": (
+            round((final / strategy.initial_cash) ** (1 / years) - 1.0, 6)
+            if years > 0 and final > 0
+            else None
+        ),
+        "max_drawdown": round(float((equity / peak - 1.0).min()), 6),
+        "win_rate": (
+            round(sum(1 for t in sells if t["realized_pl"] > 0) / len(sells), 4)
+            if sells
+            else None
+        ),
+    }
+    if include_trades:
+        step = max(1, n // MAX_EQUITY_POINTS)
+        points = list(range(0, n, step))
+        if points[-1] != n - 1:
+            points.append(n - 1)
+        out["fills"] = trades
+        out["equity"] = [
+            {"t": bars["t"][i], "equity": round(float(equity[i]), 2)} for i in points
+        ]
+    return out
+
+
+def _span_years(t0: str, t1: str) -> float:
+    try:
+        a = datetime.fromisoformat(t0)
+        b = datetime.fromisoformat(t1)
+    except ValueError:
+        return 0.0
+    return (b - a).total_seconds() / (365.25 * 86400)
+
+
+# ---- candle sources ----
+
+
+def fetch_raw(
+    token: str, interval: Interval, start: datetime, end: datetime
+) -> List[list]:
+    if interval == "ONE_DAY":
+        start, end = start_of_day_ist(start), end_of_day_ist(end)
+    return fetch_historical_chunked("NSE", token, interval, start, end)
+
+
+def _store_path(store_dir: str, token: str, interval: Interval) -> str:
+    return os.path.join(store_dir, interval, f"{token}.csv")
+
+
+def write_store(store_dir: str, token: str, interval: Interval, raw: List[list]):
+    path = _store_path(store_dir, token, interval)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(STORE_COLUMNS)
+        for r in raw:
+            if r and len(r) >= 5:
+                w.writerow(list(r[:6]))
+
+
+def load_store(
+    store_dir: str, token: str, interval: Interval, start: datetime, end: datetime
+) -> Optional[Dict[str, Any]]:
+    path = _store_path(store_dir, token, interval)
+    if not os.path.exists(path):
+        return None
+    raw = []
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            ts = datetime.fromisoformat(row[0])
+            if start <= ts <= end:
+                raw.append(row)
+    return ohlcv_from_raw(raw)
+
+
+# ---- universe runs ----
+
+
+def _run_bars_job(
+    strategy: Strategy, token: str, bars: Dict[str, Any]
+) -> Dict[str, Any]:
+    try:
+        return {"token": token, **run_backtest(strategy, bars, include_trades=False)}
+    except Exception as e:
+        return {"token": token, "error": str(e)}
+
+
+def _run_store_job(
+    strategy: Strategy,
+    token: str,
+    store_dir: str,
+    interval: Interval,
+    start: datetime,
+    end: datetime,
+) -> Dict[str, Any]:
+    bars = load_store(store_dir, token, interval, start, end)
+    if bars is None:
+        return {"token": token, "error": "not in store"}
+    return _run_bars_job(strategy, token, bars)
+
+
+def run_universe(
+    strategy: Strategy,
+    tokens: List[str],
+    start: datetime,
+    end: datetime,
+    interval: Interval = "ONE_DAY",
+    store_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Backtest each token in a process pool.
+
+    Tokens already in store_dir are read by the workers themselves. The rest
+    are fetched by the parent through the (rate-limited) SmartAPI path, saved
+    to the store when one is given, and shipped to the pool as they arrive so
+    CPU work overlaps with the next download.
+    """
+    results: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for tok in tokens:
+            if store_dir and os.path.exists(_store_path(store_dir, tok, interval)):
+                futures.append(
+                    pool.submit(
+                        _run_store_job, strategy, tok, store_dir, interval, start, end
+                    )
+                )
+                continue
+            try:
+                raw = fetch_raw(tok, interval, start, end)
+            except Exception as e:
+                logger.warning(f"Backtest fetch failed for {tok}: {e}")
+                results.append({"token": tok, "error": str(e)})
+                continue
+            if store_dir and raw:
+                write_store(store_dir, tok, interval, raw)
+            futures.append(
+                pool.submit(_run_bars_job, strategy, tok, ohlcv_from_raw(raw))
+            )
+        for fut in as_completed(futures):
+            results.append(fut.result())
+    return results
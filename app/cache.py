@@ -1,3 +1,4 @@
+import threading
 import time
 from typing import Any
 
@@ -6,22 +7,14 @@ class TTLCache:
     def __init__(self, ttl_seconds: float = 60.0, max_items: int = 1024):
         self.ttl = ttl_seconds
         self.max_items = max_items
+        # insertion order == write-time order (set() re-inserts), so the
+        # oldest entry is always first
         self._store: dict[Any, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
 
     def _prune(self):
-        if len(self._store) > self.max_items:
-            now = time.time()
-            expired_keys = [
-                k for k, (ts, _) in self._store.items() if now - ts > self.ttl
-            ]
-            for k in expired_keys:
-                self._store.pop(k, None)
-            if len(self._store) > self.max_items:
-                oldest = sorted(self._store.items(), key=lambda kv: kv[1][0])[
-                    : len(self._store) - self.max_items
-                ]
-                for k, _ in oldest:
-                    self._store.pop(k, None)
+        while len(self._store) > self.max_items:
+            self._store.pop(next(iter(self._store)))
 
     def get(self, key: Any):
         item = self._store.get(key)
@@ -29,10 +22,22 @@ class TTLCache:
             return None
         ts, value = item
         if time.time() - ts > self.ttl:
-            self._store.pop(key, None)
+            with self._lock:
+                if self._store.get(key) is item:
+                    self._store.pop(key, None)
             return None
         return value
 
     def set(self, key: Any, value: Any):
-        self._store[key] = (time.time(), value)
-        self._prune()
+        with self._lock:
+            self._store.pop(key, None)
+            self._store[key] = (time.time(), value)
+            self._prune()
+
+    def delete(self, key: Any):
+        with self._lock:
+            self._store.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
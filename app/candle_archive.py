@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .timeutils import IST, bar_time
+
+# <root>/<interval>/<symbol>/<year>.arrow (uncompressed Arrow IPC, so reads
+# can memory-map the file and slice columns without copying), optionally
+# with a <year>.parquet sibling for external analytics tools.
+SCHEMA = pa.schema(
+    [
+        ("t", pa.timestamp("ms", tz="Asia/Kolkata")),
+        ("o", pa.float64()),
+        ("h", pa.float64()),
+        ("l", pa.float64()),
+        ("c", pa.float64()),
+        ("v", pa.float64()),
+    ]
+)
+COVERAGE_FILE = "_coverage.json"
+
+
+def _safe(symbol: str) -> str:
+    return symbol.replace("/", "_").replace(os.sep, "_")
+
+
+def _dir(root: str, interval: str, symbol: str) -> str:
+    return os.path.join(root, interval, _safe(symbol))
+
+
+def table_from_raw(raw: List[list]) -> pa.Table:
+    rows = [r for r in raw if r and len(r) >= 5]
+    cols: Dict[str, list] = {
+        "t": [bar_time(r[0]) for r in rows],
+        "o": [float(r[1]) for r in rows],
+        "h": [float(r[2]) for r in rows],
+        "l": [float(r[3]) for r in rows],
+        "c": [float(r[4]) for r in rows],
+        "v": [float(r[5]) if len(r) >= 6 and r[5] is not None else None for r in rows],
+    }
+    return pa.Table.from_pydict(cols, schema=SCHEMA)
+
+
+def _read_file(path: str) -> pa.Table:
+    # memory-mapped: column buffers point into the page cache, no copy
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _write_file(path: str, table: pa.Table):
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, SCHEMA) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def coverage(root: str, interval: str, symbol: str) -> Optional[Dict[str, str]]:
+    path = os.path.join(_dir(root, interval, symbol), COVERAGE_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write(
+    root: str,
+    interval: str,
+    symbol: str,
+    raw: List[list],
+    covered_from: datetime,
+    covered_to: datetime,
+    parquet: bool = False,
+) -> int:
+    """Merge bars into the yearly partitions and widen the coverage window.
+
+    covered_from/covered_to is the range the bars were fetched for, so a gap
+    inside it means "no trading", not "not archived".
+    """
+    new = table_from_raw(raw)
+    base = _dir(root, interval, symbol)
+    os.makedirs(base, exist_ok=True)
+    years = pc.year(new["t"]).to_pylist() if new.num_rows else []
+    written = 0
+    for year in sorted(set(years)):
+        part = new.filter(pc.equal(pc.year(new["t"]), year))
+        path = os.path.join(base, f"{year}.arrow")
+        if os.path.exists(path):
+            part = pa.concat_tables([_read_file(path), part])
+        # newest write wins for a repeated timestamp
+        idx = pc.sort_indices(part, sort_keys=[("t", "ascending")])
+        part = part.take(idx)
+        ts = part["t"].to_pylist()
+        keep = [i for i in range(len(ts)) if i + 1 == len(ts) or ts[i] != ts[i + 1]]
+        part = part.take(pa.array(keep, type=pa.int64()))
+        _write_file(path, part)
+        pq_path = os.path.join(base, f"{year}.parquet")
+        # keep an existing Parquet copy in step with the Arrow partition
+        if parquet or os.path.exists(pq_path):
+            pq.write_table(part, pq_path)
+        written += part.num_rows
+
+    cov = coverage(root, interval, symbol) or {}
+    lo, hi = bar_time(covered_from), bar_time(covered_to)
+    if cov.get("from") and cov.get("to"):
+        old_lo, old_hi = bar_time(cov["from"]), bar_time(cov["to"])
+        # only merge windows that touch; otherwise keep the newer one
+        if lo <= old_hi and hi >= old_lo:
+            lo, hi = min(lo, old_lo), max(hi, old_hi)
+    tmp = os.path.join(base, COVERAGE_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"from": lo.isoformat(), "to": hi.isoformat()}, f)
+    os.replace(tmp, os.path.join(base, COVERAGE_FILE))
+    return written
+
+
+def read(
+    root: str, interval: str, symbol: str, start: datetime, end: datetime
+) -> Optional[pa.Table]:
+    """Bars in [start, end] if the archive covers that range, else None."""
+    cov = coverage(root, interval, symbol)
+    if not cov or bar_time(cov["from"]) > start or bar_time(cov["to"]) < end:
+        return None
+    base = _dir(root, interval, symbol)
+    parts = []
+    for year in range(start.astimezone(IST).year, end.astimezone(IST).year + 1):
+        path = os.path.join(base, f"{year}.arrow")
+        if os.path.exists(path):
+            parts.append(_read_file(path))
+    if not parts:
+        return SCHEMA.empty_table()
+    table = pa.concat_tables(parts)
+    t = table["t"]
+    lo = pa.scalar(start, type=SCHEMA.field("t").type)
+    hi = pa.scalar(end, type=SCHEMA.field("t").type)
+    mask = pc.and_(pc.greater_equal(t, lo), pc.less_equal(t, hi))
+    return table.filter(mask)
+
+
+def to_raw(table: pa.Table) -> List[list]:
+    """SmartAPI-shaped rows ([iso_ts, o, h, l, c, v]) for the existing callers."""
+    cols = [table[c].to_pylist() for c in ("t", "o", "h", "l", "c", "v")]
+    return [
+        [ts.astimezone(IST).isoformat(), o, h, lo, c, v]
+        for ts, o, h, lo, c, v in zip(*cols)
+    ]
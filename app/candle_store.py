@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from pymongo import ReplaceOne
+
+from . import trading_calendar
+from .config import settings
+from .db import CANDLES, get_db
+from .logger import logger
+from .request_planner import Rows, missing_in
+from .timeutils import IST, bar_time, now_ist, start_of_day_ist
+
+# Bars are stored as SmartAPI returns them ([ts, o, h, l, c, v] with an IST
+# ISO timestamp), one document per token/interval/period. Daily and hourly
+# bars are grouped by month, finer intervals by day.
+MONTHLY = ("ONE_DAY", "ONE_HOUR")
+
+Fetch = Callable[[datetime, datetime], Rows]
+
+# After a Mongo error, go straight upstream for a while instead of paying the
+# server-selection timeout on every chart request
+RETRY_AFTER_SECONDS = 30.0
+_down_until = 0.0
+
+
+def period_of(interval: str, ts: str) -> str:
+    """Period key straight from the bar timestamp (IST, YYYY-MM-DD...)."""
+    return ts[:7] if interval in MONTHLY else ts[:10]
+
+
+def _period_bounds(interval: str, period: str) -> Tuple[datetime, datetime]:
+    if interval in MONTHLY:
+        y, m = int(period[:4]), int(period[5:7])
+        start = datetime(y, m, 1, tzinfo=IST)
+        nxt = datetime(y + (m == 12), m % 12 + 1, 1, tzinfo=IST)
+    else:
+        start = datetime.fromisoformat(period).replace(tzinfo=IST)
+        nxt = start + timedelta(days=1)
+    return start, nxt
+
+
+def periods(interval: str, start: datetime, end: datetime) -> List[str]:
+    out = []
+    cur = start_of_day_ist(start)
+    while cur <= end:
+        p = period_of(interval, cur.date().isoformat())
+        if not out or out[-1] != p:
+            out.append(p)
+        cur = _period_bounds(interval, p)[1]
+    return out
+
+
+def _complete(interval: str, period: str) -> bool:
+    # today's (or this month's) bars are still being formed
+    return _period_bounds(interval, period)[1] <= start_of_day_ist(now_ist())
+
+
+def _key(token: str, interval: str, period: str) -> str:
+    return f"{token}:{interval}:{period}"
+
+
+def load(token: str, interval: str, keys: Iterable[str]) -> Dict[str, List[list]]:
+    ids = [_key(token, interval, p) for p in keys]
+    cur = get_db()[CANDLES].find({"_id": {"$in": ids}}, {"period": 1, "bars": 1})
+    return {d["period"]: d.get("bars") or [] for d in cur}
+
+
+def save(
+    token: str,
+    interval: str,
+    rows: List[list],
+    covered: Iterable[str],
+):
+    """Persist the complete periods in covered, which must all have been
+    answered upstream; one with no rows is stored empty."""
+    by_period: Dict[str, List[list]] = {p: [] for p in covered}
+    for r in rows:
+        p = period_of(interval, str(r[0]))
+        if p in by_period:
+            by_period[p].append(list(r[:6]))
+    now = datetime.now(timezone.utc)
+    ops = [
+        ReplaceOne(
+            {"_id": _key(token, interval, p)},
+            {
+                "token": token,
+                "interval": interval,
+                "period": p,
+                "bars": bars,
+                "fetched_at": now,
+            },
+            upsert=True,
+        )
+        for p, bars in by_period.items()
+        if _complete(interval, p)
+    ]
+    if ops:
+        get_db()[CANDLES].bulk_write(ops, ordered=False)
+
+
+def read_through(
+    token: str, interval: str, start: datetime, end: datetime, fetch: Fetch
+) -> Rows:
+    """Stored bars for complete periods, upstream for the rest.
+
+    Missing complete periods are fetched in contiguous runs over whole
+    periods so they can be stored; the still-forming period is always
+    fetched. Only periods whose every chunk was answered are stored; a run
+    whose fetch came back entirely empty is not stored either, since an empty
+    answer may be an upstream failure rather than a holiday. Unanswered
+    windows are passed on in .missing.
+    """
+    global _down_until
+    if time.monotonic() < _down_until:
+        return fetch(start, end)
+    keys = periods(interval, start, end)
+    try:
+        stored = load(token, interval, keys)
+    except Exception as e:
+        logger.warning(f"Candle store unavailable ({e}); fetching upstream")
+        _down_until = time.monotonic() + RETRY_AFTER_SECONDS
+        return fetch(start, end)
+
+    rows: List[list] = []
+    missing: List[Tuple[datetime, datetime]] = []
+    run: List[str] = []
+
+    def flush_run():
+        if not run:
+            return
+        lo = max(start, _period_bounds(interval, run[0])[0])
+        hi = min(end, _period_bounds(interval, run[-1])[1] - timedelta(minutes=1))
+        if all(_complete(interval, p) for p in run):
+            # fetch whole periods so they can be stored
+            lo = _period_bounds(interval, run[0])[0]
+            hi = _period_bounds(interval, run[-1])[1] - timedelta(minutes=1)
+        got = fetch(lo, hi)
+        rows.extend(got)
+        missing.extend(getattr(got, "missing", ()))
+        # a period with a failed (or skipped) chunk would be stored short forever
+        answered = []
+        for p in run:
+            p_lo, p_hi = _period_bounds(interval, p)
+            if not missing_in(got, p_lo, p_hi - timedelta(minutes=1)):
+                answered.append(p)
+        if got and answered:
+            try:
+                save(token, interval, got, answered)
+            except Exception as e:
+                logger.warning(f"Candle store write failed for {token}: {e}")
+        run.clear()
+
+    for p in keys:
+        lo, hi = _period_bounds(interval, p)
+        if _complete(interval, p) and not trading_calendar.trading_days(
+            lo, hi - timedelta(minutes=1)
+        ):
+            # weekend/holiday-only period: nothing to fetch or store
+            flush_run()
+            continue
+        if p in stored and _complete(interval, p):
+            flush_run()
+            rows.extend(stored[p])
+        elif _complete(interval, p):
+            run.append(p)
+        else:
+            flush_run()
+            run.append(p)
+            flush_run()
+    flush_run()
+
+    out = [r for r in rows if r and len(r) >= 5 and start <= bar_time(r[0]) <= end]
+    out.sort(key=lambda r: str(r[0]))
+    return Rows(out, missing)
+
+
+def enabled() -> bool:
+    return settings.candle_store
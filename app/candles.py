@@ -1,18 +1,33 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Literal, Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Tuple
 
+from . import candle_store, deadline, scheduler, trading_calendar
+from .cache import TTLCache
+from .circuit import CircuitOpenError
+from .config import settings
 from .logger import logger
+from .request_planner import Rows, missing_in, request_planner
 from .smartapi_client import smart_mgr
 from .timeutils import (
+    IST,
+    bar_time,
     clamp_market_hours,
     end_of_day_ist,
+    last_n_days_endpoints,
     now_ist,
+    parse_iso_ist,
     start_of_day_ist,
     to_smartapi_str,
 )
 
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 Interval = Literal[
     "ONE_MINUTE",
     "THREE_MINUTE",
@@ -25,19 +40,21 @@ Interval = Literal[
 ]
 
 
+# Widest window SmartAPI serves per getCandleData call, in days
+MAX_SPAN_DAYS: Dict[str, int] = {
+    "ONE_MINUTE": 30,
+    "THREE_MINUTE": 60,
+    "FIVE_MINUTE": 100,
+    "TEN_MINUTE": 100,
+    "FIFTEEN_MINUTE": 200,
+    "THIRTY_MINUTE": 200,
+    "ONE_HOUR": 400,
+    "ONE_DAY": 2000,
+}
+
+
 def _interval_chunk_days(interval: Interval) -> int:
-    if interval in (
-        "ONE_MINUTE",
-        "THREE_MINUTE",
-        "FIVE_MINUTE",
-        "TEN_MINUTE",
-        "FIFTEEN_MINUTE",
-        "THIRTY_MINUTE",
-    ):
-        return 1
-    if interval == "ONE_HOUR":
-        return 7
-    return 100
+    return MAX_SPAN_DAYS.get(interval, 30)
 
 
 def _retry_fetch(
@@ -48,42 +65,111 @@ def _retry_fetch(
     end: datetime,
     max_attempts: int = 3,
 ) -> Optional[Dict[str, Any]]:
+    """The chunk's response, or None when it got no answer (errors, an open
+    circuit, or no time for another attempt). A chunk that stays empty after
+    every attempt returns that empty response: the day may have no bars."""
     delay = 0.5
+    empty = None
     for attempt in range(1, max_attempts + 1):
+        if deadline.expired():
+            return None
         try:
             res = smart_mgr.get_candles(
                 exchange, token, interval, to_smartapi_str(start), to_smartapi_str(end)
             )
             if res and res.get("status") is not False and res.get("data"):
                 return res
+            if res and res.get("status") is not False:
+                empty = res
             logger.warning(
                 f"Empty/unsuccessful candle response (attempt {attempt}) for {token} {interval} {start} - {end}"
             )
+        except CircuitOpenError:
+            # no point retrying (or sleeping) until the breaker lets calls through
+            return None
         except Exception as e:
             logger.warning(f"Candle fetch error (attempt {attempt}): {e}")
         if attempt < max_attempts:
             import time
 
+            left = deadline.remaining()
+            if left is not None and left <= delay:
+                # the caller will have moved on before the next attempt lands
+                return None
             time.sleep(delay)
             delay *= 2
-    return None
+    return empty
 
 
 def fetch_historical_chunked(
     exchange: str, token: str, interval: Interval, start: datetime, end: datetime
-) -> List[list]:
+) -> Rows:
+    """Bars for [start, end]; .missing lists the chunks that got no answer."""
     start, end = clamp_market_hours(start, end)
-    chunk_days = _interval_chunk_days(interval)
-    result: List[list] = []
+    if exchange == "NSE" and candle_store.enabled():
+        return candle_store.read_through(
+            token,
+            interval,
+            start,
+            end,
+            lambda s, e: _fetch_upstream(exchange, token, interval, s, e),
+        )
+    return _fetch_upstream(exchange, token, interval, start, end)
+
+
+def _fetch_upstream(
+    exchange: str, token: str, interval: Interval, start: datetime, end: datetime
+) -> Rows:
+    """Upstream bars for [start, end], merged with concurrent callers' windows
+    for the same series so overlapping or nearby requests share calls."""
+    span = timedelta(days=_interval_chunk_days(interval))
+
+    def run(windows: List[Tuple[datetime, datetime]]) -> Rows:
+        result = Rows()
+        for w_lo, w_hi in windows:
+            for lo, hi in plan_chunks(interval, w_lo, w_hi):
+                res = None
+                if not deadline.expired():
+                    res = _retry_fetch(exchange, token, interval, lo, hi)
+                if res is None:
+                    result.missing.append((lo, hi))
+                elif res.get("data"):
+                    result.extend(res["data"])
+        return result
 
-    cur = start
-    while cur < end:
-        nxt = min(cur + timedelta(days=chunk_days), end)
-        res = _retry_fetch(exchange, token, interval, cur, nxt)
-        if res and res.get("data"):
-            result.extend(res["data"])
-        cur = nxt
-    return result
+    def joinable(left, right) -> bool:
+        # one call covers both, or only closed days lie between them
+        return right[1] - left[0] < span or not trading_calendar.trading_days(
+            left[1] + timedelta(minutes=1), right[0] - timedelta(minutes=1)
+        )
+
+    return request_planner.fetch((exchange, token, interval), start, end, run, joinable)
+
+
+def plan_chunks(
+    interval: Interval, start: datetime, end: datetime
+) -> List[Tuple[datetime, datetime]]:
+    """Upstream request windows for [start, end]: runs of trading days spanning
+    at most the interval's chunk size. Weekends and holidays cost no call."""
+    span = _interval_chunk_days(interval)
+    out: List[Tuple[datetime, datetime]] = []
+    group: List[date] = []
+
+    def close_group():
+        first, last = group[0], group[-1]
+        lo = max(start, datetime(first.year, first.month, first.day, tzinfo=IST))
+        hi = min(end, datetime(last.year, last.month, last.day, 23, 59, tzinfo=IST))
+        if lo < hi:
+            out.append((lo, hi))
+
+    for d in trading_calendar.trading_days(start, end):
+        if group and (d - group[0]).days >= span:
+            close_group()
+            group = []
+        group.append(d)
+    if group:
+        close_group()
+    return out
 
 
 def _is_intraday(interval: Interval) -> bool:
@@ -114,16 +200,16 @@ def fallback_daily_if_empty(
             daily_fast = fetch_historical_chunked(
                 exchange, token, "ONE_DAY", s_snap, e_snap
             )
-            if daily_fast:
+            if daily_fast or deadline.expired():
                 return daily_fast
 
     data = fetch_historical_chunked(exchange, token, interval, start, end)
-    if data:
+    if data or deadline.expired():
         return data
 
     s_snap, e_snap = start_of_day_ist(start), end_of_day_ist(end)
     daily = fetch_historical_chunked(exchange, token, "ONE_DAY", s_snap, e_snap)
-    if daily:
+    if daily or deadline.expired():
         return daily
 
     today = now_ist()
@@ -132,6 +218,172 @@ def fallback_daily_if_empty(
     return daily2 or []
 
 
+def archive_table(
+    symbol: str, interval: Interval, start: datetime, end: datetime
+) -> Optional["pa.Table"]:
+    """Memory-mapped Arrow table from the columnar archive, or None when the
+    archive is off or does not cover [start, end]."""
+    if not settings.candle_archive_dir:
+        return None
+    # pyarrow is only needed (and imported) when the archive is configured
+    from . import candle_archive
+
+    start, end = clamp_market_hours(start, end)
+    return candle_archive.read(
+        settings.candle_archive_dir, interval, symbol, start, end
+    )
+
+
+def read_archive(
+    symbol: str, interval: Interval, start: datetime, end: datetime
+) -> Optional[List[list]]:
+    table = archive_table(symbol, interval, start, end)
+    if table is None:
+        return None
+    from . import candle_archive
+
+    return candle_archive.to_raw(table)
+
+
+def request_range(
+    interval: Interval, frm: Optional[str], to: Optional[str], default_days: int = 30
+) -> Tuple[datetime, datetime]:
+    """Chart range from ?from=&to= (both or neither), snapped to whole days for
+    ONE_DAY."""
+    if frm and to:
+        start, end = parse_iso_ist(frm), parse_iso_ist(to)
+    else:
+        start, end = last_n_days_endpoints(default_days)
+    if interval == "ONE_DAY":
+        start, end = start_of_day_ist(start), end_of_day_ist(end)
+    return start, end
+
+
+# Last good answers per (token, interval), for stale-while-revalidate: a few
+# recent windows each, as (start, covered_until, rows)
+STALE_WINDOWS = 4
+_last_good = TTLCache(ttl_seconds=settings.candle_stale_seconds, max_items=4096)
+_revalidate_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="revalidate")
+# In-flight refreshes per (token, interval), as (start, end, covered_until, future)
+_revalidating: Dict[
+    Tuple[str, str], List[Tuple[datetime, datetime, datetime, Future]]
+] = {}
+_revalidate_lock = threading.Lock()
+
+
+def _covers(lo: datetime, until: datetime, start: datetime, end: datetime) -> bool:
+    return lo <= start and end <= until
+
+
+# Coverage of a window that ran up to the present: nothing newer existed when
+# it was fetched, so it spans any later "up to now" window (served as stale)
+OPEN_ENDED = datetime.max.replace(tzinfo=IST)
+
+
+def _until(end: datetime) -> datetime:
+    """How far a fetch of [.., end] made now reaches."""
+    return OPEN_ENDED if end >= now_ist() - timedelta(minutes=1) else end
+
+
+def _fetch_live(
+    token: str, interval: Interval, start: datetime, end: datetime
+) -> List[list]:
+    until = _until(end)
+    raw = fallback_daily_if_empty("NSE", token, interval, start, end)
+    # a fetch with unanswered chunks (failures, or cut short by a deadline)
+    # is served but not kept as the last good answer
+    if raw and not missing_in(raw, start, end):
+        key = (token, interval)
+        kept = [w for w in _last_good.get(key) or [] if (w[0], w[1]) != (start, until)]
+        _last_good.set(key, ([(start, until, raw)] + kept)[:STALE_WINDOWS])
+    return raw
+
+
+def _within(rows: List[list], start: datetime, end: datetime) -> List[list]:
+    return [r for r in rows if start <= bar_time(r[0]) <= end]
+
+
+def _stale(
+    token: str, interval: Interval, start: datetime, end: datetime
+) -> Optional[List[list]]:
+    """Last good bars for a window that spanned all of [start, end]; a
+    narrower one would pass off part of the range as the whole of it."""
+    for lo, until, raw in _last_good.get((token, interval)) or []:
+        if _covers(lo, until, start, end):
+            return _within(raw, start, end)
+    return None
+
+
+def _revalidate(
+    token: str, interval: Interval, start: datetime, end: datetime, cls: str
+) -> Tuple[Future, bool]:
+    """A refresh covering [start, end]: one already in flight for a window
+    spanning it, or a new one at priority cls. True when it fetches exactly
+    [start, end] (otherwise its rows need trimming)."""
+    key = (token, interval)
+    with _revalidate_lock:
+        for lo, hi, until, fut in _revalidating.get(key, ()):
+            if _covers(lo, until, start, end):
+                return fut, (lo, hi) == (start, end)
+        fut = _revalidate_pool.submit(_refresh, token, interval, start, end, cls)
+        entry = (start, end, _until(end), fut)
+        _revalidating.setdefault(key, []).append(entry)
+
+    def done(f: Future):
+        with _revalidate_lock:
+            left = [e for e in _revalidating.get(key, ()) if e[3] is not f]
+            if left:
+                _revalidating[key] = left
+            else:
+                _revalidating.pop(key, None)
+        if f.exception() is not None:
+            logger.warning(
+                f"Background refresh failed for {token} {interval}: {f.exception()}"
+            )
+
+    fut.add_done_callback(done)
+    return fut, True
+
+
+def _refresh(
+    token: str, interval: Interval, start: datetime, end: datetime, cls: str
+) -> List[list]:
+    with scheduler.priority(cls):
+        return _fetch_live(token, interval, start, end)
+
+
+def load_candles(
+    symbol: str, token: str, interval: Interval, start: datetime, end: datetime
+) -> Tuple[List[list], str, bool]:
+    """Raw bars, where they came from ("archive" or "live") and whether they
+    are stale.
+
+    Bars served before for a window spanning [start, end] are returned
+    straight away (stale) while the SmartAPI circuit is open, or when a fresh
+    fetch misses CANDLE_DEADLINE_MS; the fetch then refreshes them in the
+    background. Concurrent requests share a refresh whose window spans
+    theirs; any other window gets its own.
+    """
+    # Archived history answers without touching SmartAPI or Mongo
+    raw = read_archive(symbol, interval, start, end)
+    if raw is not None:
+        return raw, "archive", False
+    stale = _stale(token, interval, start, end)
+    if stale is not None and smart_mgr.hist.breaker.is_open():
+        _revalidate(token, interval, start, end, scheduler.PREFETCH)
+        return stale, "live", True
+    fut, exact = _revalidate(token, interval, start, end, scheduler.current())
+    wait = settings.candle_deadline_ms / 1000.0
+    if stale is None or settings.candle_deadline_ms <= 0:
+        wait = None
+    try:
+        rows = fut.result(timeout=wait)
+    except FuturesTimeout:
+        # the fetch keeps running and refreshes the cache when it lands
+        return stale, "live", True
+    return (rows if exact else _within(rows, start, end)), "live", False
+
+
 def normalize_candles(raw: List[list]) -> List[dict]:
     out: List[dict] = []
     for row in raw:
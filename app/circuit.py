@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    closed: calls pass; failure_threshold failures in a row (errors, or calls
+    slower than slow_call_seconds) open the circuit. open: calls fail fast
+    with CircuitOpenError for reset_seconds. half_open: one probe call is let
+    through; its success closes the circuit, its failure reopens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        slow_call_seconds: Optional[float] = None,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return HALF_OPEN
+        return OPEN
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"SmartAPI {self.name} circuit is open")
+
+    def record(self, ok: bool, elapsed: float = 0.0):
+        if ok and self.slow_call_seconds and elapsed > self.slow_call_seconds:
+            ok = False
+        with self._lock:
+            was = self._state()
+            self._probing = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                if was != CLOSED:
+                    logger.info(f"SmartAPI {self.name} circuit closed")
+                return
+            self._failures += 1
+            if was == HALF_OPEN or self._failures >= self.failure_threshold:
+                if was == CLOSED:
+                    self.opened += 1
+                    logger.warning(
+                        f"SmartAPI {self.name} circuit opened after "
+                        f"{self._failures} failures"
+                    )
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._state(),
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import os
+import queue
+import secrets
+import threading
+from contextlib import nullcontext
+from multiprocessing.connection import Client, Connection, Listener
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from . import deadline, scheduler
+from .circuit import CircuitOpenError
+from .config import settings
+from .logger import logger
+
+if TYPE_CHECKING:
+    from .quote_ring import QuoteRing
+
+# Multi-process mode (uvicorn --workers N): the workers elect one leader with
+# an exclusive lock file. The leader owns the SmartAPI sessions, throttle,
+# scheduler and circuit breakers and serves the other workers' candle calls
+# over a Unix socket; it also publishes the latest bars per token into a
+# shared-memory quote ring that every worker reads directly. Followers keep
+# retrying the lock, so a new leader takes over when the old one exits.
+LOCK_FILE = "smartapi.leader.lock"
+SOCKET_FILE = "smartapi.sock"
+KEY_FILE = "smartapi.key"
+RETRY_SECONDS = 2.0
+CALL_TIMEOUT_SECONDS = 60.0
+
+_ERRORS = {
+    "CircuitOpenError": CircuitOpenError,
+    "DeadlineExceeded": deadline.DeadlineExceeded,
+}
+
+Handler = Callable[..., Dict[str, Any]]
+
+
+class Cluster:
+    def __init__(self):
+        self.leader = False
+        self.joined = False
+        # created by start(): the ring needs NumPy, which single-process
+        # workers never load for it
+        self.quotes: Optional["QuoteRing"] = None
+        self._lock_fd: Optional[int] = None
+        self._handler: Optional[Handler] = None
+        self._listener: Optional[Listener] = None
+        self._conns: "queue.LifoQueue[Connection]" = queue.LifoQueue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.forwarded = 0
+        self.served = 0
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.multiprocess
+
+    def _path(self, name: str) -> str:
+        return os.path.join(settings.multiprocess_dir, name)
+
+    def is_follower(self) -> bool:
+        return self.joined and not self.leader
+
+    # ---- election ----
+
+    def start(self, handler: Handler):
+        """Join the election; handler serves followers' calls once leader."""
+        if not self.enabled() or self.joined:
+            return
+        try:
+            import fcntl  # noqa: F401
+        except ImportError:
+            logger.warning("MULTIPROCESS needs a POSIX host; running standalone")
+            return
+        from .quote_ring import QuoteRing
+
+        if self.quotes is None:
+            self.quotes = QuoteRing(
+                settings.shared_quotes_name,
+                settings.shared_quote_slots,
+                settings.shared_quote_bars,
+            )
+        self._handler = handler
+        os.makedirs(settings.multiprocess_dir, exist_ok=True)
+        self.joined = True
+        if not self._try_lead():
+            self.quotes.open(create=False)
+        self._thread = threading.Thread(
+            target=self._loop, name="cluster-election", daemon=True
+        )
+        self._thread.start()
+
+    def _try_lead(self) -> bool:
+        import fcntl
+
+        fd = os.open(self._path(LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # released by the OS if this process dies, which is what lets a
+        # follower take over
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._lock_fd = fd
+        self.quotes.open(create=True)
+        self._serve()
+        self.leader = True
+        logger.info(f"Elected SmartAPI leader (pid {os.getpid()})")
+        return True
+
+    def _loop(self):
+        while not self._stop.wait(RETRY_SECONDS):
+            if self.leader:
+                return
+            try:
+                if self._try_lead():
+                    self._drop_conns()
+                    return
+            except Exception as e:
+                logger.warning(f"Leader election attempt failed: {e}")
+            # the leader may have created the segment after we started
+            self.quotes.open(create=False)
+
+    # ---- leader: serve followers ----
+
+    def _serve(self):
+        path = self._path(SOCKET_FILE)
+        key = secrets.token_bytes(32)
+        # we hold the lock, so any socket/key left behind is stale
+        if os.path.exists(path):
+            os.unlink(path)
+        tmp = self._path(KEY_FILE + ".tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        os.replace(tmp, self._path(KEY_FILE))
+        self._listener = Listener(path, family="AF_UNIX", authkey=key)
+        threading.Thread(
+            target=self._accept, name="cluster-accept", daemon=True
+        ).start()
+
+    def _accept(self):
+        assert self._listener is not None
+        while not self._stop.is_set():
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                logger.warning(f"Cluster accept failed: {e}")
+                continue
+            threading.Thread(
+                target=self._handle, args=(conn,), name="cluster-conn", daemon=True
+            ).start()
+
+    def _handle(self, conn: Connection):
+        assert self._handler is not None
+        with conn:
+            while True:
+                try:
+                    args, cls, left = conn.recv()
+                except (EOFError, OSError):
+                    return
+                # the follower's priority class and remaining budget apply here
+                limit = deadline.within(left) if left is not None else nullcontext()
+                try:
+                    with scheduler.priority(cls), limit:
+                        reply = ("ok", self._handler(*args))
+                except Exception as e:
+                    reply = ("err", type(e).__name__, str(e))
+                self.served += 1
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+    # ---- follower: forward calls ----
+
+    def _connect(self) -> Connection:
+        try:
+            return self._conns.get_nowait()
+        except queue.Empty:
+            pass
+        with open(self._path(KEY_FILE), "rb") as f:
+            key = f.read()
+        return Client(self._path(SOCKET_FILE), family="AF_UNIX", authkey=key)
+
+    def _drop_conns(self):
+        while True:
+            try:
+                self._conns.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def forward(self, *args) -> Dict[str, Any]:
+        """Run the leader's candle handler with these arguments."""
+        left = deadline.remaining()
+        try:
+            conn = self._connect()
+        except OSError as e:
+            raise RuntimeError(f"SmartAPI leader unavailable: {e}")
+        try:
+            conn.send((args, scheduler.current(), left))
+            timeout = CALL_TIMEOUT_SECONDS if left is None else left + 1.0
+            if not conn.poll(timeout):
+                # the answer may still arrive on this connection; don't reuse it
+                conn.close()
+                raise deadline.DeadlineExceeded("SmartAPI leader did not answer")
+            reply = conn.recv()
+        except (EOFError, OSError) as e:
+            conn.close()
+            raise RuntimeError(f"SmartAPI leader connection lost: {e}")
+        self._conns.put(conn)
+        self.forwarded += 1
+        if reply[0] == "ok":
+            return reply[1]
+        raise _ERRORS.get(reply[1], RuntimeError)(reply[2])
+
+    # ---- shared quotes ----
+
+    def latest_quotes(self, token: str) -> Tuple[List[list], float]:
+        """QuoteRing.latest, or nothing when the ring is not in use."""
+        if self.quotes is None:
+            return [], 0.0
+        return self.quotes.latest(token)
+
+    def publish(self, token: str, interval: str, data: Dict[str, Any]):
+        # minute bars are what /api/prices/live needs
+        if self.leader and interval == "ONE_MINUTE" and data.get("data"):
+            self.quotes.publish(token, data["data"])
+
+    def stop(self):
+        self._stop.set()
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except Exception:
+                pass
+        self._drop_conns()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.leader = False
+        self.joined = False
+        if self.quotes is not None:
+            self.quotes.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled(),
+            "joined": self.joined,
+            "leader": self.leader,
+            "pid": os.getpid(),
+            "forwarded": self.forwarded,
+            "served": self.served,
+            "quotes": self.quotes.stats() if self.quotes is not None else None,
+        }
+
+
+cluster = Cluster()
@@ -17,6 +17,15 @@ def _bool(env_name: str, default: bool) -> bool:
 class Settings:
     mongodb_url: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017/")
     database_name: str = os.getenv("DATABASE_NAME", "stock_simulator")
+    # Connection pool (shared by the sync and async clients, per process)
+    mongo_max_pool_size: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    mongo_min_pool_size: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    mongo_wait_queue_timeout_ms: int = int(
+        os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")
+    )
+    # Empty = server default
+    mongo_read_concern: str = os.getenv("MONGO_READ_CONCERN", "").strip()
+    mongo_write_concern: str = os.getenv("MONGO_WRITE_CONCERN", "").strip()
 
     angel_market_api_key: str = os.getenv("ANGEL_MARKET_API_KEY", "")
     angel_hist_api_key: str = os.getenv("ANGEL_HIST_API_KEY", "")
@@ -24,14 +33,117 @@ class Settings:
     angel_pin: str = os.getenv("ANGEL_PIN", "")
     angel_totp_secret: str = os.getenv("ANGEL_TOTP_SECRET", "")
 
+    # Run Mongo index creation / SmartAPI login after startup (see /api/ready)
+    startup_background: bool = _bool("STARTUP_BACKGROUND", True)
+
     stocks_csv: str = os.getenv("STOCKS_CSV", "data/stocks.csv")
+    # Poll the CSV for changes and hot-reload (0 = off; use the admin endpoint)
+    instruments_watch_seconds: float = float(
+        os.getenv("INSTRUMENTS_WATCH_SECONDS", "0")
+    )
+    # Keep fetched bars for complete days/months in Mongo and serve them from
+    # there (opt-in: stored periods are served instead of SmartAPI)
+    candle_store: bool = _bool("CANDLE_STORE", False)
+    # Columnar (Arrow IPC) candle archive written by scripts.export_archive;
+    # empty = off. /api/candles serves fully covered ranges from it.
+    candle_archive_dir: str = os.getenv("CANDLE_ARCHIVE_DIR", "").strip()
+    # JSON with extra {holidays, special_sessions} merged over the built-in
+    # NSE calendar (app/trading_calendar.py)
+    trading_calendar_file: str = os.getenv("TRADING_CALENDAR_FILE", "").strip()
+    # Per-session SmartAPI circuit breaker: FAILURES consecutive errors (or
+    # calls slower than SLOW_CALL_MS) open it for RESET_SECONDS
+    smartapi_breaker_failures: int = int(os.getenv("SMARTAPI_BREAKER_FAILURES", "5"))
+    smartapi_breaker_reset_seconds: float = float(
+        os.getenv("SMARTAPI_BREAKER_RESET_SECONDS", "30")
+    )
+    smartapi_slow_call_ms: int = int(os.getenv("SMARTAPI_SLOW_CALL_MS", "8000"))
+    # SmartAPI call slots go fill > live > interactive > prefetch; a queued call
+    # gains one class per AGING_SECONDS waited (fills are never overtaken)
+    smartapi_aging_seconds: float = float(os.getenv("SMARTAPI_AGING_SECONDS", "2"))
+    # Chart requests that have served bars before get them back (stale: true)
+    # when the circuit is open or a fresh fetch takes longer than DEADLINE_MS,
+    # and are refreshed in the background; 0 deadline = always wait
+    candle_deadline_ms: int = int(os.getenv("CANDLE_DEADLINE_MS", "3000"))
+    candle_stale_seconds: float = float(os.getenv("CANDLE_STALE_SECONDS", "21600"))
+    # POST /api/prices/live answers within DEADLINE_MS (tokens not done yet
+    # come back as pending), fetching up to WORKERS tokens at once
+    live_prices_deadline_ms: int = int(os.getenv("LIVE_PRICES_DEADLINE_MS", "2500"))
+    live_prices_workers: int = int(os.getenv("LIVE_PRICES_WORKERS", "8"))
+    # Budget for one token's shared fetch (retries, fallback tiers), separate
+    # from the per-poll wait above so slow tokens can still finish
+    live_prices_fetch_ms: int = int(os.getenv("LIVE_PRICES_FETCH_MS", "10000"))
+    # uvicorn --workers N: one worker (elected by a lock in MULTIPROCESS_DIR)
+    # owns the SmartAPI sessions and throttle, the others forward candle calls
+    # to it; it publishes the last SHARED_QUOTE_BARS minute bars of up to
+    # SHARED_QUOTE_SLOTS tokens to shared memory for /api/prices/live
+    multiprocess: bool = _bool("MULTIPROCESS", False)
+    multiprocess_dir: str = os.getenv("MULTIPROCESS_DIR", "data/run")
+    shared_quotes_name: str = os.getenv("SHARED_QUOTES_NAME", "stocksim_quotes")
+    shared_quote_slots: int = int(os.getenv("SHARED_QUOTE_SLOTS", "1024"))
+    shared_quote_bars: int = int(os.getenv("SHARED_QUOTE_BARS", "120"))
+    shared_quote_fresh_seconds: float = float(
+        os.getenv("SHARED_QUOTE_FRESH_SECONDS", "5")
+    )
+    # Concurrent fetches of one series wait this long to be merged into a
+    # single upstream plan (0 = merge only requests queued behind a fetch)
+    candle_merge_ms: int = int(os.getenv("CANDLE_MERGE_MS", "10"))
+    # A caller queued behind an in-flight fetch of its series waits at most
+    # this long (or until its deadline) before fetching its window itself
+    candle_follower_wait_ms: int = int(os.getenv("CANDLE_FOLLOWER_WAIT_MS", "15000"))
+    # POST /api/candles/batch: entries per request and concurrent fetches
+    candle_batch_max_items: int = int(os.getenv("CANDLE_BATCH_MAX_ITEMS", "100"))
+    candle_batch_workers: int = int(os.getenv("CANDLE_BATCH_WORKERS", "8"))
+    # Computed /api/indicators series kept per chart and advanced bar by bar
+    indicator_cache_seconds: float = float(os.getenv("INDICATOR_CACHE_SECONDS", "900"))
+    indicator_cache_max_items: int = int(os.getenv("INDICATOR_CACHE_MAX_ITEMS", "2000"))
     live_poll_ms: int = int(os.getenv("LIVE_POLL_MS", "3000"))
 
+    # Trade ledger layout: documents (one per trade) | buckets (per user per day)
+    trades_storage: str = os.getenv("TRADES_STORAGE", "documents").strip().lower()
+    # buckets layout: trades per bucket before a user-day rolls over to the next
+    trade_bucket_size: int = int(os.getenv("TRADE_BUCKET_SIZE", "1000"))
+
+    # Per-process portfolio cache (0 = off); other workers' writes are picked
+    # up via change stream, or by polling updated_at every POLL_MS
+    portfolio_cache_seconds: float = float(os.getenv("PORTFOLIO_CACHE_SECONDS", "300"))
+    portfolio_cache_max_items: int = int(
+        os.getenv("PORTFOLIO_CACHE_MAX_ITEMS", "10000")
+    )
+    portfolio_cache_poll_ms: int = int(os.getenv("PORTFOLIO_CACHE_POLL_MS", "1000"))
+
+    # Leaderboard: every worker follows other workers' portfolio writes by
+    # polling updated_at this often
+    leaderboard_sync_ms: int = int(os.getenv("LEADERBOARD_SYNC_MS", "2000"))
+
+    # Write-behind trade ledger: journal locally, insert_many in batches
+    ledger_write_behind: bool = _bool("LEDGER_WRITE_BEHIND", False)
+    ledger_batch_size: int = int(os.getenv("LEDGER_BATCH_SIZE", "500"))
+    ledger_flush_ms: int = int(os.getenv("LEDGER_FLUSH_MS", "200"))
+    ledger_journal_dir: str = os.getenv("LEDGER_JOURNAL_DIR", "data/ledger")
+    ledger_fsync: bool = _bool("LEDGER_FSYNC", True)
+    # Running flushers also replay segments left by workers that died since
+    # start, checking this often (0 = only at start)
+    ledger_orphan_scan_seconds: float = float(
+        os.getenv("LEDGER_ORPHAN_SCAN_SECONDS", "60")
+    )
+
+    # Password hashing (PBKDF2 in a bounded process pool; 0 workers = inline)
+    password_iterations: int = int(os.getenv("PASSWORD_ITERATIONS", "200000"))
+    hash_workers: int = int(os.getenv("HASH_WORKERS", "2"))
+    hash_max_pending: int = int(os.getenv("HASH_MAX_PENDING", "16"))
+
     # Auth / Cookies / CORS / CSRF
     session_cookie_name: str = os.getenv("SESSION_COOKIE_NAME", "app_session")
     csrf_cookie_name: str = os.getenv("CSRF_COOKIE_NAME", "app_csrf")
     session_ttl_seconds: int = int(os.getenv("SESSION_TTL_SECONDS", "604800"))
     session_sliding: bool = _bool("SESSION_SLIDING", True)
+    # In-process session/user cache; sliding touches are only written once this
+    # fraction of the TTL has elapsed since the last one
+    session_cache_seconds: float = float(os.getenv("SESSION_CACHE_SECONDS", "30"))
+    session_touch_fraction: float = float(os.getenv("SESSION_TOUCH_FRACTION", "0.1"))
+    # Logouts on another worker evict this worker's cached session within this
+    # (a change stream is followed instead when Mongo is a replica set)
+    session_revoke_poll_ms: int = int(os.getenv("SESSION_REVOKE_POLL_MS", "1000"))
 
     cookie_secure: bool = _bool("COOKIE_SECURE", False)
     cookie_samesite: str = (
@@ -41,6 +153,11 @@ class Settings:
 
     cors_origins: str = os.getenv("CORS_ORIGINS", "").strip()  # comma-separated
     csrf_enabled: bool = _bool("CSRF_ENABLED", True)
+    admin_usernames: str = os.getenv("ADMIN_USERNAMES", "").strip()  # comma-separated
+
+    # Risk analytics
+    risk_free_rate: float = float(os.getenv("RISK_FREE_RATE", "0.065"))
+    risk_lookback_days: int = int(os.getenv("RISK_LOOKBACK_DAYS", "365"))
 
 
 settings = Settings()
@@ -1,31 +1,168 @@
 from __future__ import annotations
 
-from typing import Optional
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
-from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient, monitoring
 from pymongo.database import Database
+from pymongo.errors import OperationFailure
 
 from .config import settings
 from .logger import logger
 
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
 _CLIENT: Optional[MongoClient] = None
+# startup tasks, watcher threads and request threads may all connect first
+_CONNECT_LOCK = threading.Lock()
+_ASYNC_CLIENT: Optional["AsyncIOMotorClient"] = None
 
 USERS = "users"
 SESSIONS = "sessions"
 PORTFOLIOS = "portfolios"
 TRADES = "trades"
+TRADE_BUCKETS = "trade_buckets"
+PORTFOLIO_SNAPSHOTS = "portfolio_snapshots"
+# Admin portfolio rebuild jobs (see app.rebuild.start_job)
+REBUILD_JOBS = "rebuild_jobs"
+# SmartAPI bars by token/interval/period (see app.candle_store)
+CANDLES = "candles"
+
+INDEX_NOT_FOUND = 27
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection checkout latency and pool saturation for one client.
+
+    Fed by driver CMAP events; counters only, so the listener adds no I/O to
+    the checkout path.
+    """
+
+    def __init__(self, name: str, max_pool_size: int, samples: int = 1024):
+        self.name = name
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self._waits: deque = deque(maxlen=samples)
+        self.started = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.opened = 0
+        self.closed = 0
+        self.max_wait_ms = 0.0
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.started += 1
+
+    def connection_checked_out(self, event):
+        ms = (event.duration or 0.0) * 1000
+        with self._lock:
+            self.checked_out += 1
+            self._waits.append(ms)
+            self.max_wait_ms = max(self.max_wait_ms, ms)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.failed += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.timeouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_in += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.opened += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            in_use = self.checked_out - self.checked_in
+            waiting = self.started - self.checked_out - self.failed
+            out: Dict[str, Any] = {
+                "max_pool_size": self.max_pool_size,
+                "open": self.opened - self.closed,
+                "in_use": in_use,
+                "waiting": max(0, waiting),
+                "saturation": (
+                    round(in_use / self.max_pool_size, 3)
+                    if self.max_pool_size
+                    else None
+                ),
+                "checkouts": self.checked_out,
+                "checkout_failures": self.failed,
+                "wait_queue_timeouts": self.timeouts,
+                "checkout_ms_max": round(self.max_wait_ms, 3),
+            }
+        if waits:
+            out["checkout_ms_p50"] = round(waits[len(waits) // 2], 3)
+            out["checkout_ms_p99"] = round(waits[int(len(waits) * 0.99)], 3)
+        return out
+
+
+pool_metrics: Dict[str, PoolMetrics] = {
+    "sync": PoolMetrics("sync", settings.mongo_max_pool_size),
+    "async": PoolMetrics("async", settings.mongo_max_pool_size),
+}
+
+
+def _client_options(kind: str) -> Dict[str, Any]:
+    opts: Dict[str, Any] = {
+        "serverSelectionTimeoutMS": 5000,
+        "tz_aware": True,
+        "maxPoolSize": settings.mongo_max_pool_size,
+        "minPoolSize": settings.mongo_min_pool_size,
+        "waitQueueTimeoutMS": settings.mongo_wait_queue_timeout_ms,
+        "event_listeners": [pool_metrics[kind]],
+    }
+    if settings.mongo_read_concern:
+        opts["readConcernLevel"] = settings.mongo_read_concern
+    w = settings.mongo_write_concern
+    if w:
+        opts["w"] = int(w) if w.isdigit() else w
+    return opts
 
 
 def connect_mongo() -> Database:
     global _CLIENT
     if _CLIENT is None:
-        logger.info(
-            f"Connecting MongoDB at {settings.mongodb_url} db={settings.database_name}"
-        )
-        _CLIENT = MongoClient(
-            settings.mongodb_url, serverSelectionTimeoutMS=5000, tz_aware=True
-        )
-        _CLIENT.admin.command("ping")
+        with _CONNECT_LOCK:
+            if _CLIENT is None:
+                logger.info(
+                    f"Connecting MongoDB at {settings.mongodb_url} "
+                    f"db={settings.database_name}"
+                )
+                client = MongoClient(settings.mongodb_url, **_client_options("sync"))
+                try:
+                    client.admin.command("ping")
+                except Exception:
+                    client.close()
+                    raise
+                _CLIENT = client
     return _CLIENT[settings.database_name]
 
 
@@ -35,6 +172,37 @@ def get_db() -> Database:
     return _CLIENT[settings.database_name]
 
 
+def get_async_db() -> "AsyncIOMotorDatabase":
+    """Database handle for async repositories (app.repositories.aio).
+
+    The motor client multiplexes requests over its own pool without a thread
+    per in-flight query; it is created lazily on the serving event loop.
+    """
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        _ASYNC_CLIENT = AsyncIOMotorClient(
+            settings.mongodb_url, **_client_options("async")
+        )
+    return _ASYNC_CLIENT[settings.database_name]
+
+
+def close_mongo() -> None:
+    global _CLIENT, _ASYNC_CLIENT
+    if _ASYNC_CLIENT is not None:
+        _ASYNC_CLIENT.close()
+        _ASYNC_CLIENT = None
+    with _CONNECT_LOCK:
+        if _CLIENT is not None:
+            _CLIENT.close()
+            _CLIENT = None
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: m.snapshot() for name, m in pool_metrics.items()}
+
+
 def ensure_indexes() -> None:
     db = get_db()
     # users
@@ -48,6 +216,12 @@ def ensure_indexes() -> None:
     db[SESSIONS].create_index(
         [("expires_at", ASCENDING)], name="ttl_expires_at", expireAfterSeconds=0
     )
+    # polled by the session cache watchers (only revoked sessions are indexed)
+    db[SESSIONS].create_index(
+        [("revoked_at", ASCENDING)],
+        name="ix_sessions_revoked",
+        partialFilterExpression={"revoked_at": {"$exists": True}},
+    )
     # portfolios
     db[PORTFOLIOS].create_index(
         [("user_id", ASCENDING)], name="uq_portfolio_user", unique=True
@@ -55,12 +229,41 @@ def ensure_indexes() -> None:
     db[PORTFOLIOS].create_index(
         [("updated_at", DESCENDING)], name="ix_portfolios_updated"
     )
-    # trades
-    db[TRADES].create_index(
-        [("user_id", ASCENDING), ("executed_at", DESCENDING)],
-        name="ix_trades_user_time",
+    # trades; keyset pagination over history: (executed_at, _id) tie-break.
+    # It replaces ix_trades_user_time, which is a prefix of it: built first so
+    # history queries always have one of the two. Skipped for the buckets
+    # layout, where these per-trade indexes would only cost writes.
+    if settings.trades_storage != "buckets":
+        db[TRADES].create_index(
+            [("user_id", ASCENDING), ("executed_at", DESCENDING), ("_id", DESCENDING)],
+            name="ix_trades_user_time_id",
+        )
+        try:
+            db[TRADES].drop_index("ix_trades_user_time")
+        except OperationFailure as e:
+            # already gone, e.g. dropped by another worker starting alongside
+            if e.code != INDEX_NOT_FOUND:
+                raise
+        db[TRADES].create_index(
+            [("token", ASCENDING), ("executed_at", DESCENDING)],
+            name="ix_trades_token_time",
+        )
+    # bucketed trades (TRADES_STORAGE=buckets): a few entries per user per day,
+    # plus the unique trade _id that keeps inserts idempotent across rollovers
+    db[TRADE_BUCKETS].create_index(
+        [("user_id", ASCENDING), ("day", DESCENDING)], name="ix_buckets_user_day"
+    )
+    db[TRADE_BUCKETS].create_index(
+        [("trades._id", ASCENDING)], name="uq_buckets_trade_id", unique=True
+    )
+    # portfolio snapshots (one per user per trading day)
+    db[PORTFOLIO_SNAPSHOTS].create_index(
+        [("user_id", ASCENDING), ("date", DESCENDING)],
+        name="uq_snapshot_user_date",
+        unique=True,
     )
-    db[TRADES].create_index(
-        [("token", ASCENDING), ("executed_at", DESCENDING)], name="ix_trades_token_time"
+    # rebuild job records expire after a week
+    db[REBUILD_JOBS].create_index(
+        [("created_at", ASCENDING)], name="ttl_rebuild_jobs", expireAfterSeconds=604800
     )
     logger.info("MongoDB indexes ensured")
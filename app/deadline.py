@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# Absolute time.monotonic() by which the current request wants an answer.
+# Carried in a context variable so the fetch path (retries, fallback tiers,
+# chunk loops) can give up early without every signature growing a parameter.
+# Worker threads do not inherit it; re-enter it there with deadline_at().
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(RuntimeError):
+    """The current request's deadline passed before the work could start."""
+
+
+@contextmanager
+def deadline_at(when: Optional[float]) -> Iterator[None]:
+    """Run the block under an absolute deadline (None = no limit)."""
+    token = _deadline.set(when)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def within(seconds: float):
+    """A deadline seconds from now, or the one already in force if sooner."""
+    when = time.monotonic() + seconds
+    cur = _deadline.get()
+    return deadline_at(when if cur is None else min(cur, when))
+
+
+def current() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    when = _deadline.get()
+    return None if when is None else max(0.0, when - time.monotonic())
+
+
+def expired() -> bool:
+    when = _deadline.get()
+    return when is not None and time.monotonic() >= when
@@ -1,40 +1,153 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 from fastapi import Depends, HTTPException, Request, status
+from pymongo.errors import OperationFailure
 
+from .cache import TTLCache
 from .config import settings
+from .db import SESSIONS, get_db
+from .logger import logger
 from .repositories import sessions as sessions_repo
 from .repositories import users as users_repo
+from .repositories.aio import sessions as aio_sessions
+from .repositories.aio import users as aio_users
 
+# Short-lived; logouts on other workers are also evicted by the revocation
+# watcher below, so they are honoured within SESSION_REVOKE_POLL_MS
+_session_cache = TTLCache(ttl_seconds=settings.session_cache_seconds, max_items=10000)
+_user_cache = TTLCache(ttl_seconds=settings.session_cache_seconds, max_items=10000)
 
-def current_session(request: Request):
+# Change streams need a replica set; standalone servers report this code
+NOT_REPLICA_SET = 40573
+# revoked_at comes from each worker's clock; re-read this much history per poll
+POLL_OVERLAP = timedelta(seconds=2)
+_revocations: Optional[threading.Thread] = None
+
+
+def invalidate_session(session_id: str) -> None:
+    _session_cache.delete(session_id)
+
+
+def start_revocation_watcher(poll_seconds: float):
+    """Evict sessions revoked by any worker (sessions_repo.revoke_session)."""
+    global _revocations
+    if _revocations is not None or settings.session_cache_seconds <= 0:
+        return
+    _revocations = threading.Thread(
+        target=_watch_revocations,
+        args=(poll_seconds,),
+        name="session-revocations",
+        daemon=True,
+    )
+    _revocations.start()
+
+
+def _watch_revocations(poll_seconds: float):
+    use_stream = True
+    while True:
+        try:
+            if use_stream:
+                _follow_revocations()
+            else:
+                _poll_revocations(poll_seconds)
+        except OperationFailure as e:
+            if e.code == NOT_REPLICA_SET and use_stream:
+                logger.info("Session cache: no change streams; polling revoked_at")
+                use_stream = False
+                continue
+            logger.warning(f"Session revocation watcher: {e}")
+        except Exception as e:
+            logger.warning(f"Session revocation watcher: {e}")
+        # revocations may have been missed while disconnected
+        _session_cache.clear()
+        time.sleep(max(1.0, poll_seconds))
+
+
+def _follow_revocations():
+    pipeline = [
+        {
+            "$match": {
+                "operationType": "update",
+                "updateDescription.updatedFields.revoked_at": {"$exists": True},
+            }
+        }
+    ]
+    with get_db()[SESSIONS].watch(pipeline, full_document="updateLookup") as stream:
+        _session_cache.clear()
+        for change in stream:
+            doc = change.get("fullDocument")
+            if doc:
+                invalidate_session(doc["session_id"])
+
+
+def _poll_revocations(poll_seconds: float):
+    coll = get_db()[SESSIONS]
+    since = datetime.now(timezone.utc) - POLL_OVERLAP
+    _session_cache.clear()
+    while True:
+        time.sleep(poll_seconds)
+        cur = coll.find(
+            {"revoked_at": {"$gt": since - POLL_OVERLAP}},
+            {"_id": 0, "session_id": 1, "revoked_at": 1},
+        )
+        for doc in cur:
+            invalidate_session(doc["session_id"])
+            ra = doc.get("revoked_at")
+            if isinstance(ra, datetime) and ra > since:
+                since = ra
+
+
+def invalidate_user(user_id) -> None:
+    _user_cache.delete(str(user_id))
+
+
+def _touch_due(sid: str, sess: dict, exp: datetime) -> bool:
+    ttl = settings.session_ttl_seconds
+    now = datetime.now(timezone.utc)
+    remaining = (exp - now).total_seconds()
+    if remaining > ttl * (1.0 - settings.session_touch_fraction):
+        return False
+    # Publish the new expiry before writing so concurrent requests skip the touch
+    _session_cache.set(sid, {**sess, "expires_at": now + timedelta(seconds=ttl)})
+    return True
+
+
+def _session_id(request: Request) -> str:
     sid = request.cookies.get(settings.session_cookie_name)
     if not sid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
-    sess = sessions_repo.get_session(sid)
+    return sid
+
+
+def _check_session(sid: str, sess) -> datetime:
     if not sess:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid session"
         )
+    if sess.get("revoked_at"):
+        invalidate_session(sid)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Session revoked"
+        )
     exp = sess.get("expires_at")
     if isinstance(exp, datetime) and exp.tzinfo is None:
         exp = exp.replace(tzinfo=timezone.utc)
     if not exp or exp <= datetime.now(timezone.utc):
+        invalidate_session(sid)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired"
         )
-    if settings.session_sliding:
-        sessions_repo.touch_session(sid, settings.session_ttl_seconds)
-    return sess
+    return exp
 
 
-def current_user(session=Depends(current_session)):
-    uid = session["user_id"]
-    user = users_repo.get_by_id(uid)
+def _check_user(user):
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
@@ -42,6 +155,56 @@ def current_user(session=Depends(current_session)):
     return user
 
 
+def current_session(request: Request):
+    sid = _session_id(request)
+    sess = _session_cache.get(sid)
+    if sess is None:
+        sess = sessions_repo.get_session(sid)
+        if sess:
+            _session_cache.set(sid, sess)
+    exp = _check_session(sid, sess)
+    if settings.session_sliding and _touch_due(sid, sess, exp):
+        sessions_repo.touch_session(sid, settings.session_ttl_seconds)
+    return sess
+
+
+def current_user(session=Depends(current_session)):
+    uid = session["user_id"]
+    user = _user_cache.get(str(uid))
+    if user is None:
+        user = users_repo.get_by_id(uid)
+        if user:
+            _user_cache.set(str(uid), user)
+    return _check_user(user)
+
+
+# Async variants for async routes: same caches, motor repositories, so a
+# cache miss does not occupy a threadpool worker
+
+
+async def current_session_async(request: Request):
+    sid = _session_id(request)
+    sess = _session_cache.get(sid)
+    if sess is None:
+        sess = await aio_sessions.get_session(sid)
+        if sess:
+            _session_cache.set(sid, sess)
+    exp = _check_session(sid, sess)
+    if settings.session_sliding and _touch_due(sid, sess, exp):
+        await aio_sessions.touch_session(sid, settings.session_ttl_seconds)
+    return sess
+
+
+async def current_user_async(session=Depends(current_session_async)):
+    uid = session["user_id"]
+    user = _user_cache.get(str(uid))
+    if user is None:
+        user = await aio_users.get_by_id(uid)
+        if user:
+            _user_cache.set(str(uid), user)
+    return _check_user(user)
+
+
 def require_csrf(request: Request, session=Depends(current_session)):
     if not settings.csrf_enabled:
         return True
@@ -57,3 +220,10 @@ def require_csrf(request: Request, session=Depends(current_session)):
             status_code=status.HTTP_403_FORBIDDEN, detail="CSRF validation failed"
         )
     return True
+
+
+def require_admin(user=Depends(current_user)):
+    admins = {u.strip() for u in settings.admin_usernames.split(",") if u.strip()}
+    if user["username"] not in admins:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return user
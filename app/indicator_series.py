@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import math
+import threading
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .cache import TTLCache
+from .config import settings
+from .indicators import parse_spec
+
+# Computed indicator series keyed by (token, interval, spec, first bar).
+# The first request computes every indicator with whole-array NumPy ops;
+# later requests for the same chart only feed the bars that changed (the
+# still-forming last bar and anything newer) through the O(1) per-bar state.
+_series_cache = TTLCache(
+    ttl_seconds=settings.indicator_cache_seconds,
+    max_items=settings.indicator_cache_max_items,
+)
+
+
+def _clean(x: float):
+    return None if x is None or math.isnan(x) else round(float(x), 4)
+
+
+def _bar(row: Dict[str, Any], session: str) -> Dict[str, Any]:
+    return {
+        "h": row["h"],
+        "l": row["l"],
+        "c": row["c"],
+        "v": row.get("v"),
+        "session": session,
+    }
+
+
+class IndicatorSeries:
+    """Indicator outputs aligned to one normalized candle series."""
+
+    def __init__(self, spec: str, series: List[Dict[str, Any]], intraday: bool):
+        self.studies = parse_spec(spec)
+        self.intraday = intraday
+        self.t: List[str] = [r["t"] for r in series]
+        self.out: Dict[str, Dict[str, List[Any]]] = {}
+        self._lock = threading.Lock()
+        self._last: Dict[str, Any] = series[-1] if series else {}
+        self._compute(series)
+
+    def _session(self, ts: str) -> str:
+        # VWAP restarts each trading day intraday; daily charts anchor at start
+        return ts[:10] if self.intraday else ""
+
+    def _compute(self, series: List[Dict[str, Any]]):
+        n = len(series)
+        bars = {
+            k: np.array([r.get(k) or 0.0 for r in series], dtype=np.float64)
+            for k in ("h", "l", "c", "v")
+        }
+        bars["session"] = np.array([self._session(ts) for ts in self.t])
+        for key, state in self.studies:
+            cols = state.compute(bars)
+            self.out[key] = {
+                name: [_clean(x) for x in col] for name, col in cols.items()
+            }
+            # state covers all but the last bar, which may still be forming
+            state.prime(bars, n - 1)
+            if n:
+                state.update(_bar(series[-1], self._session(self.t[-1])))
+
+    def _apply(self, row: Dict[str, Any], replace: bool):
+        bar = _bar(row, self._session(row["t"]))
+        for key, state in self.studies:
+            vals = state.update(bar, replace)
+            cols = self.out[key]
+            for name, x in vals.items():
+                if replace:
+                    cols[name][-1] = _clean(x)
+                else:
+                    cols[name].append(_clean(x))
+        if not replace:
+            self.t.append(row["t"])
+        self._last = row
+
+    def extend(self, series: List[Dict[str, Any]]) -> int:
+        """Catch up with a fresher fetch of the same series.
+
+        Returns the number of bars applied incrementally, or -1 when the new
+        series does not continue this one (caller recomputes from scratch).
+        """
+        with self._lock:
+            n = len(self.t)
+            if (
+                not n
+                or len(series) < n
+                or series[0]["t"] != self.t[0]
+                or series[n - 1]["t"] != self.t[-1]
+            ):
+                return -1
+            applied = 0
+            if series[n - 1] != self._last:
+                self._apply(series[n - 1], replace=True)
+                applied += 1
+            for row in series[n:]:
+                self._apply(row, replace=False)
+                applied += 1
+            return applied
+
+    def payload(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "t": list(self.t),
+                "indicators": {
+                    key: {name: list(col) for name, col in cols.items()}
+                    for key, cols in self.out.items()
+                },
+            }
+
+
+def canonical_spec(spec: str) -> str:
+    return ",".join(key for key, _ in parse_spec(spec))
+
+
+def get_series(
+    token: str,
+    interval: str,
+    spec: str,
+    series: List[Dict[str, Any]],
+    intraday: bool,
+) -> Tuple[IndicatorSeries, int]:
+    """Cached indicators for series, updated in place with any new bars.
+
+    Returns (indicators, bars_updated); bars_updated is -1 on a full compute.
+    """
+    key = (token, interval, canonical_spec(spec), series[0]["t"] if series else "")
+    hit = _series_cache.get(key) if series else None
+    if hit is not None:
+        applied = hit.extend(series)
+        if applied >= 0:
+            return hit, applied
+    fresh = IndicatorSeries(spec, series, intraday)
+    if series:
+        _series_cache.set(key, fresh)
+    return fresh, -1
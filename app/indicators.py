@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Exponential weights below this are dropped from the EMA kernel
+_EWM_EPS = 1e-12
+
+
+def _ewm(x: np.ndarray, alpha: float, seed: float) -> np.ndarray:
+    """y[t] = (1 - alpha) * y[t-1] + alpha * x[t], with y[-1] = seed.
+
+    Evaluated as a truncated convolution with the exponential kernel plus the
+    decayed seed, so there is no per-element Python loop.
+    """
+    n = len(x)
+    if n == 0:
+        return np.asarray(x, dtype=np.float64)
+    decay = 1.0 - alpha
+    if decay <= 0:
+        return np.asarray(x, dtype=np.float64).copy()
+    k = min(n, int(np.ceil(np.log(_EWM_EPS) / np.log(decay))) + 1)
+    kernel = alpha * decay ** np.arange(k)
+    y = np.convolve(x, kernel)[:n]
+    y += seed * decay ** np.arange(1, n + 1)
+    return y
+
+
+def sma(x: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if n <= 0 or len(x) < n:
+        return out
+    c = np.cumsum(np.insert(np.asarray(x, dtype=np.float64), 0, 0.0))
+    out[n - 1 :] = (c[n:] - c[:-n]) / n
+    return out
+
+
+def ema(x: np.ndarray, n: int) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) == 0:
+        return x
+    return _ewm(x, 2.0 / (n + 1), x[0])
+
+
+def rsi(x: np.ndarray, n: int = 14) -> np.ndarray:
+    """Wilder's RSI: smoothed averages seeded with the mean of the first n moves."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    if len(x) <= n:
+        return out
+    avg_gain, avg_loss = _wilder_avgs(x, n)
+    out[n:] = _rsi_from(avg_gain, avg_loss)
+    return out
+
+
+def rolling_max(x: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if n <= 0 or len(x) < n:
+        return out
+    out[n - 1 :] = sliding_window_view(np.asarray(x, dtype=np.float64), n).max(axis=1)
+    return out
+
+
+def rolling_min(x: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if n <= 0 or len(x) < n:
+        return out
+    out[n - 1 :] = sliding_window_view(np.asarray(x, dtype=np.float64), n).min(axis=1)
+    return out
+
+
+def _wilder_avgs(x: np.ndarray, n: int):
+    """Wilder-smoothed average gain/loss; index i covers moves up to x[i + n]."""
+    diff = np.diff(x)
+    gain = np.clip(diff, 0, None)
+    loss = np.clip(-diff, 0, None)
+    alpha = 1.0 / n
+    avg_gain = np.empty(len(diff) - n + 1)
+    avg_loss = np.empty(len(diff) - n + 1)
+    avg_gain[0], avg_loss[0] = gain[:n].mean(), loss[:n].mean()
+    avg_gain[1:] = _ewm(gain[n:], alpha, avg_gain[0])
+    avg_loss[1:] = _ewm(loss[n:], alpha, avg_loss[0])
+    return avg_gain, avg_loss
+
+
+def _rsi_from(avg_gain, avg_loss):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vals = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return np.where(avg_loss == 0, 100.0, vals)
+
+
+def macd(x: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9):
+    x = np.asarray(x, dtype=np.float64)
+    line = ema(x, fast) - ema(x, slow)
+    sig = ema(line, signal)
+    return line, sig, line - sig
+
+
+def rolling_std(x: np.ndarray, n: int) -> np.ndarray:
+    """Population standard deviation over the trailing n values."""
+    out = np.full(len(x), np.nan)
+    if n <= 0 or len(x) < n:
+        return out
+    out[n - 1 :] = sliding_window_view(np.asarray(x, dtype=np.float64), n).std(axis=1)
+    return out
+
+
+def bollinger(x: np.ndarray, n: int = 20, k: float = 2.0):
+    mid = sma(x, n)
+    dev = rolling_std(x, n) * k
+    return mid - dev, mid, mid + dev
+
+
+def vwap(
+    h: np.ndarray, l: np.ndarray, c: np.ndarray, v: np.ndarray, sessions: np.ndarray
+) -> np.ndarray:
+    """Cumulative VWAP that restarts whenever the session key changes."""
+    tp = (np.asarray(h) + np.asarray(l) + np.asarray(c)) / 3.0
+    v = np.nan_to_num(np.asarray(v, dtype=np.float64))
+    pv = np.cumsum(tp * v)
+    vv = np.cumsum(v)
+    n = len(tp)
+    if n == 0:
+        return tp
+    starts = np.flatnonzero(np.r_[True, sessions[1:] != sessions[:-1]])
+    first = np.zeros(n, dtype=np.int64)
+    first[starts] = starts
+    np.maximum.accumulate(first, out=first)
+    base_pv = np.where(first > 0, pv[first - 1], 0.0)
+    base_v = np.where(first > 0, vv[first - 1], 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (pv - base_pv) / (vv - base_v)
+
+
+# ---- incremental state (one bar at a time, O(1) per bar) ----
+#
+# Each state is primed from the vectorized results for all bars but the
+# last, then fed the last bar through update(). update(..., replace=True)
+# swaps out the most recent bar (a live bar that is still forming) using
+# the undo record kept from the previous update.
+
+
+class _Window:
+    """Fixed-size ring with running sum and sum of squares."""
+
+    def __init__(self, n: int):
+        self.n = max(1, n)
+        self.buf = [0.0] * self.n
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+
+    def push(self, x: float):
+        i = self.count % self.n
+        undo = (i, self.buf[i], self.sum, self.sumsq)
+        if self.count >= self.n:
+            old = self.buf[i]
+            self.sum -= old
+            self.sumsq -= old * old
+        self.buf[i] = x
+        self.sum += x
+        self.sumsq += x * x
+        self.count += 1
+        return undo
+
+    def pop(self, undo):
+        i, old, self.sum, self.sumsq = undo
+        self.buf[i] = old
+        self.count -= 1
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.n
+
+    def mean(self) -> float:
+        return self.sum / self.n
+
+    def std(self) -> float:
+        m = self.mean()
+        return max(self.sumsq / self.n - m * m, 0.0) ** 0.5
+
+
+class _Ema:
+    def __init__(self, n: int):
+        self.alpha = 2.0 / (n + 1)
+        self.value = None
+        self._undo = None
+
+    def update(self, x: float, replace: bool = False) -> float:
+        if replace:
+            self.value = self._undo
+        self._undo = self.value
+        base = self.value
+        self.value = x if base is None else base + self.alpha * (x - base)
+        return self.value
+
+
+def _nan(x) -> float:
+    return float("nan") if x is None else x
+
+
+class SmaState:
+    def __init__(self, n: int):
+        self.n = n
+        self.win = _Window(n)
+        self._undo = None
+
+    def compute(self, bars) -> Dict[str, np.ndarray]:
+        return {"value": sma(bars["c"], self.n)}
+
+    def prime(self, bars, upto: int):
+        for x in bars["c"][max(0, upto - self.n) : upto]:
+            self.win.push(float(x))
+
+    def update(self, bar, replace: bool = False) -> Dict[str, float]:
+        if replace and self._undo is not None:
+            self.win.pop(self._undo)
+        self._undo = self.win.push(bar["c"])
+        return {"value": self.win.mean() if self.win.full else float("nan")}
+
+
+class EmaState:
+    def __init__(self, n: int):
+        self.n = n
+        self.ema = _Ema(n)
+
+    def compute(self, bars) -> Dict[str, np.ndarray]:
+        return {"value": ema(bars["c"], self.n)}
+
+    def prime(self, bars, upto: int):
+        if upto > 0:
+            self.ema.value = float(ema(bars["c"][:upto], self.n)[-1])
+
+    def update(self, bar, replace: bool = False) -> Dict[str, float]:
+        return {"value": self.ema.update(bar["c"], replace)}
+
+
+class RsiState:
+    def __init__(self, n: int = 14):
+        self.n = n
+        self.prev = None  # previous close
+        self.avg_gain = None
+        self.avg_loss = None
+        # first n moves are averaged before Wilder smoothing starts
+        self.seed = _Window(n)
+        self._undo = None
+
+    def compute(self, bars) -> Dict[str, np.ndarray]:
+        return {"value": rsi(bars["c"], self.n)}
+
+    def prime(self, bars, upto: int):
+        c = np.asarray(bars["c"][:upto], dtype=np.float64)
+        if len(c) > self.n:
+            g, lo = _wilder_avgs(c, self.n)
+            self.avg_gain, self.avg_loss = float(g[-1]), float(lo[-1])
+            self.prev = float(c[-1])
+            return
+        for x in c:
+            self.update({"c": float(x)})
+
+    def update(self, bar, replace: bool = False) -> Dict[str, float]:
+        if replace and self._undo is not None:
+            self.prev, self.avg_gain, self.avg_loss, seed_undo = self._undo
+            if seed_undo is not None:
+                self.seed.pop(seed_undo)
+        x = bar["c"]
+        seed_undo = None
+        self._undo = (self.prev, self.avg_gain, self.avg_loss, None)
+        if self.prev is not None:
+            d = x - self.prev
+            if self.avg_gain is None:
+                # seed window holds moves; +gain / -loss kept as signed values
+                seed_undo = self.seed.push(d)
+                self._undo = (self.prev, None, None, seed_undo)
+                if self.seed.full:
+                    moves = self.seed.buf
+                    self.avg_gain = sum(m for m in moves if m > 0) / self.n
+                    self.avg_loss = sum(-m for m in moves if m < 0) / self.n
+            else:
+                a = 1.0 / self.n
+                self.avg_gain += a * (max(d, 0.0) - self.avg_gain)
+                self.avg_loss += a * (max(-d, 0.0) - self.avg_loss)
+        self.prev = x
+        if self.avg_gain is None:
+            return {"value": float("nan")}
+        if self.avg_loss == 0:
+            return {"value": 100.0}
+        return {"value": 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)}
+
+
+class MacdState:
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast, self.slow, self.signal = fast, slow, signal
+        self.ef, self.es, self.sig = _Ema(fast), _Ema(slow), _Ema(signal)
+
+    def compute(self, bars) -> Dict[str, np.ndarray]:
+        line, sig, hist = macd(bars["c"], self.fast, self.slow, self.signal)
+        return {"macd": line, "signal": sig, "hist": hist}
+
+    def prime(self, bars, upto: int):
+        if upto > 0:
+            c = bars["c"][:upto]
+            line, sig, _ = macd(c, self.fast, self.slow, self.signal)
+            self.ef.value = float(ema(c, self.fast)[-1])
+            self.es.value = float(ema(c, self.slow)[-1])
+            self.sig.value = float(sig[-1])
+
+    def update(self, bar, replace: bool = False) -> Dict[str, float]:
+        line = self.ef.update(bar["c"], replace) - self.es.update(bar["c"], replace)
+        sig = self.sig.update(line, replace)
+        return {"macd": line, "signal": sig, "hist": line - sig}
+
+
+class BollingerState:
+    def __init__(self, n: int = 20, k: float = 2.0):
+        self.n, self.k = n, k
+        self.win = _Window(n)
+        self._undo = None
+
+    def compute(self, bars) -> Dict[str, np.ndarray]:
+        lower, mid, upper = bollinger(bars["c"], self.n, self.k)
+        return {"lower": lower, "mid": mid, "upper": upper}
+
+    def prime(self, bars, upto: int):
+        for x in bars["c"][max(0, upto - self.n) : upto]:
+            self.win.push(float(x))
+
+    def update(self, bar, replace: bool = False) -> Dict[str, float]:
+        if replace and self._undo is not None:
+            self.win.pop(self._undo)
+        self._undo = self.win.push(bar["c"])
+        if not self.win.full:
+            nan = float("nan")
+            return {"lower": nan, "mid": nan, "upper": nan}
+        mid, dev = self.win.mean(), self.win.std() * self.k
+        return {"lower": mid - dev, "mid": mid, "upper": mid + dev}
+
+
+class VwapState:
+    def __init__(self):
+        self.session = None
+        self.pv = 0.0
+        self.v = 0.0
+        self._undo = None
+
+    def compute(self, bars) -> Dict[str, np.ndarray]:
+        return {
+            "value": vwap(bars["h"], bars["l"], bars["c"], bars["v"], bars["session"])
+        }
+
+    def prime(self, bars, upto: int):
+        if upto <= 0:
+            return
+        s = bars["session"]
+        last = s[upto - 1]
+        i = upto - 1
+        while i > 0 and s[i - 1] == last:
+            i -= 1
+        for j in range(i, upto):
+            self.update({k: bars[k][j] for k in ("h", "l", "c", "v", "session")})
+
+    def update(self, bar, replace: bool = False) -> Dict[str, float]:
+        if replace and self._undo is not None:
+            self.session, self.pv, self.v = self._undo
+        self._undo = (self.session, self.pv, self.v)
+        if bar["session"] != self.session:
+            self.session, self.pv, self.v = bar["session"], 0.0, 0.0
+        vol = 0.0 if bar["v"] is None or bar["v"] != bar["v"] else float(bar["v"])
+        self.pv += (bar["h"] + bar["l"] + bar["c"]) / 3.0 * vol
+        self.v += vol
+        return {"value": self.pv / self.v if self.v else float("nan")}
+
+
+INDICATORS = {
+    "sma": (SmaState, (20,)),
+    "ema": (EmaState, (20,)),
+    "rsi": (RsiState, (14,)),
+    "macd": (MacdState, (12, 26, 9)),
+    "bb": (BollingerState, (20, 2.0)),
+    "vwap": (VwapState, ()),
+}
+MAX_PERIOD = 500
+
+
+def parse_spec(spec: str) -> List[Tuple[str, Any]]:
+    """'sma:20,ema:50,macd,bb:20:2,vwap' -> [(key, state), ...]."""
+    out: List[Tuple[str, Any]] = []
+    for part in (p.strip().lower() for p in spec.split(",")):
+        if not part:
+            continue
+        name, *args = part.split(":")
+        if name not in INDICATORS:
+            raise ValueError(f"Unknown indicator: {name}")
+        cls, defaults = INDICATORS[name]
+        if len(args) > len(defaults):
+            raise ValueError(f"Too many parameters for {name}")
+        try:
+            params = [type(d)(a) for d, a in zip(defaults, args)]
+        except ValueError:
+            raise ValueError(f"Bad parameters for {name}")
+        params += list(defaults[len(params) :])
+        if any(p <= 0 or p > MAX_PERIOD for p in params):
+            raise ValueError(f"Parameters for {name} out of range")
+        key = ":".join([name] + [f"{p:g}" for p in params])
+        out.append((key, cls(*params)))
+    if not out:
+        raise ValueError("No indicators requested")
+    return out
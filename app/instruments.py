@@ -1,6 +1,17 @@
 import csv
+import heapq
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
 
 from .config import settings
 from .logger import logger
@@ -13,16 +24,324 @@ class Instrument:
     name: str
 
 
+# Bump when SearchIndex's layout changes so stale snapshots are rebuilt
+_CACHE_MAGIC = b"INSTIDX4"
+# Snapshot sections: string columns (NUL-joined UTF-8) and int32 arrays
+_STR_SECTIONS = ("symbols", "tokens", "names", "word_keys", "gram_keys")
+_INT_SECTIONS = ("name_ids", "word_offsets", "word_ids", "gram_offsets", "gram_ids")
+
+_WORD_RE = re.compile(r"[A-Z0-9&]+")
+
+# Relevance tiers, best first: exact symbol, symbol prefix, name prefix, name
+# word prefix, symbol substring, name substring, then typo-tolerant; ties
+# prefer shorter symbols, then A-Z
+# Typo matching edit-checks only the candidates sharing the most trigrams
+_FUZZY_SCAN = 100
+
+
+def _base_symbol(sym: str) -> str:
+    # "INFY-EQ" -> "INFY"
+    return sym.split("-", 1)[0]
+
+
+def _trigrams(s: str) -> Set[str]:
+    return {s[i : i + 3] for i in range(len(s) - 2)}
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up (limit + 1) once it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+def _prefix_range(keys: List[str], prefix: str, lo: int = 0, hi: int = -1) -> range:
+    hi = len(keys) if hi < 0 else hi
+    lo = bisect_left(keys, prefix, lo, hi)
+    return range(lo, bisect_left(keys, prefix + "\uffff", lo, hi))
+
+
+def _rank(ins: Instrument):
+    sym = ins.symbol.upper()
+    return (len(sym), sym)
+
+
+class SearchIndex:
+    """Ranked instrument search built once per load.
+
+    Instruments are numbered in rank order (shorter symbol, then A-Z), so
+    every id list below is already in result order: search walks the tiers
+    best first and stops at `limit` hits instead of scoring every match.
+    - symbols: sorted within each length, bisected per length for prefixes
+    - names: sorted array + bisect for whole-name prefixes
+    - name words: sorted array + bisect, each word -> instrument ids
+    - trigrams over symbol and name for substring and typo-tolerant matching
+    """
+
+    def __init__(self, items: Iterable[Instrument], _state: Optional[Dict] = None):
+        self.items: List[Instrument] = list(items)
+        if _state is None:
+            self.items.sort(key=_rank)
+        self._sym = [ins.symbol.upper() for ins in self.items]
+        self._base = [_base_symbol(s) for s in self._sym]
+        self._name = [ins.name.upper() for ins in self.items]
+        # symbol length -> (first id, end id); ids of one length are A-Z
+        self._len_spans: Dict[int, tuple] = {}
+        for i, s in enumerate(self._sym):
+            lo, _ = self._len_spans.get(len(s), (i, i))
+            self._len_spans[len(s)] = (lo, i + 1)
+        if _state is not None:
+            self._name_ids: List[int] = _state["name_ids"]
+            self._name_keys = [self._name[i] for i in self._name_ids]
+            self._word_keys: List[str] = _state["word_keys"]
+            self._word_ids = _unflatten(_state["word_offsets"], _state["word_ids"])
+            self._grams = dict(
+                zip(
+                    _state["gram_keys"],
+                    _unflatten(_state["gram_offsets"], _state["gram_ids"]),
+                )
+            )
+            return
+
+        self._name_ids = sorted(range(len(self.items)), key=lambda i: self._name[i])
+        self._name_keys = [self._name[i] for i in self._name_ids]
+
+        words: Dict[str, List[int]] = {}
+        grams: Dict[str, List[int]] = {}
+        for i in range(len(self.items)):
+            for w in set(_WORD_RE.findall(self._name[i])):
+                words.setdefault(w, []).append(i)
+            for g in _trigrams(self._sym[i]) | _trigrams(self._name[i]):
+                grams.setdefault(g, []).append(i)
+        self._word_keys = sorted(words)
+        self._word_ids = [words[w] for w in self._word_keys]
+        self._grams = grams
+
+    def to_state(self) -> Dict[str, Any]:
+        """String columns and int lists only (postings flattened with offsets),
+        so the snapshot is plain data rather than executable pickle."""
+        word_offsets, word_ids = _flatten(self._word_ids)
+        gram_keys = list(self._grams)
+        gram_offsets, gram_ids = _flatten(self._grams[g] for g in gram_keys)
+        return {
+            "symbols": [i.symbol for i in self.items],
+            "tokens": [i.token for i in self.items],
+            "names": [i.name for i in self.items],
+            "name_ids": self._name_ids,
+            "word_keys": self._word_keys,
+            "word_offsets": word_offsets,
+            "word_ids": word_ids,
+            "gram_keys": gram_keys,
+            "gram_offsets": gram_offsets,
+            "gram_ids": gram_ids,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "SearchIndex":
+        items = map(Instrument, state["symbols"], state["tokens"], state["names"])
+        return cls(items, _state=state)
+
+    def _symbol_prefix(self, q: str) -> Iterator[int]:
+        for n in sorted(self._len_spans):
+            if n >= len(q):
+                yield from _prefix_range(self._sym, q, *self._len_spans[n])
+
+    def _exact(self, q: str) -> Iterator[int]:
+        # "INFY" is exact for INFY and for INFY-EQ, INFY-BE, ...
+        lo, hi = self._len_spans.get(len(q), (0, 0))
+        same = [i for i in _prefix_range(self._sym, q, lo, hi) if self._sym[i] == q]
+        return heapq.merge(same, self._symbol_prefix(q + "-"))
+
+    def _name_prefix(self, q: str, limit: int) -> Iterator[int]:
+        # at most `limit` ids can be taken from a tier, even after skipping
+        # ones an earlier tier already returned
+        r = _prefix_range(self._name_keys, q)
+        yield from heapq.nsmallest(limit, self._name_ids[r.start : r.stop])
+
+    def _word_prefix(self, terms: List[str]) -> Iterator[int]:
+        # every term must prefix some word of the name; walk the postings of
+        # the most selective term and check the rest per candidate
+        lead = max(range(len(terms)), key=lambda k: len(terms[k]))
+        rest = terms[:lead] + terms[lead + 1 :]
+        postings = [
+            self._word_ids[k] for k in _prefix_range(self._word_keys, terms[lead])
+        ]
+        last = -1
+        for i in heapq.merge(*postings):
+            if i == last:
+                continue
+            last = i
+            if rest:
+                words = _WORD_RE.findall(self._name[i])
+                if not all(any(w.startswith(t) for w in words) for t in rest):
+                    continue
+            yield i
+
+    def _substring(self, q: str, texts: List[str]) -> Iterator[int]:
+        shortest = min((self._grams.get(g, ()) for g in _trigrams(q)), key=len)
+        for i in shortest:
+            if q in texts[i]:
+                yield i
+
+    def _fuzzy(self, q: str, limit: int) -> List[int]:
+        edits = 1 if len(q) <= 5 else 2
+        counts: Counter = Counter()
+        for g in _trigrams(q):
+            counts.update(self._grams.get(g, ()))
+        # a typo touches at most 3 trigrams per edit
+        need = max(1, len(q) - 2 - 3 * edits)
+        cand = heapq.nlargest(
+            _FUZZY_SCAN, (i for i, c in counts.items() if c >= need), key=counts.get
+        )
+        hits = []
+        for i in cand:
+            targets = [self._base[i]] + _WORD_RE.findall(self._name[i])
+            d = min(_edit_distance(q, t, edits) for t in targets)
+            if d <= edits:
+                hits.append((d, i))
+        return [i for _, i in heapq.nsmallest(limit, hits)]
+
+    def search(self, q: str, limit: int = 20, fuzzy: bool = True) -> List[Instrument]:
+        q = " ".join(q.strip().upper().split())
+        if not q or limit <= 0:
+            return []
+        terms = _WORD_RE.findall(q)
+        syms = [q]
+        if len(terms) > 1:
+            # "tata mot" -> TATAMOTORS-EQ
+            syms.append("".join(terms))
+
+        def tiers() -> Iterator[Iterator[int]]:
+            yield heapq.merge(*(self._exact(s) for s in syms))
+            yield heapq.merge(*(self._symbol_prefix(s) for s in syms))
+            if terms:
+                yield self._name_prefix(q, limit)
+                yield self._word_prefix(terms)
+            if len(q) >= 3:
+                yield self._substring(q, self._sym)
+                yield self._substring(q, self._name)
+
+        out: List[int] = []
+        seen: Set[int] = set()
+        for tier in tiers():
+            for i in tier:
+                if i in seen:
+                    continue
+                seen.add(i)
+                out.append(i)
+                if len(out) >= limit:
+                    return [self.items[k] for k in out]
+        if fuzzy and len(q) >= 4 and not out:
+            out = self._fuzzy(q.replace(" ", ""), limit)
+        return [self.items[i] for i in out]
+
+
+def _flatten(lists: Iterable[List[int]]):
+    offsets = [0]
+    flat: List[int] = []
+    for ids in lists:
+        flat.extend(ids)
+        offsets.append(len(flat))
+    return offsets, flat
+
+
+def _unflatten(offsets: List[int], flat: List[int]) -> List[List[int]]:
+    return [flat[offsets[k] : offsets[k + 1]] for k in range(len(offsets) - 1)]
+
+
+def _pack(state: Dict[str, Any], mtime_ns: int, size: int) -> bytes:
+    """Magic, a length-prefixed JSON header, then the raw sections."""
+    blobs = [
+        ("\0".join(state[k]).encode("utf-8"), len(state[k])) for k in _STR_SECTIONS
+    ]
+    blobs += [(array("i", state[k]).tobytes(), len(state[k])) for k in _INT_SECTIONS]
+    header = json.dumps(
+        {
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "byteorder": sys.byteorder,
+            "lengths": [[n, len(b)] for b, n in blobs],
+        }
+    ).encode("utf-8")
+    return b"".join(
+        [_CACHE_MAGIC, struct.pack("<I", len(header)), header] + [b for b, _ in blobs]
+    )
+
+
+def _unpack(data: bytes, mtime_ns: int, size: int) -> Optional[Dict[str, Any]]:
+    """The state, or None if the snapshot is for another CSV version/layout."""
+    if data[: len(_CACHE_MAGIC)] != _CACHE_MAGIC:
+        return None
+    pos = len(_CACHE_MAGIC) + 4
+    (hlen,) = struct.unpack_from("<I", data, len(_CACHE_MAGIC))
+    header = json.loads(data[pos : pos + hlen])
+    pos += hlen
+    if (header["mtime_ns"], header["size"]) != (mtime_ns, size) or header[
+        "byteorder"
+    ] != sys.byteorder:
+        return None
+    view = memoryview(data)
+    state: Dict[str, Any] = {}
+    for key, (n, nbytes) in zip(_STR_SECTIONS + _INT_SECTIONS, header["lengths"]):
+        chunk = view[pos : pos + nbytes]
+        pos += nbytes
+        if key in _STR_SECTIONS:
+            state[key] = str(chunk, "utf-8").split("\0") if n else []
+        else:
+            ints = array("i")
+            ints.frombytes(chunk)
+            state[key] = ints.tolist()
+        if len(state[key]) != n:
+            raise ValueError(f"snapshot section {key} is truncated")
+    return state
+
+
+class _Snapshot:
+    """Immutable view of one load; swapped atomically on reload."""
+
+    def __init__(self, index: SearchIndex, mtime_ns: int, size: int):
+        self.index = index
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.by_token: dict[str, Instrument] = {ins.token: ins for ins in index.items}
+        self.by_symbol: dict[str, Instrument] = {
+            ins.symbol.upper(): ins for ins in index.items
+        }
+
+
 class InstrumentStore:
+    """CSV-backed instruments, loaded on first use.
+
+    A parsed snapshot (instruments + search index, as string columns and
+    int32 arrays) is cached next to the CSV and reused while the CSV's
+    mtime/size are unchanged. reload() builds a new snapshot off to the side
+    and swaps it in, so readers never block.
+    """
+
     def __init__(self, csv_path: str):
         self.csv_path = csv_path
-        self._by_symbol: dict[str, Instrument] = {}
-        self._by_token: dict[str, Instrument] = {}
-        self._load()
+        self._snap: Optional[_Snapshot] = None
+        self._load_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+
+    @property
+    def cache_path(self) -> str:
+        head, tail = os.path.split(self.csv_path)
+        return os.path.join(head, f".{tail}.idx")
 
-    def _load(self):
+    def _parse_csv(self) -> List[Instrument]:
         logger.info(f"Loading instruments from {self.csv_path}")
-        count = 0
+        # one row per token (last wins); search sees every one of them, so a
+        # symbol listed under two tokens is returned twice
+        by_token: dict[str, Instrument] = {}
         with open(self.csv_path, "r", newline="", encoding="utf-8") as f:
             reader = csv.reader(f)
             for row in reader:
@@ -36,30 +355,113 @@ class InstrumentStore:
                     logger.warning(f"Skipping row with non-numeric token: {row}")
                     continue
                 n0 = row[2].strip() if len(row) >= 3 else s0
-                ins = Instrument(symbol=s0, token=t0, name=n0)
-                self._by_symbol[s0.upper()] = ins
-                self._by_token[t0] = ins
-                count += 1
-        logger.info(f"Loaded {count} instruments (after header/invalid row skips)")
+                by_token[t0] = Instrument(symbol=s0, token=t0, name=n0)
+        logger.info(
+            f"Loaded {len(by_token)} instruments (after header/invalid row skips)"
+        )
+        return list(by_token.values())
+
+    def _read_cache(self, mtime_ns: int, size: int) -> Optional[SearchIndex]:
+        try:
+            with open(self.cache_path, "rb") as f:
+                state = _unpack(f.read(), mtime_ns, size)
+            if state is None:
+                return None
+            return SearchIndex.from_state(state)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable instruments cache: {e}")
+            return None
+
+    def _write_cache(self, index: SearchIndex, mtime_ns: int, size: int):
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        data = _pack(index.to_state(), mtime_ns, size)
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write instruments cache: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _build(self) -> _Snapshot:
+        st = os.stat(self.csv_path)
+        index = self._read_cache(st.st_mtime_ns, st.st_size)
+        if index is not None:
+            logger.info(f"Loaded {len(index.items)} instruments from snapshot")
+        else:
+            index = SearchIndex(self._parse_csv())
+            self._write_cache(index, st.st_mtime_ns, st.st_size)
+        return _Snapshot(index, st.st_mtime_ns, st.st_size)
+
+    def _current(self) -> _Snapshot:
+        snap = self._snap
+        if snap is None:
+            with self._load_lock:
+                if self._snap is None:
+                    self._snap = self._build()
+                snap = self._snap
+        return snap
+
+    def reload(self, force: bool = False) -> bool:
+        """Swap in a fresh snapshot if the CSV changed (or force); True if swapped."""
+        with self._load_lock:
+            cur = self._snap
+            if cur is not None and not force:
+                st = os.stat(self.csv_path)
+                if (st.st_mtime_ns, st.st_size) == (cur.mtime_ns, cur.size):
+                    return False
+            if force:
+                # a new mtime is what every other worker's watcher looks for
+                try:
+                    os.utime(self.csv_path)
+                except OSError as e:
+                    logger.warning(f"Could not touch {self.csv_path}: {e}")
+                try:
+                    os.remove(self.cache_path)
+                except OSError:
+                    pass
+            self._snap = self._build()
+            return True
+
+    def start_watcher(self, interval_seconds: float):
+        if interval_seconds <= 0 or self._watcher is not None:
+            return
+
+        def _watch():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    if self.reload():
+                        logger.info("Instruments CSV changed; reloaded")
+                except Exception as e:
+                    logger.warning(f"Instruments reload failed: {e}")
+
+        self._watcher = threading.Thread(
+            target=_watch, name="instruments-watch", daemon=True
+        )
+        self._watcher.start()
 
     def find_by_symbol(self, symbol: str) -> Optional[Instrument]:
-        return self._by_symbol.get(symbol.upper())
+        return self._current().by_symbol.get(symbol.upper())
 
     def find_by_token(self, token: str) -> Optional[Instrument]:
-        return self._by_token.get(token)
+        return self._current().by_token.get(token)
 
-    def search(self, q: str, limit: int = 20) -> List[Instrument]:
+    def all(self) -> List[Instrument]:
+        return list(self._current().index.items)
+
+    def __len__(self) -> int:
+        return len(self._current().index.items)
+
+    def search(self, q: str, limit: int = 20, fuzzy: bool = True) -> List[Instrument]:
         if not q:
             return []
-        ql = q.strip().upper()
-        out = []
-        for ins in self._by_symbol.values():
-            if ql in ins.symbol.upper() or ql in ins.name.upper():
-                out.append(ins)
-                if len(out) >= limit:
-                    break
-        out.sort(key=lambda x: x.symbol)
-        return out
+        return self._current().index.search(q, limit=limit, fuzzy=fuzzy)
 
 
 instruments = InstrumentStore(settings.stocks_csv)
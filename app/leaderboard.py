@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+from .db import PORTFOLIOS, get_db
+from .logger import logger
+from .repositories.portfolios import DEFAULT_INITIAL_CASH
+
+RankBy = Literal["value", "return"]
+
+PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "cash": 1,
+    "contributed": 1,
+    "positions": 1,
+    "rev": 1,
+    "updated_at": 1,
+}
+# updated_at comes from each worker's clock; re-read this much per poll
+SYNC_OVERLAP = timedelta(seconds=2)
+
+
+@dataclass
+class _Entry:
+    cash: float
+    contributed: float
+    rev: int
+    positions: Dict[str, Tuple[int, float]] = field(default_factory=dict)
+    value: float = 0.0
+    ret: float = 0.0
+
+
+class Leaderboard:
+    """Per-process ranking of users by portfolio value and by return.
+
+    Built from the portfolios collection at startup, then kept current
+    incrementally: a portfolio write rescores one user, a price tick rescores
+    only the holders of that token (token -> holders index). Rank lookups are
+    O(log n). Writes made by other workers are picked up by a sync thread that
+    polls ix_portfolios_updated, so every worker converges on the same ranking.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._entries: Dict[str, _Entry] = {}
+        self._holders: Dict[str, set[str]] = {}
+        self._prices: Dict[str, float] = {}
+        # keys are (-score, user) so index 0 is the leader
+        self._by_value: SortedList = SortedList()
+        self._by_return: SortedList = SortedList()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- scoring ----
+
+    def _score(self, e: _Entry):
+        holdings = 0.0
+        for tok, (qty, avg) in e.positions.items():
+            holdings += qty * self._prices.get(tok, avg)
+        e.value = round(e.cash + holdings, 2)
+        e.ret = (e.value - e.contributed) / e.contributed if e.contributed > 0 else 0.0
+
+    def _unrank(self, uid: str, e: _Entry):
+        self._by_value.discard((-e.value, uid))
+        self._by_return.discard((-e.ret, uid))
+
+    def _rank(self, uid: str, e: _Entry):
+        self._by_value.add((-e.value, uid))
+        self._by_return.add((-e.ret, uid))
+
+    def _put(self, doc: Dict[str, Any]):
+        uid = str(doc["user_id"])
+        rev = int(doc.get("rev", 0))
+        old = self._entries.get(uid)
+        # concurrent writers may report out of order; never go back in time
+        if old is not None and rev < old.rev:
+            return
+        if old is not None:
+            self._unrank(uid, old)
+            for tok in old.positions:
+                holders = self._holders.get(tok)
+                if holders is not None:
+                    holders.discard(uid)
+                    if not holders:
+                        del self._holders[tok]
+        e = _Entry(
+            cash=float(doc.get("cash", 0.0)),
+            contributed=float(doc.get("contributed", DEFAULT_INITIAL_CASH)),
+            rev=rev,
+        )
+        for tok, p in (doc.get("positions") or {}).items():
+            qty = int(p.get("quantity", 0))
+            if qty > 0:
+                e.positions[tok] = (qty, float(p.get("avg_price", 0.0)))
+                self._holders.setdefault(tok, set()).add(uid)
+        self._score(e)
+        self._entries[uid] = e
+        self._rank(uid, e)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            cur = get_db()[PORTFOLIOS].find({}, PROJECTION).batch_size(5000)
+            for doc in cur:
+                self._put(doc)
+            self._loaded = True
+            logger.info(f"Leaderboard loaded: {len(self._entries)} portfolios")
+
+    # ---- cross-worker sync ----
+
+    def start_sync(self, poll_seconds: float):
+        """Load the ranking now and follow other workers' portfolio writes."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._sync, args=(poll_seconds,), name="leaderboard", daemon=True
+        )
+        self._thread.start()
+
+    def _sync(self, poll_seconds: float):
+        since = datetime.now(timezone.utc)
+        while True:
+            try:
+                self._ensure_loaded()
+                break
+            except Exception as e:
+                logger.warning(f"Leaderboard load failed: {e}")
+                time.sleep(max(1.0, poll_seconds))
+        coll = get_db()[PORTFOLIOS]
+        while True:
+            time.sleep(poll_seconds)
+            try:
+                # ix_portfolios_updated serves this; no hint, so a missing
+                # index slows the poll instead of failing it
+                cur = coll.find(
+                    {"updated_at": {"$gt": since - SYNC_OVERLAP}}, PROJECTION
+                )
+                for doc in cur:
+                    # _put ignores revs we already have
+                    self.on_portfolio(doc)
+                    ua = doc.get("updated_at")
+                    if isinstance(ua, datetime) and ua > since:
+                        since = ua
+            except Exception as e:
+                logger.warning(f"Leaderboard sync: {e}")
+
+    # ---- incremental updates ----
+
+    def on_portfolio(self, doc: Dict[str, Any]):
+        """A user's portfolio changed (trade, deposit, reset)."""
+        with self._lock:
+            if self._loaded:
+                self._put(doc)
+
+    def on_price(self, token: str, price: Optional[float]):
+        """New last price for a token; rescores only its holders."""
+        if price is None or price <= 0:
+            return
+        with self._lock:
+            if self._prices.get(token) == price:
+                return
+            self._prices[token] = price
+            if not self._loaded:
+                return
+            for uid in self._holders.get(token, ()):
+                e = self._entries[uid]
+                self._unrank(uid, e)
+                self._score(e)
+                self._rank(uid, e)
+
+    # ---- queries ----
+
+    def _index(self, by: RankBy) -> SortedList:
+        return self._by_return if by == "return" else self._by_value
+
+    def top(self, by: RankBy = "value", limit: int = 20) -> List[Dict[str, Any]]:
+        self._ensure_loaded()
+        with self._lock:
+            out = []
+            for i, (_, uid) in enumerate(self._index(by).islice(0, limit), start=1):
+                e = self._entries[uid]
+                out.append({"rank": i, "user_id": uid, "value": e.value, "ret": e.ret})
+            return out
+
+    def rank_of(self, user_id) -> Optional[Dict[str, Any]]:
+        self._ensure_loaded()
+        uid = str(user_id)
+        with self._lock:
+            e = self._entries.get(uid)
+            if e is None:
+                return None
+            return {
+                "value": e.value,
+                "ret": e.ret,
+                "rank_value": self._by_value.index((-e.value, uid)) + 1,
+                "rank_return": self._by_return.index((-e.ret, uid)) + 1,
+                "total": len(self._entries),
+            }
+
+
+leaderboard = Leaderboard()
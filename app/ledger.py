@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import glob
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId, json_util
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: no cross-process segment ownership
+    fcntl = None  # type: ignore[assignment]
+
+from .config import settings
+from .logger import logger
+from .repositories import trades as trades_repo
+
+_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(
+    tz_aware=True, tzinfo=timezone.utc
+)
+
+
+# Segment names carry this instead of the pid: pids are reused across
+# container restarts, a per-start UUID is not
+BOOT_ID = uuid.uuid4().hex
+
+
+def _try_lock(fd: int) -> bool:
+    """Exclusive, non-blocking flock; the OS drops it when the holder dies."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+class _Segment:
+    """One journal file, locked by its writer from creation until deletion,
+    so other workers can tell a live segment from an orphan."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # locked before it gets its .jsonl name, so no one sees it unlocked
+        tmp = path + ".new"
+        self.fh = open(tmp, "a", encoding="utf-8")
+        _try_lock(self.fh.fileno())
+        os.replace(tmp, path)
+        self.docs: List[Dict[str, Any]] = []
+        self._sync_lock = threading.Lock()
+        self._synced = 0
+        self._closed = False
+
+    def append(self, doc: Dict[str, Any]) -> int:
+        """Caller holds the writer lock; returns the line's position."""
+        self.fh.write(json_util.dumps(doc, json_options=_JSON_OPTIONS) + "\n")
+        self.fh.flush()
+        self.docs.append(doc)
+        return len(self.docs)
+
+    def sync(self, upto: int):
+        """fsync through line upto. Concurrent callers share one fsync: whoever
+        syncs first covers every line written before it started."""
+        with self._sync_lock:
+            if self._closed or self._synced >= upto:
+                return
+            written = len(self.docs)
+            os.fsync(self.fh.fileno())
+            self._synced = written
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            logger.warning(f"Ledger journal {self.path} not removed: {e}")
+        with self._sync_lock:
+            self._closed = True
+            self.fh.close()
+
+
+def _read_segment(path: str) -> List[Dict[str, Any]]:
+    docs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                docs.append(json_util.loads(line, json_options=_JSON_OPTIONS))
+            except ValueError:
+                # torn final write from a crash; the trade never returned to a client
+                logger.warning(f"Ledger journal {path}: skipping unreadable line")
+    return docs
+
+
+class LedgerWriter:
+    """Write-behind batching for trade ledger inserts.
+
+    record() assigns the trade's _id and executed_at, appends it to a local
+    journal (one JSON line, fsync'd) and queues it; a background thread
+    inserts queued trades with insert_many(ordered=False) once batch_size
+    are waiting or flush_ms has passed. Each flush seals the current journal
+    segment and deletes it only after Mongo accepted the batch, so a crash
+    loses nothing: segments left behind by a dead process are replayed on
+    start and every orphan_scan_seconds by the flusher, and pre-assigned _ids
+    make replays idempotent. A segment is an
+    orphan when nobody holds its flock, never judged by pid. The fsync runs
+    outside the writer lock, so concurrent trades share it (group commit).
+
+    When not running (LEDGER_WRITE_BEHIND=false, or before start) record()
+    falls back to a direct insert.
+    """
+
+    def __init__(
+        self,
+        journal_dir: str,
+        batch_size: int = 500,
+        flush_ms: int = 200,
+        fsync: bool = True,
+        orphan_scan_seconds: float = 60.0,
+    ):
+        self.journal_dir = journal_dir
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = max(0.001, flush_ms / 1000)
+        self.fsync = fsync
+        self.orphan_scan_seconds = orphan_scan_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._live: Optional[_Segment] = None
+        self._seq = 0
+        # sealed journal segments waiting for a successful insert, oldest first
+        self._sealed: List[_Segment] = []
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+        self.flushed = 0
+        self.batches = 0
+        self.replayed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    # ---- journal ----
+
+    def _segment_path(self) -> str:
+        self._seq += 1
+        name = f"{BOOT_ID}-{os.getpid()}-{self._seq:09d}.jsonl"
+        return os.path.join(self.journal_dir, name)
+
+    def _seal(self):
+        """Stop writing the live segment and hand it to the flusher; it stays
+        open (and locked) until its trades are in Mongo."""
+        if self._live is not None and self._live.docs:
+            self._sealed.append(self._live)
+            self._live = None
+
+    def _replay_orphans(self):
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "*.jsonl"))):
+            if path.startswith(os.path.join(self.journal_dir, BOOT_ID)):
+                continue
+            try:
+                fh = open(path, "r", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with fh:
+                # held: its writer is alive, or another worker is replaying it
+                if not _try_lock(fh.fileno()):
+                    continue
+                if not os.path.exists(path):
+                    continue  # replayed and removed while we were opening it
+                docs = _read_segment(path)
+                inserted = trades_repo.insert_many(docs)
+                os.remove(path)
+                self.replayed += len(docs)
+            logger.info(
+                f"Ledger journal replayed {path}: {len(docs)} trades, {inserted} new"
+            )
+
+    # ---- lifecycle ----
+
+    def start(self):
+        """Replay orphaned journal segments, then start the flusher thread."""
+        if self._thread is not None:
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._replay_orphans()
+        self._stop = False
+        self._thread = threading.Thread(
+            target=self._run, name="ledger-writer", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"Ledger write-behind on (batch={self.batch_size}, "
+            f"flush={int(self.flush_seconds * 1000)}ms, dir={self.journal_dir})"
+        )
+
+    def close(self):
+        """Stop the flusher and write out everything still queued."""
+        if self._thread is None:
+            return
+        with self._lock:
+            self._stop = True
+            self._wake.notify_all()
+        self._thread.join(timeout=30)
+        self._thread = None
+        if not self.flush():
+            logger.error("Ledger flush on shutdown failed; journal kept for replay")
+
+    # ---- write path ----
+
+    def record(self, trade: Dict[str, Any]) -> Dict[str, Any]:
+        if self._thread is None:
+            return trades_repo.insert_trade(trade)
+        trade.setdefault("_id", ObjectId())
+        trade.setdefault("executed_at", datetime.now(timezone.utc))
+        with self._lock:
+            if self._live is None:
+                self._live = _Segment(self._segment_path())
+            seg = self._live
+            line = seg.append(trade)
+            if line >= self.batch_size:
+                self._wake.notify()
+        if self.fsync:
+            seg.sync(line)
+        return trade
+
+    def flush(self) -> bool:
+        """Insert every queued trade now; False if Mongo rejected a batch."""
+        with self._flush_lock:
+            with self._lock:
+                self._seal()
+                sealed = list(self._sealed)
+            for seg in sealed:
+                try:
+                    trades_repo.insert_many(seg.docs)
+                except Exception as e:
+                    logger.warning(f"Ledger flush failed ({len(seg.docs)} trades): {e}")
+                    return False
+                with self._lock:
+                    self._sealed.pop(0)
+                self.flushed += len(seg.docs)
+                self.batches += 1
+                seg.remove()
+            return True
+
+    def _run(self):
+        backoff = self.flush_seconds
+        scanned = time.monotonic()
+        while True:
+            with self._lock:
+                live = len(self._live.docs) if self._live is not None else 0
+                if not self._stop and live < self.batch_size:
+                    self._wake.wait(timeout=backoff)
+                if self._stop:
+                    return
+            if self.flush():
+                backoff = self.flush_seconds
+            else:
+                backoff = min(backoff * 2, 5.0)
+                continue
+            due = self.orphan_scan_seconds > 0 and (
+                time.monotonic() - scanned >= self.orphan_scan_seconds
+            )
+            if due:
+                # a worker that died since start leaves segments nobody holds
+                scanned = time.monotonic()
+                try:
+                    self._replay_orphans()
+                except Exception as e:
+                    logger.warning(f"Ledger orphan replay failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self.running,
+                "pending": len(self._live.docs) if self._live is not None else 0,
+                "sealed": sum(len(s.docs) for s in self._sealed),
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "replayed": self.replayed,
+            }
+
+
+ledger_writer = LedgerWriter(
+    settings.ledger_journal_dir,
+    batch_size=settings.ledger_batch_size,
+    flush_ms=settings.ledger_flush_ms,
+    fsync=settings.ledger_fsync,
+    orphan_scan_seconds=settings.ledger_orphan_scan_seconds,
+)
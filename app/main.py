@@ -1,24 +1,38 @@
+import time
 from typing import Optional
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
-from .candles import Interval, fallback_daily_if_empty, normalize_candles
+from . import BOOT_T0, trading_calendar
+from .candles import Interval, load_candles, normalize_candles, request_range
+from .cluster import cluster
 from .config import settings
 
 # DB init
-from .db import connect_mongo, ensure_indexes
+from .db import close_mongo, connect_mongo, ensure_indexes
+from .deps import start_revocation_watcher
 from .instruments import instruments
+from .leaderboard import leaderboard
+from .ledger import ledger_writer
 from .logger import logger
+from .portfolio_cache import portfolio_cache
+from .readiness import readiness
 
 # Routers
+from .routes import admin as admin_routes
 from .routes import auth as auth_routes
+from .routes import backtest as backtest_routes
+from .routes import candles as candle_routes
+from .routes import indicators as indicator_routes
+from .routes import leaderboard as leaderboard_routes
 from .routes import portfolio as portfolio_routes
 from .routes import prices as prices_routes
 from .routes import trades as trades_routes
+from .security import shutdown_pool
 from .smartapi_client import smart_mgr
-from .timeutils import is_market_open, last_n_days_endpoints, now_ist, parse_iso_ist
+from .timeutils import is_market_open, now_ist
 
 app = FastAPI(title="Stock Simulator - Modules 1 to 3")
 
@@ -34,20 +48,61 @@ if _origins:
     )
 
 
+_STARTUP_MS: Optional[float] = None
+
+
+def _init_mongo():
+    connect_mongo()
+    ensure_indexes()
+    leaderboard.start_sync(settings.leaderboard_sync_ms / 1000)
+    # only once Mongo answers, so the watcher cannot race the first connect
+    portfolio_cache.start_watcher(settings.portfolio_cache_poll_ms / 1000)
+    start_revocation_watcher(settings.session_revoke_poll_ms / 1000)
+
+
 @app.on_event("startup")
 def _startup():
+    global _STARTUP_MS
     logger.info("Starting Data Service (Modules 1-3)")
-    try:
-        connect_mongo()
-        ensure_indexes()
-    except Exception as e:
-        logger.warning(f"Mongo not ready or index init failed: {e}")
+    instruments.start_watcher(settings.instruments_watch_seconds)
+
+    # In background mode the process serves /api/health immediately;
+    # /api/ready reports when Mongo and instruments are usable. Otherwise each
+    # task gets one attempt here and retries continue in the background.
+    bg = settings.startup_background
+    readiness.run(
+        "mongo", _init_mongo, background=bg, retry_seconds=5, max_retry_seconds=60
+    )
+    readiness.run("instruments", instruments.all, background=bg)
+    # reported, not required: a missing year only misplaces holidays
+    readiness.run(
+        "calendar", trading_calendar.check_coverage, background=bg, required=False
+    )
+    if settings.ledger_write_behind:
+        # replays journal segments left by a crashed worker before accepting more
+        readiness.run(
+            "ledger",
+            ledger_writer.start,
+            background=bg,
+            retry_seconds=5,
+            max_retry_seconds=60,
+        )
+    # before the SmartAPI login, so only the elected leader logs in
+    cluster.start(smart_mgr.get_candles)
+    if settings.angel_hist_api_key:
+        readiness.run(
+            "smartapi",
+            smart_mgr.ensure_logged_in,
+            background=bg,
+            required=False,
+            retry_seconds=30,
+            max_retry_seconds=600,
+            # calls log in on demand anyway; stop hammering a bad TOTP/PIN
+            max_attempts=10,
+        )
 
-    try:
-        if settings.angel_hist_api_key:
-            smart_mgr.ensure_logged_in()
-    except Exception as e:
-        logger.warning(f"Historical session not ready yet: {e}")
+    _STARTUP_MS = round((time.perf_counter() - BOOT_T0) * 1000, 1)
+    logger.info(f"Startup finished in {_STARTUP_MS} ms (background={bg})")
 
 
 @app.on_event("shutdown")
@@ -56,6 +111,10 @@ def _shutdown():
         smart_mgr.terminate_all()
     except Exception:
         pass
+    cluster.stop()
+    shutdown_pool()
+    ledger_writer.close()
+    close_mongo()
 
 
 @app.get("/api/health")
@@ -71,15 +130,27 @@ def health():
             "trading_api_key_present": bool(settings.angel_market_api_key),
             "stocks_csv": settings.stocks_csv,
             "csrf_enabled": settings.csrf_enabled,
+            "startup_ms": _STARTUP_MS,
         }
     )
 
 
+@app.get("/api/ready")
+def ready():
+    ok = readiness.is_ready()
+    return JSONResponse(
+        {"ready": ok, "startup_ms": _STARTUP_MS, "tasks": readiness.snapshot()},
+        status_code=200 if ok else 503,
+    )
+
+
 @app.get("/api/instruments/search")
 def search_instruments(
-    q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=50)
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=50),
+    fuzzy: bool = Query(True),
 ):
-    results = instruments.search(q, limit=limit)
+    results = instruments.search(q, limit=limit, fuzzy=fuzzy)
     return [
         {
             "symbol": r.symbol,
@@ -111,13 +182,8 @@ def get_candles(
             status_code=500, detail="ANGEL_HIST_API_KEY missing in .env"
         )
 
-    if frm and to:
-        start = parse_iso_ist(frm)
-        end = parse_iso_ist(to)
-    else:
-        start, end = last_n_days_endpoints(30)
-
-    raw = fallback_daily_if_empty("NSE", ins.token, interval, start, end)
+    start, end = request_range(interval, frm, to)
+    raw, source, stale = load_candles(ins.symbol, ins.token, interval, start, end)
     series = normalize_candles(raw)
     return {
         "symbol": ins.symbol,
@@ -126,6 +192,8 @@ def get_candles(
         "interval": interval,
         "from": start.isoformat(),
         "to": end.isoformat(),
+        "source": source,
+        "stale": stale,
         "series": series,
     }
 
@@ -135,3 +203,8 @@ app.include_router(auth_routes.router)
 app.include_router(portfolio_routes.router)
 app.include_router(trades_routes.router)
 app.include_router(prices_routes.router)
+app.include_router(leaderboard_routes.router)
+app.include_router(backtest_routes.router)
+app.include_router(candle_routes.router)
+app.include_router(indicator_routes.router)
+app.include_router(admin_routes.router)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from pymongo.errors import OperationFailure
+
+from .cache import TTLCache
+from .config import settings
+from .db import PORTFOLIOS, get_db
+from .logger import logger
+
+# Change streams need a replica set; standalone servers report this code
+NOT_REPLICA_SET = 40573
+# updated_at comes from each worker's clock; re-read this much history per poll
+POLL_OVERLAP = timedelta(seconds=2)
+
+
+class PortfolioCache:
+    """Per-process read-through cache of portfolio documents, keyed by user.
+
+    Entries carry their rev: local writes (compare_and_swap) replace the entry
+    with the new rev immediately, and writes from other workers evict it via
+    a watcher thread (a change stream when Mongo is a replica set, otherwise a
+    poll of ix_portfolios_updated that only returns user_id/rev). A stale
+    entry can only make a CAS fail, which evicts it before the retry.
+    """
+
+    def __init__(self, ttl_seconds: float, max_items: int = 10000):
+        self.enabled = ttl_seconds > 0
+        self._docs = TTLCache(ttl_seconds=ttl_seconds, max_items=max_items)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+
+    # ---- entries ----
+
+    def get(self, user_id) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        doc = self._docs.get(str(user_id))
+        if doc is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # callers build new position maps from the doc; keep ours untouched
+        return copy.deepcopy(doc)
+
+    def put(self, doc: Dict[str, Any]):
+        """Store doc unless a newer rev is already cached."""
+        if not self.enabled:
+            return
+        key = str(doc["user_id"])
+        with self._lock:
+            cur = self._docs.get(key)
+            if cur is not None and int(cur.get("rev", 0)) > int(doc.get("rev", 0)):
+                return
+            self._docs.set(key, copy.deepcopy(doc))
+
+    def apply_cas(self, user_id, expected_rev: int, new_fields: Dict[str, Any]):
+        """A CAS from expected_rev succeeded: patch the cached doc in place."""
+        if not self.enabled:
+            return
+        key = str(user_id)
+        with self._lock:
+            cur = self._docs.get(key)
+            if cur is None or int(cur.get("rev", 0)) != expected_rev:
+                self._docs.delete(key)
+                return
+            self._docs.set(key, {**cur, **copy.deepcopy(new_fields)})
+
+    def invalidate(self, user_id, rev: Optional[int] = None):
+        """Evict the entry, or only if it is older than rev."""
+        key = str(user_id)
+        with self._lock:
+            if rev is not None:
+                cur = self._docs.get(key)
+                if cur is None or int(cur.get("rev", 0)) >= rev:
+                    return
+            self._docs.delete(key)
+
+    def clear(self):
+        self._docs.clear()
+
+    # ---- cross-worker invalidation ----
+
+    def start_watcher(self, poll_seconds: float):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._watch,
+            args=(poll_seconds,),
+            name="portfolio-cache",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _watch(self, poll_seconds: float):
+        use_stream = True
+        while True:
+            try:
+                if use_stream:
+                    self._follow_stream()
+                else:
+                    self._poll(poll_seconds)
+            except OperationFailure as e:
+                if e.code == NOT_REPLICA_SET and use_stream:
+                    logger.info(
+                        "Portfolio cache: no change streams; polling updated_at"
+                    )
+                    use_stream = False
+                    continue
+                logger.warning(f"Portfolio cache watcher: {e}")
+            except Exception as e:
+                logger.warning(f"Portfolio cache watcher: {e}")
+            # events may have been missed while disconnected
+            self.clear()
+            time.sleep(max(1.0, poll_seconds))
+
+    def _follow_stream(self):
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}
+        ]
+        coll = get_db()[PORTFOLIOS]
+        with coll.watch(pipeline, full_document="updateLookup") as stream:
+            self.clear()
+            for change in stream:
+                doc = change.get("fullDocument")
+                if doc:
+                    self.invalidate(doc["user_id"], int(doc.get("rev", 0)))
+
+    def _poll(self, poll_seconds: float):
+        coll = get_db()[PORTFOLIOS]
+        since = datetime.now(timezone.utc) - POLL_OVERLAP
+        self.clear()
+        while True:
+            time.sleep(poll_seconds)
+            # served by ix_portfolios_updated; not hinted, so a missing index
+            # slows invalidation down instead of stopping it
+            cur = coll.find(
+                {"updated_at": {"$gt": since - POLL_OVERLAP}},
+                {"_id": 0, "user_id": 1, "rev": 1, "updated_at": 1},
+            )
+            for doc in cur:
+                self.invalidate(doc["user_id"], int(doc.get("rev", 0)))
+                ua = doc.get("updated_at")
+                if isinstance(ua, datetime) and ua > since:
+                    since = ua
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+
+portfolio_cache = PortfolioCache(
+    settings.portfolio_cache_seconds, settings.portfolio_cache_max_items
+)
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import time
+import zlib
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .logger import logger
+from .timeutils import IST, bar_time
+
+# Latest bars per token in one shared-memory segment, written by the leader
+# process and read by every worker without IPC. Layout: a small header, then
+# a fixed table of slots found by hashing the token (linear probing). Each
+# slot is a ring of the last `bars` bars (epoch seconds, o, h, l, c, v).
+#
+# Single writer, many readers: each slot carries a sequence number that is
+# odd while the leader is writing it (a seqlock), so readers retry instead
+# of seeing a half-written ring.
+MAGIC = 0x51524E47  # "QRNG"
+HEADER = np.dtype([("magic", "<u8"), ("slots", "<u8"), ("bars", "<u8")])
+READ_RETRIES = 8
+
+
+def _slot_dtype(bars: int) -> np.dtype:
+    return np.dtype(
+        [
+            ("token", "S24"),
+            ("seq", "<u8"),
+            ("count", "<u4"),
+            ("head", "<u4"),
+            ("updated", "<f8"),
+            ("ring", "<f8", (bars, 6)),
+        ]
+    )
+
+
+def _epoch(raw: Any) -> float:
+    return bar_time(raw).timestamp()
+
+
+class QuoteRing:
+    def __init__(self, name: str, slots: int, bars: int):
+        self.name = name
+        self.slots = slots
+        self.bars = bars
+        self._dtype = _slot_dtype(bars)
+        self._size = HEADER.itemsize + self._dtype.itemsize * slots
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._table: Optional[np.ndarray] = None
+        self.writer = False
+        self.published = 0
+        self.full = 0
+
+    def open(self, create: bool) -> bool:
+        """Attach to the segment; the leader (create=True) makes it if needed.
+
+        The segment outlives any one process: a new leader after a crash
+        reattaches to it and readers keep their mapping, so it is never
+        unlinked here (it is a few MB in /dev/shm until reboot).
+        """
+        if self._table is not None:
+            self.writer = self.writer or create
+            return True
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+            if shm.size < self._size or not self._header_ok(shm):
+                if not create:
+                    shm.close()
+                    return False
+                # sized for other settings: replace it
+                shm.close()
+                shm.unlink()
+                shm = shared_memory.SharedMemory(
+                    name=self.name, create=True, size=self._size
+                )
+                self._init_header(shm)
+        except FileNotFoundError:
+            if not create:
+                return False
+            shm = shared_memory.SharedMemory(
+                name=self.name, create=True, size=self._size
+            )
+            self._init_header(shm)
+        # Python < 3.13 would unlink the segment when this process exits
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+        except Exception:
+            pass
+        self._shm = shm
+        self._table = np.ndarray(
+            (self.slots,), dtype=self._dtype, buffer=shm.buf, offset=HEADER.itemsize
+        )
+        self.writer = create
+        return True
+
+    def _header_ok(self, shm) -> bool:
+        head = np.ndarray((1,), dtype=HEADER, buffer=shm.buf)[0]
+        return (
+            int(head["magic"]) == MAGIC
+            and int(head["slots"]) == self.slots
+            and int(head["bars"]) == self.bars
+        )
+
+    def _init_header(self, shm):
+        np.ndarray((shm.size,), dtype=np.uint8, buffer=shm.buf)[:] = 0
+        head = np.ndarray((1,), dtype=HEADER, buffer=shm.buf)
+        head[0] = (MAGIC, self.slots, self.bars)
+
+    def _find(self, token: bytes, claim: bool) -> Optional[int]:
+        assert self._table is not None
+        start = zlib.crc32(token) % self.slots
+        for i in range(self.slots):
+            idx = (start + i) % self.slots
+            have = self._table[idx]["token"]
+            if have == token:
+                return idx
+            if have == b"":
+                return idx if claim else None
+        return None
+
+    def publish(self, token: str, rows: List[list]):
+        """Append bars (SmartAPI rows, oldest first) to the token's ring; a bar
+        with the newest timestamp again replaces it (the forming minute)."""
+        if self._table is None or not self.writer or not rows:
+            return
+        key = token.encode()[:24]
+        idx = self._find(key, claim=True)
+        if idx is None:
+            self.full += 1
+            return
+        slot = self._table[idx : idx + 1]
+        ring = slot["ring"][0]
+        slot["seq"] += 1  # odd: readers back off
+        try:
+            if slot["token"][0] == b"":
+                slot["token"] = key
+            count, head = int(slot["count"][0]), int(slot["head"][0])
+            last = ring[(head - 1) % self.bars][0] if count else float("-inf")
+            for r in rows:
+                if not r or len(r) < 5:
+                    continue
+                ts = _epoch(r[0])
+                bar = [ts] + [float(x or 0.0) for x in (list(r[1:6]) + [0.0])[:5]]
+                if count and ts == last:
+                    ring[(head - 1) % self.bars] = bar
+                elif ts > last:
+                    ring[head] = bar
+                    head = (head + 1) % self.bars
+                    count = min(count + 1, self.bars)
+                    last = ts
+            slot["count"], slot["head"] = count, head
+            slot["updated"] = time.time()
+        finally:
+            slot["seq"] += 1
+        self.published += 1
+
+    def latest(self, token: str) -> Tuple[List[list], float]:
+        """(bars oldest first as SmartAPI rows, publish time) for token."""
+        if self._table is None:
+            return [], 0.0
+        idx = self._find(token.encode()[:24], claim=False)
+        if idx is None:
+            return [], 0.0
+        slot = self._table[idx : idx + 1]
+        for _ in range(READ_RETRIES):
+            seq = int(slot["seq"][0])
+            if seq % 2:
+                time.sleep(0)
+                continue
+            count, head = int(slot["count"][0]), int(slot["head"][0])
+            updated = float(slot["updated"][0])
+            ring = slot["ring"][0].copy()
+            if int(slot["seq"][0]) == seq:
+                break
+        else:
+            return [], 0.0
+        order = [(head - count + i) % self.bars for i in range(count)]
+        return [
+            [datetime.fromtimestamp(b[0], IST).isoformat(), *map(float, b[1:])]
+            for b in ring[order]
+        ], updated
+
+    def stats(self) -> Dict[str, Any]:
+        used = 0
+        if self._table is not None:
+            used = int(np.count_nonzero(self._table["token"] != b""))
+        return {
+            "attached": self._table is not None,
+            "writer": self.writer,
+            "slots": self.slots,
+            "slots_used": used,
+            "bars_per_slot": self.bars,
+            "published": self.published,
+            "table_full": self.full,
+        }
+
+    def close(self):
+        self._table = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except Exception as e:
+                logger.debug(f"Quote ring close: {e}")
+            self._shm = None
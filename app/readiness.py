@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from .logger import logger
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """Tracks startup tasks for the readiness probe.
+
+    Required tasks gate readiness; optional ones (e.g. the SmartAPI login,
+    which also happens lazily on first use) are only reported.
+
+    A failed task is retried after retry_seconds, doubling up to
+    max_retry_seconds, for at most max_attempts tries (0 = no limit). With
+    background=False only the first attempt runs in the caller; retries move
+    to a background thread, so a dependency that is down never holds up
+    startup.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._required: set[str] = set()
+
+    def _set(self, name: str, state: Dict[str, Any]):
+        with self._lock:
+            self._tasks[name] = state
+
+    def run(
+        self,
+        name: str,
+        fn: Callable[[], Any],
+        *,
+        background: bool = True,
+        required: bool = True,
+        retry_seconds: float = 0,
+        max_retry_seconds: float = 300,
+        max_attempts: int = 0,
+    ):
+        with self._lock:
+            self._tasks[name] = {"state": PENDING}
+            if required:
+                self._required.add(name)
+
+        def _attempt(attempt: int) -> bool:
+            t0 = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                ms = round((time.perf_counter() - t0) * 1000, 1)
+                logger.warning(f"Startup task {name} failed (attempt {attempt}): {e}")
+                self._set(
+                    name,
+                    {"state": FAILED, "error": str(e), "ms": ms, "attempts": attempt},
+                )
+                return False
+            ms = round((time.perf_counter() - t0) * 1000, 1)
+            self._set(name, {"state": READY, "ms": ms, "attempts": attempt})
+            logger.info(f"Startup task {name} ready in {ms} ms")
+            return True
+
+        def _retries(attempt: int):
+            delay = retry_seconds
+            while max_attempts <= 0 or attempt < max_attempts:
+                time.sleep(delay)
+                delay = min(delay * 2, max(max_retry_seconds, retry_seconds))
+                attempt += 1
+                if _attempt(attempt):
+                    return
+            logger.warning(f"Startup task {name} gave up after {attempt} attempts")
+
+        def _spawn(target, *args):
+            threading.Thread(
+                target=target, args=args, name=f"startup-{name}", daemon=True
+            ).start()
+
+        def _task():
+            if not _attempt(1) and retry_seconds > 0:
+                _retries(1)
+
+        if background:
+            _spawn(_task)
+        elif not _attempt(1) and retry_seconds > 0:
+            _spawn(_retries, 1)
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            return all(self._tasks[n]["state"] == READY for n in self._required)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                k: {**v, "required": k in self._required}
+                for k, v in self._tasks.items()
+            }
+
+
+readiness = Readiness()
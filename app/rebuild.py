@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from .db import PORTFOLIOS, REBUILD_JOBS, get_db
+from .logger import logger
+from .repositories import trades as trades_repo
+from .trading import apply_fill
+
+TRADE_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "token": 1,
+    "symbol": 1,
+    "side": 1,
+    "quantity": 1,
+    "price": 1,
+}
+PORTFOLIO_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "cash": 1,
+    "contributed": 1,
+    "realized_pl": 1,
+    "positions": 1,
+    "rev": 1,
+    "updated_at": 1,
+}
+CASH_TOLERANCE = 0.01
+AVG_TOLERANCE = 0.001
+# A trade's ledger insert follows its portfolio CAS; leave very recent
+# portfolios alone so an in-flight insert is not mistaken for drift
+SETTLE_SECONDS = 60
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+# Workers running rebuild jobs check in this often; an unfinished job whose
+# worker has been silent for STALE_JOB_SECONDS died with it
+HEARTBEAT_SECONDS = 15
+STALE_JOB_SECONDS = 300
+
+
+@dataclass
+class RebuildReport:
+    portfolios: int = 0
+    trades: int = 0
+    drifted: int = 0
+    rewritten: int = 0
+    conflicts: int = 0
+    orphan_users: int = 0
+    skipped_recent: int = 0
+    # portfolios from before deposits recorded `contributed`: positions and
+    # realized P&L are still rebuilt and repaired, but their starting cash is
+    # derived as stored cash minus the fills' cash, so cash is not checked
+    missing_contributed: int = 0
+    seconds: float = 0.0
+    samples: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def replay(
+    portfolio: Dict[str, Any],
+    trades: Iterator[Dict[str, Any]],
+    start_cash: Optional[float] = None,
+) -> Dict:
+    """Recompute cash, realized P&L and positions from contributed cash (or
+    start_cash) + fills."""
+    cash = float(portfolio["contributed"] if start_cash is None else start_cash)
+    realized_pl = 0.0
+    positions: Dict[str, Dict[str, Any]] = {}
+    n = 0
+    for t in trades:
+        n += 1
+        tok = t["token"]
+        pos = positions.get(tok)
+        fill = apply_fill(
+            cash,
+            realized_pl,
+            pos["quantity"] if pos else 0,
+            pos["avg_price"] if pos else 0.0,
+            t["side"],
+            int(t["quantity"]),
+            float(t["price"]),
+            strict=False,
+        )
+        cash, realized_pl = fill.cash, fill.realized_pl
+        if fill.quantity <= 0:
+            positions.pop(tok, None)
+        else:
+            positions[tok] = {
+                "symbol": t.get("symbol", tok),
+                "quantity": fill.quantity,
+                "avg_price": fill.avg_price,
+            }
+    return {
+        "cash": cash,
+        "realized_pl": realized_pl,
+        "positions": positions,
+        "trades": n,
+    }
+
+
+def diff(stored: Dict[str, Any], rebuilt: Dict[str, Any]) -> List[str]:
+    out = []
+    if abs(float(stored.get("cash", 0.0)) - rebuilt["cash"]) > CASH_TOLERANCE:
+        out.append(f"cash {stored.get('cash')} != {rebuilt['cash']}")
+    if (
+        abs(float(stored.get("realized_pl", 0.0)) - rebuilt["realized_pl"])
+        > CASH_TOLERANCE
+    ):
+        out.append(
+            f"realized_pl {stored.get('realized_pl')} != {rebuilt['realized_pl']}"
+        )
+    have = stored.get("positions") or {}
+    want = rebuilt["positions"]
+    for tok in sorted(set(have) | set(want)):
+        a, b = have.get(tok), want.get(tok)
+        qa = int(a.get("quantity", 0)) if a else 0
+        qb = b["quantity"] if b else 0
+        if qa != qb:
+            out.append(f"{tok} quantity {qa} != {qb}")
+            continue
+        avg_a = float(a.get("avg_price", 0.0)) if a else 0.0
+        if b and abs(avg_a - b["avg_price"]) > AVG_TOLERANCE:
+            out.append(f"{tok} avg_price {a.get('avg_price')} != {b['avg_price']}")
+    return out
+
+
+def _flush(ops: List[UpdateOne], report: RebuildReport):
+    if not ops:
+        return
+    res = get_db()[PORTFOLIOS].bulk_write(ops, ordered=False)
+    report.rewritten += res.modified_count
+    report.conflicts += len(ops) - res.modified_count
+    ops.clear()
+
+
+def rebuild(
+    user_id=None,
+    apply: bool = False,
+    batch_size: int = 10000,
+    max_samples: int = 50,
+    progress: Optional[Callable[[RebuildReport], None]] = None,
+) -> RebuildReport:
+    """Replay the ledger for one user (or everyone) and diff against portfolios.
+
+    Portfolios and trades are both walked in user_id order and merge-joined,
+    so memory is bounded by one user's positions plus a write batch. With
+    apply=True drifted portfolios are rewritten in bulk, guarded by rev so a
+    trade that lands mid-rebuild is never overwritten. progress, if given, is
+    called with the running report after each portfolio.
+    """
+    t0 = time.perf_counter()
+    db = get_db()
+    report = RebuildReport()
+    match = {} if user_id is None else {"user_id": user_id}
+
+    portfolios = (
+        db[PORTFOLIOS]
+        .find(match, PORTFOLIO_PROJECTION)
+        .sort("user_id", -1)
+        .batch_size(batch_size)
+    )
+    trades = trades_repo.iter_replay(
+        user_id, batch_size=batch_size, projection=TRADE_PROJECTION
+    )
+    groups = groupby(trades, key=lambda t: t["user_id"])
+    pending = next(groups, None)
+    ops: List[UpdateOne] = []
+
+    for pf in portfolios:
+        uid = pf["user_id"]
+        # Trades for users without a portfolio sort ahead (user_id desc)
+        while pending is not None and pending[0] > uid:
+            report.orphan_users += 1
+            pending = next(groups, None)
+        user_trades: Iterator[Dict[str, Any]] = iter(())
+        if pending is not None and pending[0] == uid:
+            user_trades = pending[1]
+        report.portfolios += 1
+        if progress is not None:
+            progress(report)
+        derived = pf.get("contributed") is None
+        if derived:
+            # cash = start + fills' cash, so the start is what makes it match
+            report.missing_contributed += 1
+            rebuilt = replay(pf, user_trades, start_cash=0.0)
+            flows = rebuilt["cash"]
+            rebuilt["cash"] = float(pf.get("cash", 0.0))
+        else:
+            rebuilt = replay(pf, user_trades)
+        if pending is not None and pending[0] == uid:
+            pending = next(groups, None)
+
+        report.trades += rebuilt["trades"]
+        problems = diff(pf, rebuilt)
+        if not problems:
+            continue
+        if derived:
+            start = round(rebuilt["cash"] - flows, 2)
+            problems.append(f"cash not checked: no contributed (derived {start})")
+        report.drifted += 1
+        if len(report.samples) < max_samples:
+            report.samples.append({"user_id": str(uid), "problems": problems})
+        if apply:
+            ua = pf.get("updated_at")
+            if isinstance(ua, datetime):
+                if ua.tzinfo is None:
+                    ua = ua.replace(tzinfo=timezone.utc)
+                age = (datetime.now(timezone.utc) - ua).total_seconds()
+                if age < SETTLE_SECONDS:
+                    report.skipped_recent += 1
+                    continue
+            ops.append(
+                UpdateOne(
+                    {"user_id": uid, "rev": pf.get("rev", 0)},
+                    {
+                        "$set": {
+                            "cash": rebuilt["cash"],
+                            "realized_pl": rebuilt["realized_pl"],
+                            "positions": rebuilt["positions"],
+                            "updated_at": datetime.now(timezone.utc),
+                        },
+                        "$inc": {"rev": 1},
+                    },
+                )
+            )
+            if len(ops) >= 1000:
+                _flush(ops, report)
+    while pending is not None:
+        report.orphan_users += 1
+        pending = next(groups, None)
+    _flush(ops, report)
+
+    report.seconds = round(time.perf_counter() - t0, 3)
+    rate = report.trades / report.seconds * 60 if report.seconds else 0
+    logger.info(
+        f"Rebuild: {report.portfolios} portfolios, {report.trades} trades, "
+        f"{report.drifted} drifted, {report.rewritten} rewritten, "
+        f"{report.conflicts} conflicts, {report.missing_contributed} without "
+        f"contributed in {report.seconds}s ({rate:,.0f} trades/min)"
+    )
+    return report
+
+
+# Admin-triggered rebuilds run here, one at a time per worker; their state
+# lives in Mongo so any worker can report on a job another one started
+_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rebuild")
+# This process's jobs carry it, so one heartbeat covers the queue behind
+# the running job as well
+_OWNER = uuid.uuid4().hex
+
+
+def _heartbeat():
+    get_db()[REBUILD_JOBS].update_many(
+        {"owner": _OWNER, "state": {"$in": [QUEUED, RUNNING]}},
+        {"$set": {"heartbeat_at": datetime.now(timezone.utc)}},
+    )
+
+
+def start_job(user_id=None, apply: bool = False) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    job = {
+        "_id": ObjectId(),
+        "state": QUEUED,
+        "user_id": user_id,
+        "apply": apply,
+        "owner": _OWNER,
+        "created_at": now,
+        "heartbeat_at": now,
+    }
+    get_db()[REBUILD_JOBS].insert_one(job)
+    _jobs.submit(_run_job, job["_id"], user_id, apply)
+    return job
+
+
+def _run_job(job_id: ObjectId, user_id, apply: bool):
+    coll = get_db()[REBUILD_JOBS]
+    now = datetime.now(timezone.utc)
+    coll.update_one(
+        {"_id": job_id},
+        {"$set": {"state": RUNNING, "started_at": now, "heartbeat_at": now}},
+    )
+    last = time.monotonic()
+
+    def beat(_report: RebuildReport):
+        nonlocal last
+        if time.monotonic() - last >= HEARTBEAT_SECONDS:
+            last = time.monotonic()
+            _heartbeat()
+
+    try:
+        report = rebuild(user_id=user_id, apply=apply, progress=beat)
+    except Exception as e:
+        logger.error(f"Rebuild job {job_id} failed: {e}")
+        update: Dict[str, Any] = {"state": FAILED, "error": str(e)}
+    else:
+        update = {"state": DONE, "report": asdict(report)}
+    update["finished_at"] = datetime.now(timezone.utc)
+    coll.update_one({"_id": job_id}, {"$set": update})
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """The job; one left queued/running by a worker that stopped checking in
+    is marked failed first."""
+    try:
+        oid = ObjectId(job_id)
+    except Exception:
+        return None
+    coll = get_db()[REBUILD_JOBS]
+    job = coll.find_one({"_id": oid})
+    if job is None or job.get("state") not in (QUEUED, RUNNING):
+        return job
+    beat = job.get("heartbeat_at") or job.get("created_at")
+    if beat is not None and beat.tzinfo is None:
+        beat = beat.replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
+    if beat is None or (now - beat).total_seconds() <= STALE_JOB_SECONDS:
+        return job
+    coll.update_one(
+        {"_id": oid, "state": job["state"], "heartbeat_at": job.get("heartbeat_at")},
+        {
+            "$set": {
+                "state": FAILED,
+                "error": "worker stopped before the job finished (no heartbeat)",
+                "finished_at": now,
+            }
+        },
+    )
+    return coll.find_one({"_id": oid})
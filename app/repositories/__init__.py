@@ -1,4 +1,4 @@
 # Package export convenience
-from . import portfolios, sessions, trades, users
+from . import portfolios, sessions, snapshots, trades, users
 
-__all__ = ["users", "sessions", "portfolios", "trades"]
+__all__ = ["users", "sessions", "portfolios", "trades", "snapshots"]
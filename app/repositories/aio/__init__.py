@@ -0,0 +1,4 @@
+# Async (motor) counterparts of the read-heavy repositories, for async routes
+from . import portfolios, sessions, trades, users
+
+__all__ = ["users", "sessions", "portfolios", "trades"]
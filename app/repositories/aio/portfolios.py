@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from ...db import PORTFOLIOS, get_async_db
+from ...portfolio_cache import portfolio_cache
+from ..portfolios import DEFAULT_INITIAL_CASH, new_portfolio
+
+
+async def get(user_id, cached: bool = True) -> Optional[Dict[str, Any]]:
+    if cached:
+        doc = portfolio_cache.get(user_id)
+        if doc is not None:
+            return doc
+    db = get_async_db()
+    doc = await db[PORTFOLIOS].find_one({"user_id": user_id})
+    if doc:
+        portfolio_cache.put(doc)
+    return doc
+
+
+async def get_or_create(
+    user_id, initial_cash: float = DEFAULT_INITIAL_CASH
+) -> Dict[str, Any]:
+    doc = await get(user_id)
+    if doc:
+        return doc
+    db = get_async_db()
+    doc = new_portfolio(user_id, initial_cash)
+    try:
+        res = await db[PORTFOLIOS].insert_one(doc)
+    except DuplicateKeyError:
+        # created concurrently by another request
+        return await get(user_id, cached=False)
+    doc["_id"] = res.inserted_id
+    portfolio_cache.put(doc)
+    return doc
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from ...db import SESSIONS, get_async_db
+
+
+async def get_session(session_id: str) -> Optional[Dict[str, Any]]:
+    db = get_async_db()
+    return await db[SESSIONS].find_one({"session_id": session_id})
+
+
+async def touch_session(session_id: str, ttl_seconds: int) -> bool:
+    db = get_async_db()
+    now = datetime.now(timezone.utc)
+    res = await db[SESSIONS].update_one(
+        {"session_id": session_id},
+        {"$set": {"expires_at": now + timedelta(seconds=ttl_seconds)}},
+    )
+    return res.modified_count == 1
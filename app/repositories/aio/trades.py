@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ...db import TRADE_BUCKETS, TRADES, get_async_db
+from .. import trade_buckets
+from ..trade_query import (
+    HISTORY_SORT,
+    decode_cursor,
+    page_query,
+    pick,
+    projection,
+    split_page,
+)
+from ..trades import bucketed
+
+
+async def _from_buckets(
+    user_id, limit: int, *, token=None, side=None, start=None, end=None, before=None
+) -> List[Dict[str, Any]]:
+    db = get_async_db()
+    cur = (
+        db[TRADE_BUCKETS]
+        .find(
+            trade_buckets.bucket_query(
+                user_id, token=token, start=start, end=end, before=before
+            )
+        )
+        .sort("day", -1)
+        .batch_size(20)
+    )
+    out: List[Dict[str, Any]] = []
+    day: List[Dict[str, Any]] = []
+
+    def _take():
+        out.extend(
+            trade_buckets.select(
+                day, token=token, side=side, start=start, end=end, before=before
+            )
+        )
+
+    # buckets of one day are selected together (see trade_buckets.by_day)
+    async for bucket in cur:
+        if day and bucket["day"] != day[0]["day"]:
+            _take()
+            day = []
+            if len(out) >= limit:
+                break
+        day.append(bucket)
+    else:
+        _take()
+    await cur.close()
+    return out[:limit]
+
+
+async def list_recent(user_id, limit: int = 20) -> List[Dict[str, Any]]:
+    if bucketed():
+        return await _from_buckets(user_id, limit)
+    db = get_async_db()
+    cur = db[TRADES].find({"user_id": user_id}).sort(HISTORY_SORT).limit(limit)
+    return await cur.to_list(length=limit)
+
+
+async def list_page(
+    user_id,
+    *,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    token: Optional[str] = None,
+    side: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    fields: Optional[Iterable[str]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Async twin of repositories.trades.list_page (same query and cursor)."""
+    if bucketed():
+        proj = projection(fields)
+        docs = await _from_buckets(
+            user_id,
+            limit + 1,
+            token=token,
+            side=side,
+            start=start,
+            end=end,
+            before=decode_cursor(cursor) if cursor else None,
+        )
+        return split_page([pick(d, proj) for d in docs], limit)
+    db = get_async_db()
+    query = page_query(user_id, cursor, token=token, side=side, start=start, end=end)
+    cur = db[TRADES].find(query, projection(fields)).sort(HISTORY_SORT).limit(limit + 1)
+    return split_page(await cur.to_list(length=limit + 1), limit)
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+
+from ...db import USERS, get_async_db
+
+
+async def get_by_id(user_id: ObjectId | str) -> Optional[Dict[str, Any]]:
+    db = get_async_db()
+    oid = ObjectId(user_id) if not isinstance(user_id, ObjectId) else user_id
+    return await db[USERS].find_one({"_id": oid})
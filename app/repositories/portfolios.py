@@ -4,13 +4,21 @@ from datetime import datetime, timezone
 from typing import Any, Dict, Optional
 
 from ..db import PORTFOLIOS, get_db
+from ..portfolio_cache import portfolio_cache
 
 DEFAULT_INITIAL_CASH = 1000000.0
 
 
-def get(user_id) -> Optional[Dict[str, Any]]:
+def get(user_id, cached: bool = True) -> Optional[Dict[str, Any]]:
+    if cached:
+        doc = portfolio_cache.get(user_id)
+        if doc is not None:
+            return doc
     db = get_db()
-    return db[PORTFOLIOS].find_one({"user_id": user_id})
+    doc = db[PORTFOLIOS].find_one({"user_id": user_id})
+    if doc:
+        portfolio_cache.put(doc)
+    return doc
 
 
 def get_required(user_id) -> Dict[str, Any]:
@@ -23,23 +31,32 @@ def get_required(user_id) -> Dict[str, Any]:
 def get_or_create(
     user_id, initial_cash: float = DEFAULT_INITIAL_CASH
 ) -> Dict[str, Any]:
-    db = get_db()
-    doc = db[PORTFOLIOS].find_one({"user_id": user_id})
+    doc = get(user_id)
     if doc:
         return doc
+    db = get_db()
+    doc = new_portfolio(user_id, initial_cash)
+    res = db[PORTFOLIOS].insert_one(doc)
+    doc["_id"] = res.inserted_id
+    portfolio_cache.put(doc)
+    return doc
+
+
+def new_portfolio(
+    user_id, initial_cash: float = DEFAULT_INITIAL_CASH
+) -> Dict[str, Any]:
     now = datetime.now(timezone.utc)
-    doc = {
+    return {
         "user_id": user_id,
         "cash": float(initial_cash),
+        # initial cash + deposits; the baseline for return calculations
+        "contributed": float(initial_cash),
         "realized_pl": 0.0,
         "positions": {},
         "rev": 0,
         "created_at": now,
         "updated_at": now,
     }
-    res = db[PORTFOLIOS].insert_one(doc)
-    doc["_id"] = res.inserted_id
-    return doc
 
 
 def compare_and_swap(user_id, expected_rev: int, new_fields: Dict[str, Any]) -> bool:
@@ -51,4 +68,9 @@ def compare_and_swap(user_id, expected_rev: int, new_fields: Dict[str, Any]) ->
         {"user_id": user_id, "rev": expected_rev},
         {"$set": new_fields},
     )
-    return res.modified_count == 1
+    if res.modified_count == 1:
+        portfolio_cache.apply_cas(user_id, expected_rev, new_fields)
+        return True
+    # our cached copy (if any) is behind; the caller's retry re-reads Mongo
+    portfolio_cache.invalidate(user_id)
+    return False
@@ -38,6 +38,18 @@ def touch_session(session_id: str, ttl_seconds: int) -> bool:
     return res.modified_count == 1
 
 
+def revoke_session(session_id: str) -> int:
+    """Expire the session now and stamp revoked_at, which other workers'
+    session caches watch for; the TTL index removes the document later."""
+    db = get_db()
+    now = datetime.now(timezone.utc)
+    res = db[SESSIONS].update_one(
+        {"session_id": session_id},
+        {"$set": {"expires_at": now, "revoked_at": now}},
+    )
+    return res.modified_count
+
+
 def delete_session(session_id: str) -> int:
     db = get_db()
     res = db[SESSIONS].delete_one({"session_id": session_id})
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List
+
+from pymongo import UpdateOne
+
+from ..db import PORTFOLIO_SNAPSHOTS, get_db
+
+
+def upsert_many(docs: Iterable[Dict[str, Any]], batch_size: int = 1000) -> int:
+    """Upsert snapshot docs keyed by (user_id, date); returns docs written."""
+    db = get_db()
+    written = 0
+    ops: List[UpdateOne] = []
+    for doc in docs:
+        ops.append(
+            UpdateOne(
+                {"user_id": doc["user_id"], "date": doc["date"]},
+                {"$set": doc},
+                upsert=True,
+            )
+        )
+        if len(ops) >= batch_size:
+            db[PORTFOLIO_SNAPSHOTS].bulk_write(ops, ordered=False)
+            written += len(ops)
+            ops = []
+    if ops:
+        db[PORTFOLIO_SNAPSHOTS].bulk_write(ops, ordered=False)
+        written += len(ops)
+    return written
+
+
+def list_range(
+    user_id, start_date: str, end_date: str, limit: int = 1000
+) -> List[Dict[str, Any]]:
+    # dates are ISO 'YYYY-MM-DD' strings, so lexical order is chronological
+    db = get_db()
+    cur = (
+        db[PORTFOLIO_SNAPSHOTS]
+        .find(
+            {"user_id": user_id, "date": {"$gte": start_date, "$lte": end_date}},
+            {"_id": 0, "user_id": 0},
+        )
+        .sort("date", 1)
+        .limit(limit)
+    )
+    return list(cur)
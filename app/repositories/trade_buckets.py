@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ..config import settings
+from ..db import TRADE_BUCKETS, get_db
+from ..timeutils import IST
+
+# Bucketed trade storage: documents per user per IST trading day holding
+# that day's trades in an array, rolled over to a new bucket (seq + 1) after
+# TRADE_BUCKET_SIZE trades so none nears the 16 MB document limit. Lookups
+# go through (user_id, day) rather than three per-trade indexes; the one
+# per-trade index, unique on trades._id, is what makes inserts idempotent
+# across buckets. Reads are left to the planner (no hint), so a missing
+# index slows them down instead of failing them, as on `trades`.
+DUPLICATE_KEY = 11000
+
+# Keyset position: rows strictly older than (executed_at, _id) are returned
+Before = Optional[Tuple[datetime, ObjectId]]
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+
+def day_of(ts: datetime) -> str:
+    return _utc(ts).astimezone(IST).date().isoformat()
+
+
+def bucket_id(user_id, day: str, seq: int) -> str:
+    return f"{user_id}:{day}:{seq}"
+
+
+def _push(bid: str, seq: int, doc: Dict[str, Any], upsert: bool) -> UpdateOne:
+    trade = {k: v for k, v in doc.items() if k != "user_id"}
+    return UpdateOne(
+        # The $ne guard (over at most one bucket's trades) makes a replay into
+        # the same bucket a no-op; the unique trades._id index rejects a
+        # replay into a later bucket.
+        {"_id": bid, "trades._id": {"$ne": doc["_id"]}},
+        {
+            "$setOnInsert": {
+                "user_id": doc["user_id"],
+                "day": day_of(doc["executed_at"]),
+                "seq": seq,
+            },
+            "$push": {"trades": trade},
+            "$addToSet": {"tokens": doc.get("token")},
+            "$inc": {"n": 1},
+            "$min": {"first": doc["executed_at"]},
+            "$max": {"last": doc["executed_at"]},
+        },
+        upsert=upsert,
+    )
+
+
+def _plan(coll, docs: List[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    """(bucket _id, seq) for each doc: fill each user-day's newest bucket up
+    to TRADE_BUCKET_SIZE, then open the next seq.
+
+    Counts come from one read, so writers racing on the same user-day can
+    overshoot the size by at most their batch; it is a bound, not a quota.
+    """
+    size = max(1, settings.trade_bucket_size)
+    keys = {(d["user_id"], day_of(d["executed_at"])) for d in docs}
+    open_: Dict[Tuple[Any, str], Tuple[str, int, int]] = {}
+    query = {"$or": [{"user_id": u, "day": day} for u, day in keys]}
+    for b in coll.find(query, {"user_id": 1, "day": 1, "seq": 1, "n": 1}):
+        key = (b["user_id"], b["day"])
+        # buckets written before rollover have no seq and count as 0
+        seq = int(b.get("seq", 0))
+        if key not in open_ or seq > open_[key][1]:
+            open_[key] = (b["_id"], seq, int(b.get("n", 0)))
+    plan = []
+    for d in docs:
+        key = (d["user_id"], day_of(d["executed_at"]))
+        bid, seq, n = open_.get(key) or (bucket_id(*key, 0), 0, 0)
+        if n >= size:
+            seq, n = seq + 1, 0
+            bid = bucket_id(*key, seq)
+        open_[key] = (bid, seq, n + 1)
+        plan.append((bid, seq))
+    return plan
+
+
+def _stored_elsewhere(err: Dict[str, Any]) -> bool:
+    """Duplicate on the unique trades._id index, not on the bucket _id."""
+    return "trades._id" in str(err.get("keyPattern") or err.get("errmsg", ""))
+
+
+def insert_many(docs: List[Dict[str, Any]]) -> int:
+    """Append trades (with _id and executed_at set) to their buckets.
+
+    Idempotent per trade _id. A duplicate key on trades._id means the trade
+    is already stored and is skipped; one on the bucket _id means another
+    writer created the bucket first, and the trade is retried as a plain
+    (non-upsert) push.
+    """
+    if not docs:
+        return 0
+    coll = get_db()[TRADE_BUCKETS]
+    plan = _plan(coll, docs)
+    ops = [_push(bid, seq, d, True) for (bid, seq), d in zip(plan, docs)]
+    try:
+        res = coll.bulk_write(ops, ordered=False)
+        return res.modified_count + res.upserted_count
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICATE_KEY for err in errors):
+            raise
+        done = e.details.get("nModified", 0) + e.details.get("nUpserted", 0)
+        retry = [err["index"] for err in errors if not _stored_elsewhere(err)]
+    if not retry:
+        return done
+    ops = [_push(*plan[i], docs[i], False) for i in retry]
+    try:
+        res = coll.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICATE_KEY for err in errors):
+            raise
+        return done + e.details.get("nModified", 0)
+    return done + res.modified_count
+
+
+def insert(doc: Dict[str, Any]) -> Dict[str, Any]:
+    insert_many([doc])
+    return doc
+
+
+def bucket_query(
+    user_id,
+    *,
+    token: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Before = None,
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"user_id": user_id}
+    if token:
+        query["tokens"] = token
+    days: Dict[str, Any] = {}
+    if start is not None:
+        days["$gte"] = day_of(start)
+    upper = [t for t in (end, before[0] if before else None) if t is not None]
+    if upper:
+        days["$lte"] = day_of(min(_utc(t) for t in upper))
+    if days:
+        query["day"] = days
+    return query
+
+
+def select(
+    buckets: Iterable[Dict[str, Any]],
+    *,
+    token: Optional[str] = None,
+    side: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Before = None,
+    newest_first: bool = True,
+) -> List[Dict[str, Any]]:
+    """The buckets' trades matching the filters, in keyset order.
+
+    Pass every bucket of a day together (see by_day): a replayed or
+    concurrent trade can land in a later seq than newer trades.
+    """
+    out = []
+    for bucket, t in ((b, t) for b in buckets for t in b.get("trades", ())):
+        ts = _utc(t["executed_at"])
+        if token and t.get("token") != token:
+            continue
+        if side and t.get("side") != side:
+            continue
+        if start is not None and ts < _utc(start):
+            continue
+        if end is not None and ts > _utc(end):
+            continue
+        if before is not None and (ts, t["_id"]) >= (_utc(before[0]), before[1]):
+            continue
+        out.append({**t, "user_id": bucket["user_id"]})
+    out.sort(key=lambda t: (_utc(t["executed_at"]), t["_id"]), reverse=newest_first)
+    return out
+
+
+def by_day(
+    buckets: Iterable[Dict[str, Any]],
+) -> Iterator[List[Dict[str, Any]]]:
+    """Group a cursor sorted by (user, day) into each user-day's buckets."""
+    for _, group in groupby(buckets, key=lambda b: (b["user_id"], b["day"])):
+        yield list(group)
+
+
+def iter_trades(
+    user_id,
+    *,
+    token: Optional[str] = None,
+    side: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Before = None,
+    batch_size: int = 50,
+) -> Iterator[Dict[str, Any]]:
+    """Newest-first trades for one user, read a bucket (day) at a time."""
+    cur = (
+        get_db()[TRADE_BUCKETS]
+        .find(bucket_query(user_id, token=token, start=start, end=end, before=before))
+        .sort("day", -1)
+        .batch_size(batch_size)
+    )
+    try:
+        for day in by_day(cur):
+            yield from select(
+                day, token=token, side=side, start=start, end=end, before=before
+            )
+    finally:
+        cur.close()
+
+
+def iter_replay(user_id=None, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """All trades grouped by user (user_id desc), oldest first within a user."""
+    match = {} if user_id is None else {"user_id": user_id}
+    cur = (
+        get_db()[TRADE_BUCKETS]
+        .find(match)
+        .sort([("user_id", -1), ("day", 1)])
+        .batch_size(batch_size)
+    )
+    for day in by_day(cur):
+        yield from select(day, newest_first=False)
+
+
+def delete_all_for_user(user_id) -> int:
+    coll = get_db()[TRADE_BUCKETS]
+    n = 0
+    for b in coll.find({"user_id": user_id}, {"n": 1}):
+        n += int(b.get("n", 0))
+    coll.delete_many({"user_id": user_id})
+    return n
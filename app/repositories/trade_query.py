@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+# Query building shared by the sync (repositories.trades) and async
+# (repositories.aio.trades) history readers, so both page identically.
+
+# Keyset order for history reads; backed by ix_trades_user_time_id. No hint:
+# the planner picks that index on its own, and a hint would turn an index
+# not yet built (fresh database, readiness still running) into an error.
+HISTORY_SORT = [("executed_at", -1), ("_id", -1)]
+
+TRADE_FIELDS = (
+    "symbol",
+    "token",
+    "side",
+    "quantity",
+    "price",
+    "amount",
+    "realized_pl",
+    "executed_at",
+)
+
+
+def pick(doc: Dict[str, Any], proj: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    if proj is None:
+        return doc
+    return {k: v for k, v in doc.items() if proj.get(k)}
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    ts = doc["executed_at"]
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    # Mongo stores millisecond precision, so this round-trips exactly
+    raw = f"{int(ts.timestamp() * 1000)}:{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ms_str, oid_str = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        ts = datetime.fromtimestamp(int(ms_str) / 1000, tz=timezone.utc)
+        return ts, ObjectId(oid_str)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def history_filter(
+    user_id,
+    *,
+    token: Optional[str] = None,
+    side: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"user_id": user_id}
+    if token:
+        query["token"] = token
+    if side:
+        query["side"] = side
+    time_range: Dict[str, Any] = {}
+    if start is not None:
+        time_range["$gte"] = start
+    if end is not None:
+        time_range["$lte"] = end
+    if time_range:
+        query["executed_at"] = time_range
+    return query
+
+
+def projection(fields: Optional[Iterable[str]]) -> Optional[Dict[str, int]]:
+    if not fields:
+        return None
+    proj = {f: 1 for f in fields if f in TRADE_FIELDS}
+    # Keyset columns are always needed to build the next cursor
+    proj["executed_at"] = 1
+    proj["_id"] = 1
+    return proj
+
+
+def page_query(user_id, cursor: Optional[str], **filters) -> Dict[str, Any]:
+    query = history_filter(user_id, **filters)
+    if not cursor:
+        return query
+    ts, oid = decode_cursor(cursor)
+    return {
+        "$and": [
+            query,
+            {
+                "$or": [
+                    {"executed_at": {"$lt": ts}},
+                    {"executed_at": ts, "_id": {"$lt": oid}},
+                ]
+            },
+        ]
+    }
+
+
+def split_page(
+    docs: List[Dict[str, Any]], limit: int
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    # limit + 1 rows were requested; the extra one only signals another page
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1])
+    return docs, None
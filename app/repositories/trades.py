@@ -1,27 +1,157 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Any, Dict, List
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from ..config import settings
 from ..db import TRADES, get_db
+from . import trade_buckets
+from .trade_query import (
+    HISTORY_SORT,
+    decode_cursor,
+    history_filter,
+    page_query,
+    pick,
+    projection,
+    split_page,
+)
+
+# Reverse walk of ix_trades_user_time_id: user_id desc, then oldest trade first
+REPLAY_SORT = [("user_id", -1), ("executed_at", 1), ("_id", 1)]
+DUPLICATE_KEY = 11000
+
+
+def bucketed() -> bool:
+    """TRADES_STORAGE=buckets keeps trades in per-user per-day documents."""
+    return settings.trades_storage == "buckets"
 
 
 def insert_trade(doc: Dict[str, Any]) -> Dict[str, Any]:
     db = get_db()
     if "executed_at" not in doc:
         doc["executed_at"] = datetime.now(timezone.utc)
+    if bucketed():
+        doc.setdefault("_id", ObjectId())
+        return trade_buckets.insert(doc)
     res = db[TRADES].insert_one(doc)
     doc["_id"] = res.inserted_id
     return doc
 
 
+def insert_many(docs: List[Dict[str, Any]]) -> int:
+    """Insert trades that already carry _id; already-stored ones are skipped."""
+    if not docs:
+        return 0
+    if bucketed():
+        return trade_buckets.insert_many(docs)
+    try:
+        return len(get_db()[TRADES].insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICATE_KEY for err in errors):
+            raise
+        return e.details.get("nInserted", 0)
+
+
 def list_recent(user_id, limit: int = 20) -> List[Dict[str, Any]]:
+    if bucketed():
+        return list(islice(trade_buckets.iter_trades(user_id), limit))
     db = get_db()
-    cur = db[TRADES].find({"user_id": user_id}).sort("executed_at", -1).limit(limit)
+    cur = db[TRADES].find({"user_id": user_id}).sort(HISTORY_SORT).limit(limit)
     return list(cur)
 
 
+def list_page(
+    user_id,
+    *,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    token: Optional[str] = None,
+    side: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    fields: Optional[Iterable[str]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of history, newest first, plus the cursor for the next page.
+
+    Pages seek past (executed_at, _id) of the previous page's last row, so the
+    cost of a page does not grow with how deep into the history it is.
+    """
+    if bucketed():
+        before = decode_cursor(cursor) if cursor else None
+        proj = projection(fields)
+        rows = trade_buckets.iter_trades(
+            user_id, token=token, side=side, start=start, end=end, before=before
+        )
+        return split_page([pick(d, proj) for d in islice(rows, limit + 1)], limit)
+    db = get_db()
+    query = page_query(user_id, cursor, token=token, side=side, start=start, end=end)
+    cur = db[TRADES].find(query, projection(fields)).sort(HISTORY_SORT).limit(limit + 1)
+    return split_page(list(cur), limit)
+
+
+def iter_history(
+    user_id,
+    *,
+    token: Optional[str] = None,
+    side: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    fields: Optional[Iterable[str]] = None,
+    batch_size: int = 1000,
+) -> Iterator[Dict[str, Any]]:
+    """Stream the full (filtered) history; the driver fetches batch_size rows at a time."""
+    if bucketed():
+        proj = projection(fields)
+        for d in trade_buckets.iter_trades(
+            user_id, token=token, side=side, start=start, end=end
+        ):
+            yield pick(d, proj)
+        return
+    db = get_db()
+    query = history_filter(user_id, token=token, side=side, start=start, end=end)
+    cur = (
+        db[TRADES]
+        .find(query, projection(fields))
+        .sort(HISTORY_SORT)
+        .batch_size(batch_size)
+    )
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+
+def iter_replay(
+    user_id=None, batch_size: int = 10000, projection: Optional[Dict[str, int]] = None
+) -> Iterator[Dict[str, Any]]:
+    """Every trade grouped by user (user_id desc), oldest first within a user."""
+    if bucketed():
+        for d in trade_buckets.iter_replay(
+            user_id, batch_size=max(1, batch_size // 100)
+        ):
+            yield pick(d, projection)
+        return
+    match = {} if user_id is None else {"user_id": user_id}
+    cur = (
+        get_db()[TRADES]
+        .find(match, projection)
+        .sort(REPLAY_SORT)
+        .batch_size(batch_size)
+    )
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+
 def delete_all_for_user(user_id) -> int:
+    if bucketed():
+        return trade_buckets.delete_all_for_user(user_id)
     db = get_db()
     res = db[TRADES].delete_many({"user_id": user_id})
     return res.deleted_count
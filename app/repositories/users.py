@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Optional
 
 from bson import ObjectId
 
@@ -23,6 +23,20 @@ def create_user(username: str, password: str) -> Dict[str, Any]:
     return doc
 
 
+def update_password_hash(user_id: ObjectId, password_hash: str) -> bool:
+    db = get_db()
+    res = db[USERS].update_one(
+        {"_id": user_id},
+        {
+            "$set": {
+                "password_hash": password_hash,
+                "updated_at": datetime.now(timezone.utc),
+            }
+        },
+    )
+    return res.modified_count == 1
+
+
 def get_by_username(username: str) -> Optional[Dict[str, Any]]:
     db = get_db()
     return db[USERS].find_one({"username": username})
@@ -32,3 +46,10 @@ def get_by_id(user_id: ObjectId | str) -> Optional[Dict[str, Any]]:
     db = get_db()
     oid = ObjectId(user_id) if not isinstance(user_id, ObjectId) else user_id
     return db[USERS].find_one({"_id": oid})
+
+
+def get_usernames(user_ids: Iterable[ObjectId | str]) -> Dict[str, str]:
+    db = get_db()
+    oids = [ObjectId(u) if not isinstance(u, ObjectId) else u for u in user_ids]
+    cur = db[USERS].find({"_id": {"$in": oids}}, {"username": 1})
+    return {str(d["_id"]): d["username"] for d in cur}
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from . import deadline, scheduler
+from .config import settings
+from .timeutils import bar_time
+
+Window = Tuple[datetime, datetime]
+
+# Windows separated by less than this are treated as touching
+ADJACENT = timedelta(minutes=1)
+
+
+class Rows(list):
+    """Bars, plus the upstream windows that got no answer (failed calls, an
+    open circuit, or no time left). Empty missing means the fetch is whole."""
+
+    def __init__(self, rows=(), missing: Optional[List[Window]] = None):
+        super().__init__(rows)
+        self.missing: List[Window] = list(missing or ())
+
+
+Run = Callable[[List[Window]], Rows]
+
+
+def missing_in(rows: List[list], lo: datetime, hi: datetime) -> List[Window]:
+    """The windows of rows.missing that overlap [lo, hi]."""
+    return [w for w in getattr(rows, "missing", ()) if w[0] <= hi and w[1] >= lo]
+
+
+def merge_windows(
+    windows: List[Window], joinable: Callable[[Window, Window], bool]
+) -> List[Window]:
+    """Sorted union of windows; a gap is bridged when joinable(left, right)."""
+    out: List[Window] = []
+    for lo, hi in sorted(windows):
+        if out and (lo <= out[-1][1] + ADJACENT or joinable(out[-1], (lo, hi))):
+            out[-1] = (out[-1][0], max(out[-1][1], hi))
+        else:
+            out.append((lo, hi))
+    return out
+
+
+class _Request:
+    __slots__ = (
+        "window",
+        "deadline",
+        "priority",
+        "rows",
+        "missing",
+        "error",
+        "finished",
+        "wake",
+    )
+
+    def __init__(self, window: Window):
+        self.window = window
+        self.deadline = deadline.current()
+        self.priority = scheduler.current()
+        self.rows: List[list] = []
+        self.missing: List[Window] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        # set when the rows are in, or when this caller is handed a batch to lead
+        self.wake = threading.Event()
+
+
+class RequestPlanner:
+    """Coalesces concurrent fetches of the same series into one upstream plan.
+
+    The first caller for a key becomes the leader: it waits merge_ms for
+    company, takes every pending window for the key, merges overlapping or
+    adjacent ones and runs the merged plan once. Each caller then gets the
+    rows inside its own window, and the unanswered windows that overlap it.
+    Callers arriving while a batch is in flight queue for the next one, which
+    the finishing leader hands to one of them; meanwhile they raise the
+    in-flight batch's priority class to their own. A queued caller that waits
+    longer than follower_wait_ms (or its deadline) fetches its window alone.
+    """
+
+    def __init__(self, merge_ms: int, follower_wait_ms: int):
+        self.merge_s = max(0, merge_ms) / 1000.0
+        self.follower_wait_s = max(0, follower_wait_ms) / 1000.0
+        self._lock = threading.Lock()
+        self._pending: Dict[Hashable, List[_Request]] = {}
+        self._active: set = set()
+        # key -> priority lane of the batch in flight for it
+        self._lanes: Dict[Hashable, scheduler.Lane] = {}
+        self.requests = 0
+        self.batches = 0
+        self.windows = 0
+        self.solo = 0
+
+    def fetch(
+        self,
+        key: Hashable,
+        start: datetime,
+        end: datetime,
+        run: Run,
+        joinable: Callable[[Window, Window], bool] = lambda a, b: False,
+    ) -> Rows:
+        req = _Request((start, end))
+        with self._lock:
+            self.requests += 1
+            self._pending.setdefault(key, []).append(req)
+            follower = key in self._active
+            self._active.add(key)
+            lane = self._lanes.get(key)
+            if follower and lane is not None:
+                # the batch in flight holds this caller up
+                lane.escalate(req.priority)
+        if follower and not self._wait(key, req):
+            return self._solo(req, run)
+        if not req.finished:
+            # first in, or handed the next batch (which includes this request)
+            self._lead(key, run, joinable)
+        if req.error is not None:
+            raise req.error
+        return Rows(req.rows, req.missing)
+
+    def _wait(self, key: Hashable, req: _Request) -> bool:
+        """Wait to be answered or handed the lead; False once the wait runs
+        past follower_wait_s or the caller's deadline (req is then withdrawn)."""
+        left = deadline.remaining()
+        limit = self.follower_wait_s
+        if left is not None:
+            limit = min(limit, max(0.0, left))
+        if req.wake.wait(limit):
+            return True
+        with self._lock:
+            if req.wake.is_set():
+                return True
+            queue = self._pending.get(key)
+            if queue is not None and req in queue:
+                queue.remove(req)
+                if not queue:
+                    del self._pending[key]
+            # else a batch holding req is in flight; its answer is dropped
+            self.solo += 1
+        return False
+
+    def _solo(self, req: _Request, run: Run) -> Rows:
+        lo, hi = req.window
+        rows = run([req.window])
+        return Rows(
+            [row for row in rows if row and lo <= bar_time(row[0]) <= hi],
+            missing_in(rows, lo, hi),
+        )
+
+    def _lead(self, key: Hashable, run: Run, joinable):
+        if self.merge_s:
+            time.sleep(self.merge_s)
+        # the merged fetch runs at the most urgent caller's priority (raised
+        # by callers queueing behind it), until the most patient one's deadline
+        with self._lock:
+            batch = self._pending.pop(key, [])
+            lane = scheduler.Lane(
+                scheduler.most_urgent(
+                    [r.priority for r in batch] or [scheduler.current()]
+                )
+            )
+            self._lanes[key] = lane
+        windows: List[Window] = []
+        limits = [r.deadline for r in batch]
+        until = None if None in limits or not limits else max(limits)
+        try:
+            windows = merge_windows([r.window for r in batch], joinable)
+            with deadline.deadline_at(until), scheduler.priority(lane):
+                rows = run(windows)
+            stamped = [(bar_time(row[0]), row) for row in rows if row]
+            for r in batch:
+                lo, hi = r.window
+                r.rows = [row for ts, row in stamped if lo <= ts <= hi]
+                r.missing = missing_in(rows, lo, hi)
+        except BaseException as e:
+            for r in batch:
+                r.error = e
+        with self._lock:
+            self._lanes.pop(key, None)
+            self.batches += 1
+            self.windows += len(windows)
+            nxt = self._pending.get(key)
+            if nxt:
+                nxt[0].wake.set()
+            else:
+                self._active.discard(key)
+        for r in batch:
+            r.finished = True
+            r.wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "merged_windows": self.windows,
+            "solo": self.solo,
+            "in_flight": len(self._active),
+        }
+
+
+request_planner = RequestPlanner(
+    settings.candle_merge_ms, settings.candle_follower_wait_ms
+)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import math
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import TTLCache
+from .candles import fetch_historical_chunked
+from .config import settings
+from .logger import logger
+from .timeutils import end_of_day_ist, now_ist, start_of_day_ist
+
+NIFTY_TOKEN = "99926000"
+TRADING_DAYS = 252
+
+# Closes are shared across users; results are per (user, rev, trading day)
+_closes_cache = TTLCache(ttl_seconds=6 * 3600, max_items=4096)
+_risk_cache = TTLCache(ttl_seconds=24 * 3600, max_items=10000)
+
+
+def _daily_closes(token: str, day: str, lookback_days: int) -> Dict[str, float]:
+    key = (token, day, lookback_days)
+    hit = _closes_cache.get(key)
+    if hit is not None:
+        return hit
+    end = end_of_day_ist(now_ist())
+    start = start_of_day_ist(end - timedelta(days=lookback_days))
+    closes: Dict[str, float] = {}
+    try:
+        for row in fetch_historical_chunked("NSE", token, "ONE_DAY", start, end):
+            if row and len(row) >= 5:
+                closes[str(row[0])[:10]] = float(row[4])
+    except Exception as e:
+        logger.warning(f"Daily closes unavailable for {token}: {e}")
+    if closes:
+        _closes_cache.set(key, closes)
+    return closes
+
+
+def close_matrix(
+    tokens: List[str], day: str, lookback_days: int
+) -> Tuple[List[str], np.ndarray]:
+    """Aligned symbols x days matrix of closes (gaps forward-filled).
+
+    Leading days where any symbol has no price yet are dropped so every column
+    is fully populated.
+    """
+    series = [_daily_closes(t, day, lookback_days) for t in tokens]
+    dates = sorted(set().union(*series)) if series else []
+    m = np.full((len(tokens), len(dates)), np.nan)
+    col = {d: j for j, d in enumerate(dates)}
+    for i, s in enumerate(series):
+        for d, c in s.items():
+            m[i, col[d]] = c
+    if not dates:
+        return dates, m
+    # forward fill along days
+    idx = np.where(~np.isnan(m), np.arange(m.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    m = np.take_along_axis(m, idx, axis=1)
+    complete = ~np.isnan(m).any(axis=0)
+    first = int(np.argmax(complete)) if complete.any() else len(dates)
+    return dates[first:], m[:, first:]
+
+
+def aligned_closes(token: str, dates: List[str], day: str, lookback_days: int):
+    """One token's closes on the given dates (forward-filled; NaN before first)."""
+    closes = _daily_closes(token, day, lookback_days)
+    out = np.full(len(dates), np.nan)
+    last = np.nan
+    for j, d in enumerate(dates):
+        last = closes.get(d, last)
+        out[j] = last
+    return out
+
+
+def _f(x: float) -> Optional[float]:
+    return None if x is None or not math.isfinite(x) else round(float(x), 6)
+
+
+def compute_risk(
+    qty: np.ndarray, closes: np.ndarray, bench: np.ndarray, risk_free: float
+) -> Dict[str, Any]:
+    """Risk stats for fixed quantities over a symbols x days close matrix."""
+    value = qty @ closes
+    out: Dict[str, Any] = {"observations": int(closes.shape[1])}
+    if closes.shape[1] < 3 or not (value > 0).all():
+        return out
+    port_ret = value[1:] / value[:-1] - 1.0
+    sym_ret = closes[:, 1:] / closes[:, :-1] - 1.0
+
+    vol = port_ret.std(ddof=1) * math.sqrt(TRADING_DAYS)
+    ann_ret = port_ret.mean() * TRADING_DAYS
+    peak = np.maximum.accumulate(value)
+    out["annualized_volatility"] = _f(vol)
+    out["annualized_return"] = _f(ann_ret)
+    out["sharpe"] = _f((ann_ret - risk_free) / vol) if vol > 0 else None
+    out["max_drawdown"] = _f(float((value / peak - 1.0).min()))
+    out["symbol_volatility"] = [
+        _f(v) for v in sym_ret.std(axis=1, ddof=1) * math.sqrt(TRADING_DAYS)
+    ]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = np.corrcoef(sym_ret) if len(qty) > 1 else np.ones((1, 1))
+    out["correlation"] = [[_f(c) for c in row] for row in np.atleast_2d(corr)]
+
+    if bench.size == closes.shape[1] and np.isfinite(bench).all() and (bench > 0).all():
+        bench_ret = bench[1:] / bench[:-1] - 1.0
+        var_b = bench_ret.var(ddof=1)
+        cov = np.cov(port_ret, bench_ret, ddof=1)[0, 1]
+        out["beta"] = _f(cov / var_b) if var_b > 0 else None
+    return out
+
+
+def portfolio_risk(portfolio: Dict[str, Any]) -> Dict[str, Any]:
+    """Risk for the current positions, cached per (user, rev, trading day)."""
+    day = now_ist().date().isoformat()
+    lookback = settings.risk_lookback_days
+    key = (str(portfolio["user_id"]), int(portfolio.get("rev", 0)), day, lookback)
+    hit = _risk_cache.get(key)
+    if hit is not None:
+        return hit
+
+    positions = {
+        tok: p
+        for tok, p in (portfolio.get("positions") or {}).items()
+        if int(p.get("quantity", 0)) > 0
+    }
+    tokens = sorted(positions)
+    result: Dict[str, Any] = {
+        "as_of": day,
+        "lookback_days": lookback,
+        "benchmark": NIFTY_TOKEN,
+        "symbols": [positions[t].get("symbol", t) for t in tokens],
+        "tokens": tokens,
+    }
+    if tokens:
+        dates, m = close_matrix(tokens, day, lookback)
+        bench = aligned_closes(NIFTY_TOKEN, dates, day, lookback)
+        qty = np.array([float(positions[t]["quantity"]) for t in tokens])
+        result.update(compute_risk(qty, m, bench, settings.risk_free_rate))
+        if dates:
+            result["from"], result["to"] = dates[0], dates[-1]
+    # don't pin a transient upstream failure for the rest of the day
+    if not tokens or result.get("observations", 0) >= 3:
+        _risk_cache.set(key, result)
+    return result
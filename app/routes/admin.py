@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from ..cluster import cluster
+from ..config import settings
+from ..db import pool_stats
+from ..deps import require_admin, require_csrf
+from ..instruments import instruments
+from ..ledger import ledger_writer
+from ..portfolio_cache import portfolio_cache
+from ..rebuild import get_job, start_job
+from ..repositories import users as users_repo
+from ..request_planner import request_planner
+from ..smartapi_client import smart_mgr
+
+router = APIRouter(
+    prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)]
+)
+
+
+def _job_out(job: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: v for k, v in job.items() if k not in ("_id", "user_id", "owner")}
+    out["job_id"] = str(job["_id"])
+    out["user_id"] = str(job["user_id"]) if job.get("user_id") else None
+    return out
+
+
+@router.post(
+    "/portfolios/rebuild",
+    status_code=202,
+    dependencies=[Depends(require_csrf)],
+)
+def rebuild_portfolios(
+    username: Optional[str] = Query(None),
+    apply: bool = Query(False),
+) -> Dict[str, Any]:
+    """Queue a ledger replay; poll GET /portfolios/rebuild/{job_id}."""
+    uid = None
+    if username:
+        user = users_repo.get_by_username(username)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        uid = user["_id"]
+    return _job_out(start_job(user_id=uid, apply=apply))
+
+
+@router.get("/portfolios/rebuild/{job_id}")
+def rebuild_status(job_id: str) -> Dict[str, Any]:
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_out(job)
+
+
+@router.post("/instruments/reload", dependencies=[Depends(require_csrf)])
+def reload_instruments(force: bool = Query(True)) -> Dict[str, Any]:
+    try:
+        swapped = instruments.reload(force=force)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+    # a forced reload touches the CSV, so the other workers' watchers (if
+    # enabled) see a new mtime and reload from the snapshot written here
+    watched = force and settings.instruments_watch_seconds > 0
+    return {
+        "ok": True,
+        "reloaded": swapped,
+        "count": len(instruments),
+        "scope": "all" if watched else "worker",
+        "pid": os.getpid(),
+    }
+
+
+@router.get("/db/pool")
+def db_pool() -> Dict[str, Any]:
+    """Checkout latency and saturation for this worker's Mongo pools."""
+    return {**pool_stats(), "portfolio_cache": portfolio_cache.stats()}
+
+
+@router.get("/ledger")
+def ledger_stats() -> Dict[str, Any]:
+    """Write-behind trade ledger queue depth for this worker."""
+    return ledger_writer.stats()
+
+
+@router.get("/smartapi")
+def smartapi_stats() -> Dict[str, Any]:
+    """Historical fetch planning (caller requests vs merged batches sent
+    upstream), circuit breaker state and call queue depth for this worker,
+    plus its role in multi-process mode."""
+    return {
+        "planner": request_planner.stats(),
+        "circuits": {
+            "historical": smart_mgr.hist.breaker.stats(),
+            "trading": smart_mgr.trade.breaker.stats(),
+        },
+        "scheduler": smart_mgr.hist.scheduler.stats(),
+        "cluster": cluster.stats(),
+    }
+
+
+@router.post("/ledger/flush", dependencies=[Depends(require_csrf)])
+def ledger_flush() -> Dict[str, Any]:
+    ok = ledger_writer.flush()
+    if not ok:
+        raise HTTPException(status_code=503, detail="Ledger flush failed; will retry")
+    return {"ok": True, **ledger_writer.stats()}
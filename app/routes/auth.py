@@ -7,15 +7,35 @@ from pymongo.errors import DuplicateKeyError
 
 from ..auth import clear_session_cookies, set_session_cookies
 from ..config import settings
-from ..deps import current_user
+from ..deps import current_user, invalidate_session, invalidate_user
+from ..logger import logger
 from ..repositories import sessions as sessions_repo
 from ..repositories import users as users_repo
 from ..schemas import LoginRequest, SignupRequest, UserOut
-from ..security import verify_password
+from ..security import HasherBusy, hash_password, needs_rehash, verify_password
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 
+def _too_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many sign-in attempts; please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
+def _upgrade_hash(user, password: str) -> None:
+    # Best effort: a busy pool just means the upgrade waits for the next login
+    try:
+        users_repo.update_password_hash(user["_id"], hash_password(password))
+        invalidate_user(user["_id"])
+    except HasherBusy:
+        pass
+    except Exception as e:
+        logger.warning(f"Password hash upgrade failed: {e}")
+
+
 def _user_out(user_doc) -> UserOut:
     ca = user_doc.get("created_at")
     iso = ca.isoformat() if isinstance(ca, datetime) else str(ca)
@@ -35,6 +55,8 @@ def signup(payload: SignupRequest, response: Response):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Username already exists"
         )
+    except HasherBusy:
+        raise _too_busy()
     sess = sessions_repo.create_session(
         user["_id"], ttl_seconds=settings.session_ttl_seconds
     )
@@ -49,10 +71,16 @@ def login(payload: LoginRequest, response: Response):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials"
         )
-    if not verify_password(payload.password, user["password_hash"]):
+    try:
+        ok = verify_password(payload.password, user["password_hash"])
+    except HasherBusy:
+        raise _too_busy()
+    if not ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials"
         )
+    if needs_rehash(user["password_hash"]):
+        _upgrade_hash(user, payload.password)
     sess = sessions_repo.create_session(
         user["_id"], ttl_seconds=settings.session_ttl_seconds
     )
@@ -64,7 +92,8 @@ def login(payload: LoginRequest, response: Response):
 def logout(response: Response, request: Request):
     sid = request.cookies.get(settings.session_cookie_name)
     if sid:
-        sessions_repo.delete_session(sid)
+        sessions_repo.revoke_session(sid)
+        invalidate_session(sid)
     clear_session_cookies(response)
     return {"ok": True}
 
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from ..deps import current_user
+from ..instruments import instruments
+from ..schemas import BacktestRequest
+from ..timeutils import last_n_days_endpoints, parse_iso_ist
+
+router = APIRouter(prefix="/api", tags=["backtest"])
+
+INTERVALS = (
+    "ONE_MINUTE",
+    "THREE_MINUTE",
+    "FIVE_MINUTE",
+    "TEN_MINUTE",
+    "FIFTEEN_MINUTE",
+    "THIRTY_MINUTE",
+    "ONE_HOUR",
+    "ONE_DAY",
+)
+
+
+@router.post("/backtest")
+def backtest(req: BacktestRequest, user=Depends(current_user)) -> Dict[str, Any]:
+    # NumPy-backed; imported on first use to keep worker startup light
+    from ..backtest import Strategy, fetch_raw, ohlcv_from_raw, run_backtest
+
+    ins = None
+    if req.symbol:
+        ins = instruments.find_by_symbol(req.symbol)
+    elif req.token:
+        ins = instruments.find_by_token(req.token)
+    if not ins:
+        raise HTTPException(status_code=404, detail="Instrument not found in CSV")
+    if req.interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail="Unsupported interval")
+    try:
+        strategy = Strategy.from_dict(req.strategy)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if req.frm and req.to:
+        start, end = parse_iso_ist(req.frm), parse_iso_ist(req.to)
+    else:
+        start, end = last_n_days_endpoints(365)
+
+    bars = ohlcv_from_raw(fetch_raw(ins.token, req.interval, start, end))  # type: ignore
+    try:
+        result = run_backtest(strategy, bars)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "symbol": ins.symbol,
+        "token": ins.token,
+        "interval": req.interval,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        **result,
+    }
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import json
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple, get_args
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from ..candles import Interval, load_candles, normalize_candles, request_range
+from ..config import settings
+from ..instruments import instruments
+from ..schemas import CandleBatchItem, CandleBatchRequest
+
+router = APIRouter(prefix="/api", tags=["candles"])
+
+INTERVALS = get_args(Interval)
+
+# Shared by all batch requests. Upstream calls still pass through the
+# historical session throttle, so more workers overlap SmartAPI latency (and
+# candle store / archive reads) without raising the request rate.
+_pool = ThreadPoolExecutor(
+    max_workers=max(1, settings.candle_batch_workers), thread_name_prefix="candles"
+)
+
+Key = Tuple[str, str, str, str]
+
+
+def _resolve(item: CandleBatchItem) -> Tuple[Key, Dict[str, Any], datetime, datetime]:
+    """(dedup key, response header, start, end) for one entry; ValueError if
+    invalid."""
+    ins = None
+    if item.symbol:
+        ins = instruments.find_by_symbol(item.symbol)
+    elif item.token:
+        ins = instruments.find_by_token(item.token)
+    if not ins:
+        raise ValueError("Instrument not found in CSV")
+    if item.interval not in INTERVALS:
+        raise ValueError("Unsupported interval")
+    if bool(item.frm) != bool(item.to):
+        raise ValueError("from and to must be given together")
+    start, end = request_range(item.interval, item.frm, item.to)  # type: ignore
+    head = {
+        "symbol": ins.symbol,
+        "token": ins.token,
+        "exchange": "NSE",
+        "interval": item.interval,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+    }
+    # the default range moves with the clock, so key it by "default" instead
+    span = (head["from"], head["to"]) if item.frm else ("", "")
+    return (ins.token, item.interval, *span), head, start, end
+
+
+def _fetch(head: Dict[str, Any], start: datetime, end: datetime) -> Dict[str, Any]:
+    try:
+        raw, source, stale = load_candles(
+            head["symbol"], head["token"], head["interval"], start, end
+        )
+    except Exception as e:
+        return {**head, "error": str(e)}
+    return {
+        **head,
+        "source": source,
+        "stale": stale,
+        "series": normalize_candles(raw),
+    }
+
+
+def _stream(
+    errors: List[Dict[str, Any]], futures: Dict[Future, List[int]]
+) -> Iterator[str]:
+    for err in errors:
+        yield json.dumps(err) + "\n"
+    for fut in as_completed(futures):
+        yield json.dumps({"index": futures[fut], **fut.result()}) + "\n"
+
+
+@router.post("/candles/batch")
+def candles_batch(req: CandleBatchRequest):
+    if len(req.items) > settings.candle_batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.candle_batch_max_items} items per batch",
+        )
+    if not settings.angel_hist_api_key:
+        raise HTTPException(
+            status_code=500, detail="ANGEL_HIST_API_KEY missing in .env"
+        )
+
+    # identical (token, interval, range) entries share one fetch
+    slots: Dict[Key, List[int]] = {}
+    jobs: Dict[Key, Tuple[Dict[str, Any], datetime, datetime]] = {}
+    errors: List[Dict[str, Any]] = []
+    for i, item in enumerate(req.items):
+        try:
+            key, *job = _resolve(item)
+        except ValueError as e:
+            errors.append({"index": [i], "error": str(e)})
+            continue
+        slots.setdefault(key, []).append(i)
+        jobs.setdefault(key, tuple(job))  # type: ignore
+
+    futures = {_pool.submit(_fetch, *jobs[k]): idx for k, idx in slots.items()}
+    if req.stream:
+        return StreamingResponse(
+            _stream(errors, futures), media_type="application/x-ndjson"
+        )
+
+    results: List[Any] = [None] * len(req.items)
+    for err in errors:
+        results[err["index"][0]] = {"error": err["error"]}
+    for fut in as_completed(futures):
+        res = fut.result()
+        for i in futures[fut]:
+            results[i] = res
+    return {"results": results, "fetches": len(futures)}
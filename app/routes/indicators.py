@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from ..candles import (
+    Interval,
+    _is_intraday,
+    load_candles,
+    normalize_candles,
+    request_range,
+)
+from ..config import settings
+from ..instruments import instruments
+
+router = APIRouter(prefix="/api", tags=["indicators"])
+
+
+@router.get("/indicators")
+def get_indicators(
+    ind: str = Query(..., min_length=1, max_length=200),
+    symbol: Optional[str] = Query(None),
+    token: Optional[str] = Query(None),
+    interval: Interval = Query("ONE_DAY"),
+    frm: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = Query(None),
+) -> Dict[str, Any]:
+    # NumPy-backed; imported on first use to keep worker startup light
+    from ..indicator_series import canonical_spec, get_series
+
+    ins = None
+    if symbol:
+        ins = instruments.find_by_symbol(symbol)
+    elif token:
+        ins = instruments.find_by_token(token)
+    if not ins:
+        raise HTTPException(status_code=404, detail="Instrument not found in CSV")
+    try:
+        spec = canonical_spec(ind)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not settings.angel_hist_api_key:
+        raise HTTPException(
+            status_code=500, detail="ANGEL_HIST_API_KEY missing in .env"
+        )
+
+    start, end = request_range(interval, frm, to)
+    raw, source, stale = load_candles(ins.symbol, ins.token, interval, start, end)
+    series = normalize_candles(raw)
+    result, updated = get_series(
+        ins.token, interval, spec, series, _is_intraday(interval)
+    )
+    return {
+        "symbol": ins.symbol,
+        "token": ins.token,
+        "exchange": "NSE",
+        "interval": interval,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "source": source,
+        "stale": stale,
+        "ind": spec,
+        # -1: computed over the whole series; n >= 0: n bars applied to cached state
+        "updated_bars": updated,
+        **result.payload(),
+    }
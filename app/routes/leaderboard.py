@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from ..deps import current_user
+from ..leaderboard import RankBy, leaderboard
+from ..repositories import users as users_repo
+from ..schemas import LeaderboardEntry, LeaderboardRankOut
+
+router = APIRouter(prefix="/api", tags=["leaderboard"])
+
+
+@router.get("/leaderboard", response_model=List[LeaderboardEntry])
+def top_users(
+    by: RankBy = Query("value"),
+    limit: int = Query(20, ge=1, le=100),
+    user=Depends(current_user),
+):
+    rows = leaderboard.top(by=by, limit=limit)
+    names = users_repo.get_usernames(r["user_id"] for r in rows)
+    return [
+        LeaderboardEntry(
+            rank=r["rank"],
+            username=names.get(r["user_id"], "?"),
+            value=r["value"],
+            return_pct=round(r["ret"] * 100, 2),
+        )
+        for r in rows
+    ]
+
+
+@router.get("/leaderboard/me", response_model=LeaderboardRankOut)
+def my_rank(user=Depends(current_user)):
+    r = leaderboard.rank_of(user["_id"])
+    if not r:
+        raise HTTPException(status_code=404, detail="No portfolio yet")
+    return LeaderboardRankOut(
+        rank_value=r["rank_value"],
+        rank_return=r["rank_return"],
+        total=r["total"],
+        value=r["value"],
+        return_pct=round(r["ret"] * 100, 2),
+    )
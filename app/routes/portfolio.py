@@ -1,13 +1,26 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 
-from ..deps import current_user, require_csrf
+from ..deps import current_user, current_user_async, require_csrf
+from ..leaderboard import leaderboard
+from ..ledger import ledger_writer
 from ..repositories import portfolios as portfolios_repo
+from ..repositories import snapshots as snapshots_repo
 from ..repositories import trades as trades_repo
-from ..schemas import DepositRequest, PortfolioOut, PortfolioPosition
+from ..repositories.aio import portfolios as aio_portfolios
+from ..repositories.portfolios import DEFAULT_INITIAL_CASH
+from ..schemas import (
+    DepositRequest,
+    PortfolioOut,
+    PortfolioPosition,
+    PortfolioRiskOut,
+    PortfolioSnapshotOut,
+)
+from ..timeutils import now_ist
 
 router = APIRouter(prefix="/api", tags=["portfolio"])
 
@@ -35,11 +48,35 @@ def _portfolio_out(doc) -> PortfolioOut:
 
 
 @router.get("/portfolio", response_model=PortfolioOut)
-def get_my_portfolio(user=Depends(current_user)):
-    doc = portfolios_repo.get_or_create(user["_id"])
+async def get_my_portfolio(user=Depends(current_user_async)):
+    doc = await aio_portfolios.get_or_create(user["_id"])
     return _portfolio_out(doc)
 
 
+@router.get("/portfolio/history", response_model=List[PortfolioSnapshotOut])
+def get_portfolio_history(
+    user=Depends(current_user),
+    frm: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = Query(None),
+):
+    try:
+        end = date.fromisoformat(to) if to else now_ist().date()
+        start = date.fromisoformat(frm) if frm else end - timedelta(days=365)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    docs = snapshots_repo.list_range(user["_id"], start.isoformat(), end.isoformat())
+    return [PortfolioSnapshotOut(**d) for d in docs]
+
+
+@router.get("/portfolio/risk", response_model=PortfolioRiskOut)
+def get_portfolio_risk(user=Depends(current_user)):
+    # NumPy-backed; imported on first use to keep worker startup light
+    from ..risk import portfolio_risk
+
+    doc = portfolios_repo.get_or_create(user["_id"])
+    return PortfolioRiskOut(**portfolio_risk(doc))
+
+
 @router.post(
     "/portfolio/deposit",
     response_model=PortfolioOut,
@@ -65,11 +102,15 @@ def deposit(req: DepositRequest, user=Depends(current_user)):
             )
 
         new_cash = round(cash + amt, 2)
+        contributed = float(doc.get("contributed", DEFAULT_INITIAL_CASH))
         ok = portfolios_repo.compare_and_swap(
-            user["_id"], doc["rev"], {"cash": new_cash}
+            user["_id"],
+            doc["rev"],
+            {"cash": new_cash, "contributed": round(contributed + amt, 2)},
         )
         if ok:
             updated = portfolios_repo.get_or_create(user["_id"])
+            leaderboard.on_portfolio(updated)
             return _portfolio_out(updated)
     raise HTTPException(status_code=409, detail="Concurrent update; please retry")
 
@@ -86,15 +127,22 @@ def reset_portfolio(user=Depends(current_user)):
         ok = portfolios_repo.compare_and_swap(
             user["_id"],
             doc["rev"],
-            {"cash": float(MAX_CASH), "realized_pl": 0.0, "positions": {}},
+            {
+                "cash": float(MAX_CASH),
+                "contributed": float(MAX_CASH),
+                "realized_pl": 0.0,
+                "positions": {},
+            },
         )
         if ok:
             break
     else:
         raise HTTPException(status_code=409, detail="Concurrent update; please retry")
 
-    # Wipe user's trades
+    # Wipe user's trades (queued write-behind trades first, so none land after)
+    ledger_writer.flush()
     trades_repo.delete_all_for_user(user["_id"])
 
     updated = portfolios_repo.get_or_create(user["_id"])
+    leaderboard.on_portfolio(updated)
     return _portfolio_out(updated)
@@ -1,15 +1,26 @@
 from __future__ import annotations
 
-from datetime import timedelta
-from typing import Any, Dict, List
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException
 
+from .. import deadline, scheduler
 from ..candles import fallback_daily_if_empty, normalize_candles
-from ..timeutils import is_market_open, now_ist
+from ..cluster import cluster
+from ..config import settings
+from ..leaderboard import leaderboard
+from ..timeutils import bar_time, is_market_open, now_ist
 
 router = APIRouter(prefix="/api", tags=["prices"])
 
+MAX_DEADLINE_MS = 15000
+# Shared minute bars count as live only if the newest one ended this recently
+SHARED_BAR_MAX_AGE = timedelta(minutes=1)
+
 
 def _downsample(series: List[dict], max_points: int) -> List[dict]:
     n = len(series)
@@ -22,6 +33,101 @@ def _downsample(series: List[dict], max_points: int) -> List[dict]:
     return out
 
 
+def _shared_minutes(tok: str, start: datetime) -> Optional[List[list]]:
+    """Minute bars since start from the leader's shared quote ring, if it
+    published this token recently, its newest bar is current and the ring
+    reaches back to start. None means fetch instead."""
+    rows, updated = cluster.latest_quotes(tok)
+    if not rows or time.time() - updated > settings.shared_quote_fresh_seconds:
+        return None
+    # a recent publish can still carry old bars (e.g. a fetch of a past window)
+    newest = bar_time(rows[-1][0]) + timedelta(minutes=1)
+    if now_ist() - newest > SHARED_BAR_MAX_AGE or bar_time(rows[0][0]) > start:
+        return None
+    recent = [r for r in rows if bar_time(r[0]) >= start]
+    return recent or None
+
+
+def _token_payload(
+    tok: str, minutes: int, include_series: bool, series_points: int
+) -> Dict[str, Any]:
+    now = now_ist()
+    start = now - timedelta(minutes=minutes + 1)
+    try:
+        # Primary: recent minute candles, from shared memory when fresh
+        raw = _shared_minutes(tok, start)
+        if raw is None:
+            raw = fallback_daily_if_empty("NSE", tok, "ONE_MINUTE", start, now)
+        series = normalize_candles(raw)
+        last = float(series[-1]["c"]) if series else None
+        leaderboard.on_price(tok, last)
+
+        payload: Dict[str, Any] = {"last": last}
+        if last is None and getattr(raw, "missing", None):
+            # upstream did not answer (circuit open, failures, out of fetch
+            # budget): not a real "no price", so the client keeps what it has
+            payload["pending"] = True
+        if include_series:
+            compact: List[Dict[str, Any]] = [{"t": s["t"], "c": s["c"]} for s in series]
+
+            # If series is too short (e.g., market closed), fetch last 30 days daily for sparkline
+            if len(compact) < 3 and not deadline.expired():
+                dstart = now - timedelta(days=30)
+                draw = fallback_daily_if_empty("NSE", tok, "ONE_DAY", dstart, now)
+                dser = normalize_candles(draw)
+                compact = [{"t": s["t"], "c": s["c"]} for s in dser][-series_points:]
+
+            payload["series"] = _downsample(compact, series_points)
+        return payload
+    except Exception:
+        payload = {"last": None}
+        if include_series:
+            payload["series"] = []
+        return payload
+
+
+# Per-token work for this worker. A token still being fetched for an earlier
+# call (same parameters) is joined rather than fetched again, so repeated
+# polls against a slow upstream do not pile up. The fetch runs under its own
+# LIVE_PRICES_FETCH_MS deadline, not the poll's deadline_ms (callers stop
+# waiting, it keeps working), and its result answers the next poll for one
+# poll interval, so a token slower than deadline_ms still gets its price on
+# the following poll.
+_pool = ThreadPoolExecutor(
+    max_workers=max(1, settings.live_prices_workers), thread_name_prefix="prices"
+)
+_inflight: Dict[Tuple[str, int, bool, int], Future] = {}
+_done_at: Dict[Tuple[str, int, bool, int], float] = {}
+_inflight_lock = threading.Lock()
+
+
+def _submit(key: Tuple[str, int, bool, int]) -> Future:
+    fresh = settings.live_poll_ms / 1000.0
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        if fut is not None and (
+            not fut.done() or time.monotonic() - _done_at.get(key, 0.0) < fresh
+        ):
+            return fut
+        fut = _pool.submit(_run_token, key)
+        _inflight[key] = fut
+        _done_at.pop(key, None)
+
+    def done(_f, key=key):
+        with _inflight_lock:
+            if _inflight.get(key) is _f:
+                _done_at[key] = time.monotonic()
+
+    fut.add_done_callback(done)
+    return fut
+
+
+def _run_token(key: Tuple[str, int, bool, int]) -> Dict[str, Any]:
+    budget = max(0.1, settings.live_prices_fetch_ms / 1000.0)
+    with deadline.within(budget), scheduler.priority(scheduler.LIVE):
+        return _token_payload(*key)
+
+
 @router.post("/prices/live")
 def batch_live_prices(req: Dict[str, Any]) -> Dict[str, Any]:
     # Lightweight schema parsing to avoid tight coupling
@@ -29,6 +135,8 @@ def batch_live_prices(req: Dict[str, Any]) -> Dict[str, Any]:
     minutes = int(req.get("minutes", 15))
     include_series = bool(req.get("include_series", True))
     series_points = int(req.get("series_points", 40))
+    budget_ms = int(req.get("deadline_ms", settings.live_prices_deadline_ms))
+    budget_ms = max(100, min(budget_ms, MAX_DEADLINE_MS))
 
     if not tokens:
         raise HTTPException(status_code=400, detail="tokens required")
@@ -36,36 +144,23 @@ def batch_live_prices(req: Dict[str, Any]) -> Dict[str, Any]:
         tokens = tokens[:60]
 
     now = now_ist()
-    start = now - timedelta(minutes=minutes + 1)
+    until = time.monotonic() + budget_ms / 1000.0
+    futures = {
+        tok: _submit((tok, minutes, include_series, series_points)) for tok in tokens
+    }
+    wait(futures.values(), timeout=max(0.0, until - time.monotonic()))
 
     result: Dict[str, Dict[str, Any]] = {}
-    for tok in tokens:
-        try:
-            # Primary: recent minute candles
-            raw = fallback_daily_if_empty("NSE", tok, "ONE_MINUTE", start, now)
-            series = normalize_candles(raw)
-            last = float(series[-1]["c"]) if series else None
-
-            payload: Dict[str, Any] = {"last": last}
-            if include_series:
-                compact: List[Dict[str, Any]] = [
-                    {"t": s["t"], "c": s["c"]} for s in series
-                ]
-
-                # If series is too short (e.g., market closed), fetch last 30 days daily for sparkline
-                if len(compact) < 3:
-                    dstart = now - timedelta(days=30)
-                    draw = fallback_daily_if_empty("NSE", tok, "ONE_DAY", dstart, now)
-                    dser = normalize_candles(draw)
-                    compact = [{"t": s["t"], "c": s["c"]} for s in dser][
-                        -series_points:
-                    ]
-
-                payload["series"] = _downsample(compact, series_points)
-
-            result[tok] = payload
-        except Exception:
-            result[tok] = {"last": None}
+    pending: List[str] = []
+    for tok, fut in futures.items():
+        if fut.done():
+            result[tok] = fut.result()
+            if result[tok].get("pending"):
+                pending.append(tok)
+        else:
+            # still fetching; the client keeps its previous value and asks again
+            pending.append(tok)
+            result[tok] = {"last": None, "pending": True}
             if include_series:
                 result[tok]["series"] = []
 
@@ -74,4 +169,6 @@ def batch_live_prices(req: Dict[str, Any]) -> Dict[str, Any]:
         "market_open": is_market_open(),
         "server_time": now.isoformat(),
         "prices": result,
+        "pending": pending,
+        "deadline_ms": budget_ms,
     }
@@ -1,17 +1,28 @@
 from __future__ import annotations
 
+import csv
+import io
+import json
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, Iterator, List, Literal, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
-from ..deps import current_user, require_csrf
+from ..deps import current_user, current_user_async, require_csrf
+from ..instruments import instruments
 from ..repositories import trades as trades_repo
-from ..schemas import TradeOut, TradeRequest
+from ..repositories.trade_query import TRADE_FIELDS
+from ..repositories.aio import trades as aio_trades
+from ..schemas import Side, TradeHistoryOut, TradeOut, TradeRequest
+from ..timeutils import parse_iso_ist
 from ..trading import execute_trade
 
 router = APIRouter(prefix="/api", tags=["trades"])
 
+EXPORT_BATCH = 1000
+
 
 def _trade_out(doc) -> TradeOut:
     ea = doc.get("executed_at")
@@ -28,6 +39,47 @@ def _trade_out(doc) -> TradeOut:
     )
 
 
+def _trade_dict(doc, fields: List[str]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for f in fields:
+        if f not in doc:
+            continue
+        val = doc[f]
+        if isinstance(val, datetime):
+            val = val.isoformat()
+        out[f] = val
+    return out
+
+
+def _parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(TRADE_FIELDS)
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in TRADE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return wanted
+
+
+def _history_filters(
+    symbol: Optional[str], side: Optional[str], frm: Optional[str], to: Optional[str]
+) -> Dict[str, Any]:
+    token = None
+    if symbol:
+        ins = instruments.find_by_symbol(symbol)
+        if not ins:
+            raise HTTPException(status_code=404, detail="Instrument not found in CSV")
+        token = ins.token
+    try:
+        start = parse_iso_ist(frm) if frm else None
+        end = parse_iso_ist(to) if to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid from/to datetime")
+    return {"token": token, "side": side, "start": start, "end": end}
+
+
 @router.post(
     "/trades",
     response_model=TradeOut,
@@ -53,8 +105,88 @@ def create_trade(payload: TradeRequest, user=Depends(current_user)):
 
 
 @router.get("/trades/recent", response_model=List[TradeOut])
-def list_recent_trades(
-    user=Depends(current_user), limit: int = Query(20, ge=1, le=100)
+async def list_recent_trades(
+    user=Depends(current_user_async), limit: int = Query(20, ge=1, le=100)
 ):
-    docs = trades_repo.list_recent(user["_id"], limit=limit)
+    docs = await aio_trades.list_recent(user["_id"], limit=limit)
     return [_trade_out(d) for d in docs]
+
+
+@router.get("/trades/history", response_model=TradeHistoryOut)
+async def trade_history(
+    user=Depends(current_user_async),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    symbol: Optional[str] = Query(None),
+    side: Optional[Side] = Query(None),
+    frm: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = Query(None),
+    fields: Optional[str] = Query(
+        None, description="comma-separated, e.g. symbol,side,price"
+    ),
+):
+    wanted = _parse_fields(fields)
+    # the instrument lookup may load the CSV snapshot; keep it off the loop
+    filters = await run_in_threadpool(_history_filters, symbol, side, frm, to)
+    try:
+        docs, next_cursor = await aio_trades.list_page(
+            user["_id"], limit=limit, cursor=cursor, fields=wanted, **filters
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return TradeHistoryOut(
+        items=[_trade_dict(d, wanted) for d in docs], next_cursor=next_cursor
+    )
+
+
+def _export_csv(docs: Iterator[Dict[str, Any]], fields: List[str]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for i, doc in enumerate(docs, start=1):
+        row = _trade_dict(doc, fields)
+        writer.writerow([row.get(f, "") for f in fields])
+        if i % EXPORT_BATCH == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    yield buf.getvalue()
+
+
+def _export_ndjson(docs: Iterator[Dict[str, Any]], fields: List[str]) -> Iterator[str]:
+    lines: List[str] = []
+    for doc in docs:
+        lines.append(json.dumps(_trade_dict(doc, fields)))
+        if len(lines) >= EXPORT_BATCH:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+@router.get("/trades/export")
+def export_trades(
+    user=Depends(current_user),
+    fmt: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    symbol: Optional[str] = Query(None),
+    side: Optional[Side] = Query(None),
+    frm: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
+):
+    wanted = _parse_fields(fields)
+    filters = _history_filters(symbol, side, frm, to)
+    docs = trades_repo.iter_history(
+        user["_id"], fields=wanted, batch_size=EXPORT_BATCH, **filters
+    )
+    if fmt == "csv":
+        body = _export_csv(docs, wanted)
+        media_type = "text/csv"
+    else:
+        body = _export_ndjson(docs, wanted)
+        media_type = "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="trades.{fmt}"'},
+    )
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+from . import deadline
+
+# Priority classes for SmartAPI calls, most urgent first
+FILL = "fill"
+LIVE = "live"
+INTERACTIVE = "interactive"
+PREFETCH = "prefetch"
+RANKS: Dict[str, int] = {FILL: 0, LIVE: 1, INTERACTIVE: 2, PREFETCH: 3}
+
+
+def most_urgent(classes: List[str]) -> str:
+    return min(classes, key=lambda c: RANKS.get(c, RANKS[INTERACTIVE]))
+
+
+class Lane:
+    """A priority class that other threads can raise while work runs under
+    it: work done on behalf of several callers keeps up with the most urgent
+    one, including callers that start waiting on it midway."""
+
+    def __init__(self, cls: str):
+        self.cls = cls
+        self._lock = threading.Lock()
+
+    def escalate(self, cls: str):
+        with self._lock:
+            self.cls = most_urgent([self.cls, cls])
+
+
+# Class of the work the current thread is doing; set at entry points
+# (trade fills, live prices, background refreshes). Unset means interactive.
+_priority: ContextVar[Union[str, Lane]] = ContextVar("priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(cls: Union[str, Lane]) -> Iterator[None]:
+    if (cls.cls if isinstance(cls, Lane) else cls) not in RANKS:
+        raise ValueError(f"Unknown priority class: {cls}")
+    token = _priority.set(cls)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current() -> str:
+    cls = _priority.get()
+    return cls.cls if isinstance(cls, Lane) else cls
+
+
+class _Waiter:
+    __slots__ = ("cls", "since")
+
+    def __init__(self, cls: str, since: float):
+        self.cls = cls
+        self.since = since
+
+
+class PriorityScheduler:
+    """Hands out call slots (one per min_interval) by priority class.
+
+    Fills have their own queue and always go first, so no amount of queued
+    background work can hold a trade fill back by more than the call in
+    progress. The other classes share one queue ordered by rank with aging:
+    each aging_seconds of waiting is worth one rank, so prefetch work queued
+    long enough overtakes newer interactive calls instead of starving.
+    Because every waiter ages at the same rate, the ordering key
+    (rank * aging_seconds + enqueue time) never changes while queued.
+    """
+
+    def __init__(self, min_interval: float, aging_seconds: float):
+        self.min_interval = min_interval
+        self.aging = max(aging_seconds, 1e-3)
+        self._cond = threading.Condition()
+        self._fills: List[Tuple[Tuple[float, int], _Waiter]] = []
+        self._queue: List[Tuple[Tuple[float, int], _Waiter]] = []
+        self._seq = itertools.count()
+        self._last = 0.0
+        self._depth = {c: 0 for c in RANKS}
+        self._granted = {c: 0 for c in RANKS}
+        self._expired = {c: 0 for c in RANKS}
+        self._wait_total = {c: 0.0 for c in RANKS}
+        self._wait_max = {c: 0.0 for c in RANKS}
+
+    def _head(self):
+        if self._fills:
+            return self._fills[0][1]
+        if self._queue:
+            return self._queue[0][1]
+        return None
+
+    def acquire(self, cls: str):
+        """Block until it is this caller's turn to call upstream. Raises
+        DeadlineExceeded if the current deadline passes while queued."""
+        cls = cls if cls in RANKS else INTERACTIVE
+        now = time.monotonic()
+        me = _Waiter(cls, now)
+        if cls == FILL:
+            heap, key = self._fills, (now, next(self._seq))
+        else:
+            heap, key = self._queue, (RANKS[cls] * self.aging + now, next(self._seq))
+        entry = (key, me)
+        with self._cond:
+            heapq.heappush(heap, entry)
+            self._depth[cls] += 1
+            try:
+                while True:
+                    wait_for = None
+                    if self._head() is me:
+                        gap = self._last + self.min_interval - time.monotonic()
+                        if gap <= 0:
+                            break
+                        wait_for = gap
+                    left = deadline.remaining()
+                    if left is not None:
+                        if left <= 0:
+                            self._expired[cls] += 1
+                            raise deadline.DeadlineExceeded(
+                                "Deadline passed while queued for SmartAPI"
+                            )
+                        wait_for = left if wait_for is None else min(wait_for, left)
+                    self._cond.wait(wait_for)
+            except BaseException:
+                heap.remove(entry)
+                heapq.heapify(heap)
+                self._depth[cls] -= 1
+                self._cond.notify_all()
+                raise
+            heapq.heappop(heap)
+            self._depth[cls] -= 1
+            self._last = time.monotonic()
+            waited = self._last - me.since
+            self._granted[cls] += 1
+            self._wait_total[cls] += waited
+            self._wait_max[cls] = max(self._wait_max[cls], waited)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "queued": sum(self._depth.values()),
+                "classes": {
+                    c: {
+                        "queued": self._depth[c],
+                        "granted": self._granted[c],
+                        "expired": self._expired[c],
+                        "wait_ms_avg": round(
+                            1000 * self._wait_total[c] / max(self._granted[c], 1), 1
+                        ),
+                        "wait_ms_max": round(1000 * self._wait_max[c], 1),
+                    }
+                    for c in RANKS
+                },
+            }
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Annotated, Dict, Literal, Optional
+from typing import Annotated, Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 from pydantic.types import StringConstraints
@@ -41,6 +41,49 @@ class PortfolioOut(BaseModel):
     rev: int
 
 
+class PortfolioSnapshotOut(BaseModel):
+    date: str
+    nav: float
+    cash: float
+    holdings_value: float
+    invested: float
+    unrealized_pl: float
+    realized_pl: float
+
+
+class PortfolioRiskOut(BaseModel):
+    as_of: str
+    lookback_days: int
+    benchmark: str
+    symbols: List[str]
+    tokens: List[str]
+    observations: int = 0
+    annualized_volatility: Optional[float] = None
+    annualized_return: Optional[float] = None
+    sharpe: Optional[float] = None
+    beta: Optional[float] = None
+    max_drawdown: Optional[float] = None
+    symbol_volatility: List[Optional[float]] = []
+    correlation: List[List[Optional[float]]] = []
+    frm: Optional[str] = Field(None, alias="from")
+    to: Optional[str] = None
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    username: str
+    value: float
+    return_pct: float
+
+
+class LeaderboardRankOut(BaseModel):
+    rank_value: int
+    rank_return: int
+    total: int
+    value: float
+    return_pct: float
+
+
 Side = Literal["BUY", "SELL"]
 
 
@@ -62,6 +105,36 @@ class TradeOut(BaseModel):
     executed_at: str
 
 
+class TradeHistoryOut(BaseModel):
+    # items carry only the requested fields (see ?fields=)
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
+class BacktestRequest(BaseModel):
+    symbol: Optional[str] = None
+    token: Optional[str] = None
+    interval: str = "ONE_DAY"
+    frm: Optional[str] = Field(None, alias="from")
+    to: Optional[str] = None
+    # { signal: {type, ...params}, sizing: {type, value}, initial_cash }
+    strategy: Dict[str, Any]
+
+
+class CandleBatchItem(BaseModel):
+    symbol: Optional[str] = None
+    token: Optional[str] = None
+    interval: str = "ONE_DAY"
+    frm: Optional[str] = Field(None, alias="from")
+    to: Optional[str] = None
+
+
+class CandleBatchRequest(BaseModel):
+    items: List[CandleBatchItem] = Field(min_length=1)
+    # NDJSON, one line per distinct fetch as it completes
+    stream: bool = False
+
+
 # New: deposit request for adding cash
 class DepositRequest(BaseModel):
     amount: Annotated[float, Field(gt=0, lt=1_000_000_000)]
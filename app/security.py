@@ -1,19 +1,77 @@
 import base64
 import hashlib
+import multiprocessing
 import os
 import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from .config import settings
+from .logger import logger
 
 ALGO = "pbkdf2_sha256"
-ITERATIONS = 200_000
+ITERATIONS = settings.password_iterations
 SALT_BYTES = 16
 KEY_LEN = 32
 
 
+class HasherBusy(RuntimeError):
+    """Raised instead of queueing when the hashing pool is saturated."""
+
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+# in-flight + queued derivations; anything beyond is rejected
+_SLOTS = threading.BoundedSemaphore(max(1, settings.hash_max_pending))
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int, dklen: int) -> bytes:
+    return hashlib.pbkdf2_hmac(
+        "sha256", password.encode("utf-8"), salt, iterations, dklen=dklen
+    )
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                # spawn: never fork a threaded server process
+                _POOL = ProcessPoolExecutor(
+                    max_workers=settings.hash_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _POOL
+
+
+def shutdown_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+
+
+def _derive(password: str, salt: bytes, iterations: int, dklen: int) -> bytes:
+    if settings.hash_workers <= 0:
+        return _pbkdf2(password, salt, iterations, dklen)
+    if not _SLOTS.acquire(blocking=False):
+        raise HasherBusy("Password hashing capacity exceeded")
+    try:
+        return _get_pool().submit(_pbkdf2, password, salt, iterations, dklen).result()
+    except BrokenProcessPool:
+        # a worker died; start a fresh pool for the next call
+        shutdown_pool()
+        raise
+    finally:
+        _SLOTS.release()
+
+
 def hash_password(password: str) -> str:
     salt = os.urandom(SALT_BYTES)
-    dk = hashlib.pbkdf2_hmac(
-        "sha256", password.encode("utf-8"), salt, ITERATIONS, dklen=KEY_LEN
-    )
+    dk = _derive(password, salt, ITERATIONS, KEY_LEN)
     return f"{ALGO}${ITERATIONS}${base64.b64encode(salt).decode()}${base64.b64encode(dk).decode()}"
 
 
@@ -25,9 +83,20 @@ def verify_password(password: str, stored: str) -> bool:
         iterations = int(iters_str)
         salt = base64.b64decode(b64_salt.encode())
         expected = base64.b64decode(b64_hash.encode())
-        dk = hashlib.pbkdf2_hmac(
-            "sha256", password.encode("utf-8"), salt, iterations, dklen=len(expected)
-        )
-        return secrets.compare_digest(dk, expected)
-    except Exception:
+        dk = _derive(password, salt, iterations, len(expected))
+    except HasherBusy:
+        # surfaced as 429 by the login route
+        raise
+    except Exception as e:
+        if not isinstance(e, ValueError):
+            logger.error(f"Password verification failed: {e!r}")
         return False
+    return secrets.compare_digest(dk, expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    try:
+        algo, iters_str, _, _ = stored.split("$")
+        return algo != ALGO or int(iters_str) != ITERATIONS
+    except Exception:
+        return True
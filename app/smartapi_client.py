@@ -1,14 +1,19 @@
+from __future__ import annotations
+
 import json
 import threading
 import time
-from typing import Any, Dict, Literal, Optional, cast
-
-import pyotp
-from SmartApi import SmartConnect
+from typing import TYPE_CHECKING, Any, Dict, Literal, Optional, cast
 
+from . import scheduler
+from .circuit import CircuitBreaker, CircuitOpenError
+from .cluster import cluster
 from .config import settings
 from .logger import logger
 
+if TYPE_CHECKING:
+    from SmartApi import SmartConnect
+
 SessionType = Literal["historical", "trading"]
 
 
@@ -22,17 +27,20 @@ class _SessionState:
         self.feed_token: Optional[str] = None
 
         self.login_lock = threading.Lock()
-        self.call_lock = threading.Lock()
         self.min_interval_sec = 0.25
-        self._last_call_ts = 0.0
+        self.scheduler = scheduler.PriorityScheduler(
+            self.min_interval_sec, settings.smartapi_aging_seconds
+        )
+        self.breaker = CircuitBreaker(
+            label,
+            failure_threshold=settings.smartapi_breaker_failures,
+            reset_seconds=settings.smartapi_breaker_reset_seconds,
+            slow_call_seconds=settings.smartapi_slow_call_ms / 1000.0,
+        )
 
     def throttle(self):
-        with self.call_lock:
-            now = time.time()
-            elapsed = now - self._last_call_ts
-            if elapsed < self.min_interval_sec:
-                time.sleep(self.min_interval_sec - elapsed)
-            self._last_call_ts = time.time()
+        # one call per min_interval_sec, granted by priority class
+        self.scheduler.acquire(scheduler.current())
 
 
 class SmartAPIManager:
@@ -65,6 +73,10 @@ class SmartAPIManager:
                 logger.error(f"{sess.label} api_key is missing. Check .env")
                 raise RuntimeError(f"{sess.label} api_key missing")
             logger.info(f"Logging in SmartAPI {sess.label} session")
+            # Deferred: SmartApi (and requests) cost ~100 ms at import time
+            import pyotp
+            from SmartApi import SmartConnect
+
             client = SmartConnect(sess.api_key)
 
             try:
@@ -100,6 +112,9 @@ class SmartAPIManager:
             logger.info(f"SmartAPI {sess.label} login OK")
 
     def ensure_logged_in(self):
+        # in multi-process mode only the leader holds SmartAPI sessions
+        if cluster.is_follower():
+            return
         if settings.angel_hist_api_key:
             self._ensure_session(self.hist)
         if settings.angel_market_api_key:
@@ -108,24 +123,64 @@ class SmartAPIManager:
     def get_candles(
         self, exchange: str, symboltoken: str, interval: str, fromdate: str, todate: str
     ) -> Dict[str, Any]:
-        self._ensure_session(self.hist)
-        params: Dict[str, Any] = {
-            "exchange": exchange,
-            "symboltoken": symboltoken,
-            "interval": interval,
-            "fromdate": fromdate,
-            "todate": todate,
-        }
+        if cluster.is_follower():
+            return self._forward_candles(
+                exchange, symboltoken, interval, fromdate, todate
+            )
+        data = self._get_candles(exchange, symboltoken, interval, fromdate, todate)
+        cluster.publish(symboltoken, interval, data)
+        return data
+
+    def _forward_candles(self, *args: str) -> Dict[str, Any]:
+        # The leader's breaker decides; mirroring its rejections here lets
+        # this worker fail fast (and serve stale bars) without a round trip
+        breaker = self.hist.breaker
+        breaker.before_call()
+        try:
+            data = cluster.forward(*args)
+        except CircuitOpenError:
+            breaker.record(False)
+            raise
+        except Exception:
+            breaker.record(True)
+            raise
+        breaker.record(True)
+        return data
+
+    def _get_candles(
+        self, exchange: str, symboltoken: str, interval: str, fromdate: str, todate: str
+    ) -> Dict[str, Any]:
+        # fails fast (CircuitOpenError) while SmartAPI is known to be down,
+        # without waiting for a call slot
+        breaker = self.hist.breaker
+        if breaker.is_open():
+            breaker.before_call()
         self.hist.throttle()
+        breaker.before_call()
+        t0 = time.monotonic()
         try:
+            self._ensure_session(self.hist)
+            params: Dict[str, Any] = {
+                "exchange": exchange,
+                "symboltoken": symboltoken,
+                "interval": interval,
+                "fromdate": fromdate,
+                "todate": todate,
+            }
             assert self.hist.client is not None
             raw = self.hist.client.getCandleData(params)
-            return self._ensure_dict_response(raw, "getCandleData")
+            data = self._ensure_dict_response(raw, "getCandleData")
         except Exception as e:
+            breaker.record(False)
             logger.error(f"getCandleData failed: {e}")
             raise
+        # status False is an API-level error (rate limit, bad session, outage)
+        breaker.record(data.get("status") is not False, time.monotonic() - t0)
+        return data
 
     def terminate_all(self):
+        if cluster.is_follower():
+            return
         for sess in (self.hist, self.trade):
             if sess.client:
                 try:
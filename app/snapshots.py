@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .candles import fetch_historical_chunked
+from .db import PORTFOLIOS, get_db
+from .logger import logger
+from .repositories import snapshots as snapshots_repo
+from .repositories import trades as trades_repo
+from .timeutils import end_of_day_ist, now_ist, start_of_day_ist
+from .trading import apply_fill
+
+
+@dataclass
+class PositionMatrix:
+    """All portfolios flattened into parallel arrays (one entry per position)."""
+
+    user_ids: List[Any]
+    cash: np.ndarray  # per user
+    realized_pl: np.ndarray  # per user
+    tokens: List[str]  # distinct tokens held anywhere
+    row: np.ndarray  # position -> user index
+    col: np.ndarray  # position -> token index
+    qty: np.ndarray
+    avg_price: np.ndarray
+
+
+def _matrix(docs: Iterable[Dict[str, Any]]) -> PositionMatrix:
+    user_ids: List[Any] = []
+    cash: List[float] = []
+    realized: List[float] = []
+    token_idx: Dict[str, int] = {}
+    row: List[int] = []
+    col: List[int] = []
+    qty: List[int] = []
+    avg: List[float] = []
+    for doc in docs:
+        i = len(user_ids)
+        user_ids.append(doc["user_id"])
+        cash.append(float(doc.get("cash", 0.0)))
+        realized.append(float(doc.get("realized_pl", 0.0)))
+        for tok, p in (doc.get("positions") or {}).items():
+            q = int(p.get("quantity", 0))
+            if q <= 0:
+                continue
+            j = token_idx.setdefault(tok, len(token_idx))
+            row.append(i)
+            col.append(j)
+            qty.append(q)
+            avg.append(float(p.get("avg_price", 0.0)))
+
+    return PositionMatrix(
+        user_ids=user_ids,
+        cash=np.asarray(cash, dtype=np.float64),
+        realized_pl=np.asarray(realized, dtype=np.float64),
+        tokens=list(token_idx),
+        row=np.asarray(row, dtype=np.int64),
+        col=np.asarray(col, dtype=np.int64),
+        qty=np.asarray(qty, dtype=np.float64),
+        avg_price=np.asarray(avg, dtype=np.float64),
+    )
+
+
+def load_positions(batch_size: int = 5000) -> PositionMatrix:
+    cur = (
+        get_db()[PORTFOLIOS]
+        .find({}, {"_id": 0, "user_id": 1, "cash": 1, "realized_pl": 1, "positions": 1})
+        .batch_size(batch_size)
+    )
+    return _matrix(cur)
+
+
+def _replay_until(
+    pf: Dict[str, Any], trades: Iterator[Dict[str, Any]], as_of: datetime
+) -> Dict[str, Any]:
+    realized_pl = 0.0
+    positions: Dict[str, Dict[str, Any]] = {}
+    # cash moved by trades after as_of, undone from today's cash
+    later = 0.0
+    for t in trades:
+        qty, price = int(t["quantity"]), float(t["price"])
+        if t["executed_at"] > as_of:
+            amount = round(qty * price, 2)
+            later += -amount if t["side"] == "BUY" else amount
+            continue
+        pos = positions.get(t["token"], {"quantity": 0, "avg_price": 0.0})
+        fill = apply_fill(
+            0.0,
+            realized_pl,
+            pos["quantity"],
+            pos["avg_price"],
+            t["side"],
+            qty,
+            price,
+            strict=False,
+        )
+        realized_pl = fill.realized_pl
+        positions[t["token"]] = {"quantity": fill.quantity, "avg_price": fill.avg_price}
+    return {
+        "user_id": pf["user_id"],
+        "cash": round(float(pf.get("cash", 0.0)) - later, 2),
+        "realized_pl": realized_pl,
+        "positions": positions,
+    }
+
+
+def load_positions_as_of(as_of: datetime, batch_size: int = 5000) -> PositionMatrix:
+    """Portfolios as they stood at as_of, rebuilt from the trade ledger.
+
+    Positions and realized P&L replay each user's trades up to as_of; cash is
+    today's cash with later trades undone. Deposits are not in the ledger, so
+    one made after as_of is still counted. Portfolios created after as_of are
+    left out.
+    """
+    portfolios = (
+        get_db()[PORTFOLIOS]
+        .find(
+            {"$or": [{"created_at": {"$lte": as_of}}, {"created_at": None}]},
+            {"_id": 0, "user_id": 1, "cash": 1},
+        )
+        .sort("user_id", -1)
+        .batch_size(batch_size)
+    )
+    trades = trades_repo.iter_replay(
+        batch_size=batch_size,
+        projection={
+            "_id": 0,
+            "user_id": 1,
+            "token": 1,
+            "side": 1,
+            "quantity": 1,
+            "price": 1,
+            "executed_at": 1,
+        },
+    )
+    groups = groupby(trades, key=lambda t: t["user_id"])
+    pending = next(groups, None)
+
+    def docs() -> Iterator[Dict[str, Any]]:
+        nonlocal pending
+        for pf in portfolios:
+            uid = pf["user_id"]
+            # same merge-join as app.rebuild: both sides in user_id desc order
+            while pending is not None and pending[0] > uid:
+                pending = next(groups, None)
+            user_trades: Iterator[Dict[str, Any]] = iter(())
+            if pending is not None and pending[0] == uid:
+                user_trades = pending[1]
+            yield _replay_until(pf, user_trades, as_of)
+            if pending is not None and pending[0] == uid:
+                pending = next(groups, None)
+
+    return _matrix(docs())
+
+
+def latest_closes(tokens: List[str], as_of: datetime) -> np.ndarray:
+    """Last ONE_DAY close at or before as_of for each token (NaN if unavailable).
+
+    Only bars inside the 10 days up to as_of count: a token without one is
+    left NaN rather than priced from a later day.
+    """
+    out = np.full(len(tokens), np.nan, dtype=np.float64)
+    start = start_of_day_ist(as_of - timedelta(days=10))
+    for j, tok in enumerate(tokens):
+        try:
+            raw = fetch_historical_chunked("NSE", tok, "ONE_DAY", start, as_of)
+            if raw:
+                out[j] = float(raw[-1][4])
+        except Exception as e:
+            logger.warning(f"Close unavailable for {tok}: {e}")
+    return out
+
+
+def compute_snapshots(pm: PositionMatrix, closes: np.ndarray) -> Dict[str, np.ndarray]:
+    n = len(pm.user_ids)
+    # Tokens without a close are valued at cost so NAV is never understated to 0
+    px = closes[pm.col]
+    px = np.where(np.isnan(px), pm.avg_price, px)
+    holdings = np.bincount(pm.row, weights=pm.qty * px, minlength=n)
+    invested = np.bincount(pm.row, weights=pm.qty * pm.avg_price, minlength=n)
+    return {
+        "cash": pm.cash,
+        "holdings_value": np.round(holdings, 2),
+        "invested": np.round(invested, 2),
+        "unrealized_pl": np.round(holdings - invested, 2),
+        "realized_pl": pm.realized_pl,
+        "nav": np.round(pm.cash + holdings, 2),
+    }
+
+
+def run_eod_snapshot(as_of: Optional[date] = None) -> int:
+    """Snapshot every portfolio for the given IST trading date; returns docs written."""
+    t0 = time.perf_counter()
+    day = as_of or now_ist().date()
+    as_of_dt = end_of_day_ist(datetime(day.year, day.month, day.day))
+
+    # a past day is rebuilt from the ledger; today's portfolios are as stored
+    if day < now_ist().date():
+        pm = load_positions_as_of(as_of_dt)
+    else:
+        pm = load_positions()
+    t_load = time.perf_counter()
+    closes = latest_closes(pm.tokens, as_of_dt)
+    missing = int(np.isnan(closes).sum())
+    if missing:
+        logger.warning(f"{missing}/{len(pm.tokens)} tokens without a close; using cost")
+    t_prices = time.perf_counter()
+    cols = compute_snapshots(pm, closes)
+    t_calc = time.perf_counter()
+
+    date_str = day.isoformat()
+    created = datetime.now(timezone.utc)
+    lists = {k: v.tolist() for k, v in cols.items()}
+    docs = (
+        {
+            "user_id": uid,
+            "date": date_str,
+            **{k: lists[k][i] for k in lists},
+            "created_at": created,
+        }
+        for i, uid in enumerate(pm.user_ids)
+    )
+    written = snapshots_repo.upsert_many(docs)
+    t_done = time.perf_counter()
+    logger.info(
+        f"EOD snapshot {date_str}: {written} portfolios, {len(pm.tokens)} tokens "
+        f"(load {t_load - t0:.2f}s, prices {t_prices - t_load:.2f}s, "
+        f"compute {t_calc - t_prices:.3f}s, write {t_done - t_calc:.2f}s)"
+    )
+    return written
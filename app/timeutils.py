@@ -15,18 +15,16 @@ def now_ist() -> datetime:
 
 
 def is_market_day(dt: datetime) -> bool:
-    return dt.weekday() < 5
+    # trading_calendar imports this module, hence the deferred imports
+    from .trading_calendar import is_trading_day
+
+    return is_trading_day(dt)
 
 
 def is_market_open(dt: datetime | None = None) -> bool:
-    if dt is None:
-        dt = now_ist()
-    if not is_market_day(dt):
-        return False
-    t = dt.timetz()
-    return (t >= MARKET_OPEN.replace(tzinfo=IST)) and (
-        t <= MARKET_CLOSE.replace(tzinfo=IST)
-    )
+    from .trading_calendar import is_open
+
+    return is_open(dt if dt is not None else now_ist())
 
 
 def to_smartapi_str(dt: datetime) -> str:
@@ -64,6 +62,12 @@ def parse_iso_ist(s: str) -> datetime:
     return dt.astimezone(IST)
 
 
+def bar_time(raw) -> datetime:
+    """A bar's timestamp (datetime or SmartAPI ISO string); IST if naive."""
+    dt = raw if isinstance(raw, datetime) else datetime.fromisoformat(str(raw))
+    return dt if dt.tzinfo else dt.replace(tzinfo=IST)
+
+
 def last_n_days_endpoints(n: int) -> tuple[datetime, datetime]:
     end = now_ist()
     start = end - timedelta(days=n)
@@ -1,16 +1,18 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
-from typing import Any, Dict, Literal, Tuple
+from typing import Any, Dict, Literal, NamedTuple, Tuple
 
 from bson import ObjectId
 
+from . import scheduler
 from .candles import fallback_daily_if_empty
 from .instruments import instruments
+from .leaderboard import leaderboard
+from .ledger import ledger_writer
 from .logger import logger
 from .repositories import portfolios as portfolios_repo
-from .repositories import trades as trades_repo
-from .timeutils import IST, now_ist
+from .timeutils import IST, is_market_open, now_ist
 
 Side = Literal["BUY", "SELL"]
 
@@ -21,14 +23,16 @@ def _today_ist_at(h: int, m: int, s: int = 0) -> datetime:
 
 
 def _is_market_open_like(now_dt: datetime) -> bool:
-    wd = now_dt.weekday()
-    if wd >= 5:
-        return False
-    t = now_dt.timetz()
-    return (t.hour, t.minute) >= (9, 0) and (t.hour, t.minute) <= (15, 30)
+    return is_market_open(now_dt)
 
 
 def _derive_fill_price(token: str, side: Side) -> float:
+    # fills jump every other queued SmartAPI call
+    with scheduler.priority(scheduler.FILL):
+        return _fill_price(token)
+
+
+def _fill_price(token: str) -> float:
     now = now_ist()
     if _is_market_open_like(now):
         start = _today_ist_at(9, 0)
@@ -45,6 +49,51 @@ def _derive_fill_price(token: str, side: Side) -> float:
     return round(price, 2)
 
 
+class Fill(NamedTuple):
+    cash: float
+    realized_pl: float
+    quantity: int
+    avg_price: float
+    amount: float  # cost of a BUY / proceeds of a SELL
+    realized: float  # P&L realized by this fill (SELL only)
+
+
+def apply_fill(
+    cash: float,
+    realized_pl: float,
+    qty_old: int,
+    avg_old: float,
+    side: Side,
+    quantity: int,
+    price: float,
+    strict: bool = True,
+) -> Fill:
+    """Portfolio arithmetic for one fill; the single source of BUY/SELL rules.
+
+    strict=False skips the cash/quantity checks, for replaying fills that
+    were already accepted (deposit timing is not in the ledger).
+    """
+    if side == "BUY":
+        cost = round(quantity * price, 2)
+        if strict and cash < cost:
+            raise ValueError("Insufficient cash")
+        qty_new = qty_old + quantity
+        avg_new = round(((qty_old * avg_old) + cost) / qty_new, 4)
+        return Fill(round(cash - cost, 2), realized_pl, qty_new, avg_new, cost, 0.0)
+    if strict and qty_old < quantity:
+        raise ValueError("Insufficient quantity")
+    proceeds = round(quantity * price, 2)
+    realized = round((price - avg_old) * quantity, 2)
+    return Fill(
+        round(cash + proceeds, 2),
+        round(realized_pl + realized, 2),
+        qty_old - quantity,
+        avg_old,
+        proceeds,
+        realized,
+    )
+
+
 def execute_trade(
     user_id: ObjectId | str,
     *,
@@ -73,80 +122,54 @@ def execute_trade(
     uid = ObjectId(user_id) if not isinstance(user_id, ObjectId) else user_id
     for _ in range(5):
         p = pr.get_or_create(uid)
-        cash = float(p["cash"])
-        realized_pl = float(p.get("realized_pl", 0.0))
         positions = dict(p.get("positions", {}))
         pos = dict(
             positions.get(token, {"symbol": symbol, "quantity": 0, "avg_price": 0.0})
         )
-        qty_old = int(pos.get("quantity", 0))
-        avg_old = float(pos.get("avg_price", 0.0))
-
-        if side == "BUY":
-            cost = round(quantity * price, 2)
-            if cash < cost:
-                raise ValueError("Insufficient cash")
-            qty_new = qty_old + quantity
-            avg_new = round(((qty_old * avg_old) + cost) / qty_new, 4)
-            pos.update({"symbol": symbol, "quantity": qty_new, "avg_price": avg_new})
-            positions[token] = pos
-            new_fields = {
-                "cash": round(cash - cost, 2),
-                "positions": positions,
-                "realized_pl": realized_pl,
-            }
-            success = pr.compare_and_swap(uid, p["rev"], new_fields)
-            if success:
-                trade = {
-                    "user_id": uid,
-                    "token": token,
-                    "symbol": symbol,
-                    "side": side,
-                    "quantity": quantity,
-                    "price": price,
-                    "amount": round(cost, 2),
-                    "realized_pl": 0.0,
-                }
-                tdoc = trades_repo.insert_trade(trade)
-                updated_pf = pr.get(uid)
-                if not updated_pf:
-                    raise RuntimeError("Portfolio not found after update")
-                return updated_pf, tdoc
+        fill = apply_fill(
+            float(p["cash"]),
+            float(p.get("realized_pl", 0.0)),
+            int(pos.get("quantity", 0)),
+            float(pos.get("avg_price", 0.0)),
+            side,
+            quantity,
+            price,
+        )
+        if fill.quantity == 0:
+            positions.pop(token, None)
         else:
-            if qty_old < quantity:
-                raise ValueError("Insufficient quantity")
-            proceeds = round(quantity * price, 2)
-            realized = round((price - avg_old) * quantity, 2)
-            qty_new = qty_old - quantity
-            if qty_new == 0:
-                positions.pop(token, None)
-            else:
-                pos.update(
-                    {"symbol": symbol, "quantity": qty_new, "avg_price": avg_old}
-                )
-                positions[token] = pos
-            new_fields = {
-                "cash": round(cash + proceeds, 2),
-                "positions": positions,
-                "realized_pl": round(realized_pl + realized, 2),
-            }
-            success = pr.compare_and_swap(uid, p["rev"], new_fields)
-            if success:
-                trade = {
-                    "user_id": uid,
-                    "token": token,
+            pos.update(
+                {
                     "symbol": symbol,
-                    "side": side,
-                    "quantity": quantity,
-                    "price": price,
-                    "amount": round(proceeds, 2),
-                    "realized_pl": realized,
+                    "quantity": fill.quantity,
+                    "avg_price": fill.avg_price,
                 }
-                tdoc = trades_repo.insert_trade(trade)
-                updated_pf = pr.get(uid)
-                if not updated_pf:
-                    raise RuntimeError("Portfolio not found after update")
-                return updated_pf, tdoc
+            )
+            positions[token] = pos
+        new_fields = {
+            "cash": fill.cash,
+            "positions": positions,
+            "realized_pl": fill.realized_pl,
+        }
+        success = pr.compare_and_swap(uid, p["rev"], new_fields)
+        if success:
+            trade = {
+                "user_id": uid,
+                "token": token,
+                "symbol": symbol,
+                "side": side,
+                "quantity": quantity,
+                "price": price,
+                "amount": fill.amount,
+                "realized_pl": fill.realized,
+            }
+            tdoc = ledger_writer.record(trade)
+            updated_pf = pr.get(uid)
+            if not updated_pf:
+                raise RuntimeError("Portfolio not found after update")
+            leaderboard.on_price(token, price)
+            leaderboard.on_portfolio(updated_pf)
+            return updated_pf, tdoc
         # OCC conflict, retry
         logger.warning("Portfolio OCC conflict; retrying...")
     raise RuntimeError("Concurrent update; please retry")
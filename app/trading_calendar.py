@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import json
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from .config import settings
+from .logger import logger
+from .timeutils import IST, MARKET_CLOSE, MARKET_OPEN
+
+# NSE equity segment trading holidays (weekday closures only; weekends are
+# always closed). Published by NSE each December for the following year;
+# extend via TRADING_CALENDAR_FILE without a code change. Yearly task: add
+# the new year here or in the file, or every weekday past the last year
+# listed counts as a trading day (logged, and reported by /api/ready).
+HOLIDAYS: Dict[str, str] = {
+    # 2024
+    "2024-01-22": "Special holiday",
+    "2024-01-26": "Republic Day",
+    "2024-03-08": "Mahashivratri",
+    "2024-03-25": "Holi",
+    "2024-03-29": "Good Friday",
+    "2024-04-11": "Id-Ul-Fitr",
+    "2024-04-17": "Shri Ram Navmi",
+    "2024-05-01": "Maharashtra Day",
+    "2024-05-20": "General elections (Mumbai)",
+    "2024-06-17": "Bakri Id",
+    "2024-07-17": "Moharram",
+    "2024-08-15": "Independence Day",
+    "2024-10-02": "Mahatma Gandhi Jayanti",
+    "2024-11-01": "Diwali Laxmi Pujan",
+    "2024-11-15": "Gurunanak Jayanti",
+    "2024-11-20": "Maharashtra assembly elections",
+    "2024-12-25": "Christmas",
+    # 2025
+    "2025-02-26": "Mahashivratri",
+    "2025-03-14": "Holi",
+    "2025-03-31": "Id-Ul-Fitr",
+    "2025-04-10": "Shri Mahavir Jayanti",
+    "2025-04-14": "Dr. Baba Saheb Ambedkar Jayanti",
+    "2025-04-18": "Good Friday",
+    "2025-05-01": "Maharashtra Day",
+    "2025-08-15": "Independence Day",
+    "2025-08-27": "Ganesh Chaturthi",
+    "2025-10-02": "Mahatma Gandhi Jayanti/Dussehra",
+    "2025-10-21": "Diwali Laxmi Pujan",
+    "2025-10-22": "Balipratipada",
+    "2025-11-05": "Prakash Gurpurb Sri Guru Nanak Dev",
+    "2025-12-25": "Christmas",
+    # 2026
+    "2026-01-26": "Republic Day",
+    "2026-03-03": "Holi",
+    "2026-03-26": "Shri Ram Navami",
+    "2026-03-31": "Shri Mahavir Jayanti",
+    "2026-04-03": "Good Friday",
+    "2026-04-14": "Dr. Baba Saheb Ambedkar Jayanti",
+    "2026-05-01": "Maharashtra Day",
+    "2026-05-28": "Bakri Id",
+    "2026-06-26": "Muharram",
+    "2026-09-14": "Ganesh Chaturthi",
+    "2026-10-02": "Mahatma Gandhi Jayanti",
+    "2026-10-20": "Dussehra",
+    "2026-11-10": "Diwali Balipratipada",
+    "2026-11-24": "Prakash Gurpurb Sri Guru Nanak Dev",
+    "2026-12-25": "Christmas",
+}
+
+# Sessions outside the regular calendar: Muhurat trading on Diwali, and
+# Saturday sessions (budget day, DR drills). (open, close) in IST.
+SPECIAL_SESSIONS: Dict[str, Tuple[str, str]] = {
+    "2024-01-20": ("09:15", "15:30"),
+    "2024-03-02": ("09:15", "12:30"),
+    "2024-11-01": ("18:00", "19:00"),
+    "2025-02-01": ("09:15", "15:30"),
+    "2025-10-21": ("13:45", "14:45"),
+}
+
+
+def _hm(s: str) -> time:
+    h, m = s.split(":")
+    return time(int(h), int(m))
+
+
+@lru_cache(maxsize=1)
+def _tables() -> Tuple[Dict[str, str], Dict[str, Tuple[time, time]]]:
+    holidays = dict(HOLIDAYS)
+    special = {d: (_hm(o), _hm(c)) for d, (o, c) in SPECIAL_SESSIONS.items()}
+    path = settings.trading_calendar_file
+    if path:
+        # { "holidays": {"YYYY-MM-DD": "name"}, "special_sessions": {"YYYY-MM-DD": ["HH:MM", "HH:MM"]} }
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            holidays.update(data.get("holidays") or {})
+            for d, (o, c) in (data.get("special_sessions") or {}).items():
+                special[d] = (_hm(o), _hm(c))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Trading calendar file {path} not loaded: {e}")
+    return holidays, special
+
+
+@lru_cache(maxsize=1)
+def last_year() -> int:
+    """Last year the holiday tables (built-in plus file) cover."""
+    return max(int(d[:4]) for d in _tables()[0])
+
+
+_warned: set = set()
+
+
+def _check_year(d: date):
+    if d.year > last_year() and d.year not in _warned:
+        _warned.add(d.year)
+        logger.warning(
+            f"Trading calendar has no holidays for {d.year} (last: {last_year()}); "
+            "weekdays count as sessions. Add them to TRADING_CALENDAR_FILE"
+        )
+
+
+def check_coverage():
+    """Raise when the tables do not cover the current year (readiness task)."""
+    year = datetime.now(IST).year
+    if year > last_year():
+        raise ValueError(
+            f"no NSE holidays for {year} (tables end in {last_year()}); "
+            "update TRADING_CALENDAR_FILE"
+        )
+
+
+def _day(d) -> date:
+    if isinstance(d, datetime):
+        if d.tzinfo is None:
+            d = d.replace(tzinfo=IST)
+        return d.astimezone(IST).date()
+    return d
+
+
+def holiday(d) -> Optional[str]:
+    """Holiday name if d is a weekday exchange holiday."""
+    return _tables()[0].get(_day(d).isoformat())
+
+
+def session_hours(d) -> Optional[Tuple[time, time]]:
+    """(open, close) of the session on d, or None when there is no trading."""
+    d = _day(d)
+    _check_year(d)
+    holidays, special = _tables()
+    key = d.isoformat()
+    if key in special:
+        return special[key]
+    if d.weekday() >= 5 or key in holidays:
+        return None
+    return MARKET_OPEN, MARKET_CLOSE
+
+
+def is_trading_day(d) -> bool:
+    return session_hours(d) is not None
+
+
+def is_open(dt: datetime) -> bool:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=IST)
+    dt = dt.astimezone(IST)
+    hours = session_hours(dt)
+    if hours is None:
+        return False
+    return hours[0] <= dt.time() <= hours[1]
+
+
+def trading_days(start: datetime, end: datetime) -> List[date]:
+    d, last = _day(start), _day(end)
+    out = []
+    while d <= last:
+        if is_trading_day(d):
+            out.append(d)
+        d += timedelta(days=1)
+    return out
@@ -31,6 +31,7 @@ export default function Stock()
 	const [series, setSeries] = useState([])
 	const [loading, setLoading] = useState(false)
 	const [err, setErr] = useState('')
+	const [stale, setStale] = useState(false)
 	const [side, setSide] = useState('BUY')
 	const [qty, setQty] = useState(1)
 	const [marketOpen, setMarketOpen] = useState(false)
@@ -85,7 +86,11 @@ export default function Stock()
 					to: to.toISOString()
 				}
 				const res = await api.get('/api/candles', { params })
-				if (mounted) setSeries(res.data?.series || [])
+				if (mounted)
+				{
+					setSeries(res.data?.series || [])
+					setStale(!!res.data?.stale)
+				}
 			} catch (e)
 			{
 				if (mounted) setErr(e?.response?.data?.detail || 'Failed to load candles')
@@ -185,6 +190,7 @@ export default function Stock()
 			{!loading && err && <div className="card" style={{ borderColor: 'var(--danger)', color: 'var(--danger)' }}>{err}</div>}
 			{!loading && !err && (
 				<div className="card">
+					{stale && <small className="muted">Showing the last loaded bars; refreshing in the background.</small>}
 					<ChartOHLC
 						series={series}
 						mode={mode}
@@ -0,0 +1,61 @@
+import csv
+import json
+import os
+import time
+from datetime import timedelta
+
+from app.backtest import Strategy, run_universe
+from app.instruments import instruments
+from app.timeutils import now_ist
+
+DEFAULT_STRATEGY = {
+    "signal": {"type": "sma_cross", "fast": 20, "slow": 50},
+    "sizing": {"type": "percent_cash", "value": 1.0},
+}
+
+
+def main():
+    # STRATEGY='{"signal": {...}, "sizing": {...}}' YEARS=5 WORKERS=8
+    # STORE_DIR=data/candles (read if present, filled on fetch) OUT=backtest.csv
+    spec = os.environ.get("STRATEGY")
+    strategy = Strategy.from_dict(json.loads(spec) if spec else DEFAULT_STRATEGY)
+    years = int(os.environ.get("YEARS", "5"))
+    workers = int(os.environ.get("WORKERS", "0")) or None
+    store_dir = os.environ.get("STORE_DIR") or None
+    out_path = os.environ.get("OUT", "backtest.csv")
+
+    end = now_ist()
+    start = end - timedelta(days=365 * years)
+    tokens = [ins.token for ins in instruments.all()]
+    print(f"Backtesting {len(tokens)} instruments over {years}y")
+
+    t0 = time.perf_counter()
+    results = run_universe(
+        strategy, tokens, start, end, store_dir=store_dir, workers=workers
+    )
+    elapsed = time.perf_counter() - t0
+
+    cols = [
+        "token",
+        "symbol",
+        "bars",
+        "trades",
+        "final_equity",
+        "total_return",
+        "cagr",
+        "max_drawdown",
+        "win_rate",
+        "error",
+    ]
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=cols, extrasaction="ignore")
+        w.writeheader()
+        for r in sorted(results, key=lambda r: r["token"]):
+            ins = instruments.find_by_token(r["token"])
+            w.writerow({**r, "symbol": ins.symbol if ins else ""})
+    ok = sum(1 for r in results if "error" not in r)
+    print(f"{ok}/{len(results)} backtests in {elapsed:.1f}s -> {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import os
+from datetime import date
+
+from app.db import connect_mongo, ensure_indexes
+from app.snapshots import run_eod_snapshot
+
+
+def main():
+    connect_mongo()
+    ensure_indexes()
+
+    # AS_OF=YYYY-MM-DD to backfill a specific day (defaults to today IST)
+    as_of = os.environ.get("AS_OF")
+    day = date.fromisoformat(as_of) if as_of else None
+    written = run_eod_snapshot(day)
+    print(f"Snapshots written: {written}")
+
+
+if __name__ == "__main__":
+    main()
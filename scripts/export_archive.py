@@ -0,0 +1,50 @@
+import os
+import time
+from datetime import timedelta
+
+from app.candle_archive import write
+from app.candles import fetch_historical_chunked
+from app.config import settings
+from app.instruments import instruments
+from app.timeutils import end_of_day_ist, now_ist, start_of_day_ist
+
+
+def main():
+    # ARCHIVE_DIR (defaults to CANDLE_ARCHIVE_DIR or data/archive) YEARS=5
+    # INTERVALS=ONE_DAY[,FIFTEEN_MINUTE] TOKENS=a,b PARQUET=1 (also write .parquet)
+    root = (
+        os.environ.get("ARCHIVE_DIR") or settings.candle_archive_dir or "data/archive"
+    )
+    years = int(os.environ.get("YEARS", "5"))
+    intervals = [
+        i.strip() for i in os.environ.get("INTERVALS", "ONE_DAY").split(",") if i
+    ]
+    only = {t.strip() for t in os.environ.get("TOKENS", "").split(",") if t.strip()}
+    parquet = os.environ.get("PARQUET", "0").lower() in ("1", "true")
+
+    # Complete days only: the archive is history, today stays on the live path
+    end = end_of_day_ist(now_ist() - timedelta(days=1))
+    start = start_of_day_ist(end - timedelta(days=365 * years))
+    universe = [i for i in instruments.all() if not only or i.token in only]
+    print(f"Archiving {len(universe)} instruments x {intervals} into {root}")
+
+    t0 = time.perf_counter()
+    rows = 0
+    for n, ins in enumerate(universe, start=1):
+        for iv in intervals:
+            try:
+                raw = fetch_historical_chunked("NSE", ins.token, iv, start, end)
+            except Exception as e:
+                print(f"  {ins.symbol} {iv} failed: {e}")
+                continue
+            if not raw:
+                print(f"  {ins.symbol} {iv}: no bars; skipped")
+                continue
+            rows += write(root, iv, ins.symbol, raw, start, end, parquet=parquet)
+        if n % 50 == 0:
+            print(f"  {n}/{len(universe)} instruments, {rows} rows")
+    print(f"Archived {rows} rows in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from app import candle_store
+from app.candles import fetch_historical_chunked
+from app.db import connect_mongo, ensure_indexes
+from app.instruments import instruments
+from app.request_planner import missing_in
+from app.timeutils import now_ist
+
+
+class Checkpoint:
+    """Completed (token, interval) jobs for one run, saved atomically.
+
+    The run's end time is saved with it, so a resume on a later day keeps
+    fetching the same windows instead of starting over.
+    """
+
+    def __init__(self, path: str, run_key: str, end: datetime):
+        self.path = path
+        self.run_key = run_key
+        self.end = end
+        self.done: set = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # a checkpoint from a different run (other span/intervals) does not apply
+            if data.get("run") == run_key and data.get("end"):
+                self.end = datetime.fromisoformat(data["end"])
+                self.done = set(data.get("done", []))
+
+    def reset(self, end: datetime):
+        with self._lock:
+            self.end = end
+            self.done = set()
+
+    def mark(self, job: str):
+        with self._lock:
+            self.done.add(job)
+
+    def save(self):
+        with self._lock:
+            data = {
+                "run": self.run_key,
+                "end": self.end.isoformat(),
+                "done": sorted(self.done),
+            }
+        tmp = self.path + ".tmp"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+
+def _fmt_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
+
+
+def main():
+    # YEARS=5 daily bars for every instrument; INTRADAY=FIVE_MINUTE[,ONE_MINUTE]
+    # with INTRADAY_DAYS=30 for recent intraday bars. WORKERS threads share the
+    # SmartAPI session throttle, so they overlap latency without exceeding it.
+    # Interrupt freely: CHECKPOINT records finished jobs and a rerun resumes.
+    years = int(os.environ.get("YEARS", "5"))
+    intraday = [i.strip() for i in os.environ.get("INTRADAY", "").split(",") if i]
+    intraday_days = int(os.environ.get("INTRADAY_DAYS", "30"))
+    workers = int(os.environ.get("WORKERS", "4"))
+    ckpt_path = os.environ.get("CHECKPOINT", "data/ingest_checkpoint.json")
+    only = {t.strip() for t in os.environ.get("TOKENS", "").split(",") if t.strip()}
+    if not candle_store.enabled():
+        raise SystemExit("CANDLE_STORE=true is required: fetched bars are not kept")
+
+    connect_mongo()
+    ensure_indexes()
+
+    run_key = f"{years}y:{','.join(intraday)}:{intraday_days}d"
+    ckpt = Checkpoint(ckpt_path, run_key, now_ist())
+    tokens = [ins.token for ins in instruments.all() if not only or ins.token in only]
+    ivs = ["ONE_DAY"] + intraday
+    jobs = [(tok, iv) for tok in tokens for iv in ivs if f"{tok}:{iv}" not in ckpt.done]
+    if ckpt.done and not jobs:
+        # the saved run finished: this is a new one, up to now
+        ckpt.reset(now_ist())
+        jobs = [(tok, iv) for tok in tokens for iv in ivs]
+
+    end = ckpt.end
+    spans = {"ONE_DAY": end - timedelta(days=365 * years)}
+    for iv in intraday:
+        spans[iv] = end - timedelta(days=intraday_days)
+    total = len(jobs) + len(ckpt.done)
+    print(
+        f"Ingest: {len(tokens)} instruments x {list(spans)} up to {end:%Y-%m-%d %H:%M}; "
+        f"{len(ckpt.done)} done already, {len(jobs)} to go ({workers} workers)"
+    )
+
+    def run(tok: str, iv: str):
+        rows = fetch_historical_chunked("NSE", tok, iv, spans[iv], end)
+        return len(rows), not missing_in(rows, spans[iv], end)
+
+    t0 = time.perf_counter()
+    finished = bars = incomplete = 0
+    last_report = t0
+    pending = {}
+    it = iter(jobs)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for job in it:
+                pending[pool.submit(run, *job)] = job
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    tok, iv = pending.pop(fut)
+                    try:
+                        n, complete = fut.result()
+                    except Exception as e:
+                        n, complete = 0, False
+                        print(f"  {tok} {iv} failed: {e}")
+                    bars += n
+                    # a chunk without an answer is fetched again next run
+                    if complete:
+                        ckpt.mark(f"{tok}:{iv}")
+                    else:
+                        incomplete += 1
+                    finished += 1
+                    nxt = next(it, None)
+                    if nxt is not None:
+                        pending[pool.submit(run, *nxt)] = nxt
+                now = time.perf_counter()
+                if now - last_report >= 10 or not pending:
+                    last_report = now
+                    ckpt.save()
+                    rate = finished / max(now - t0, 1e-9)
+                    left = len(jobs) - finished
+                    print(
+                        f"  {len(ckpt.done)}/{total} jobs, {bars} bars, "
+                        f"{rate * 60:.1f} jobs/min, ETA {_fmt_eta(left / rate if rate else 0)}"
+                    )
+        except KeyboardInterrupt:
+            print("Interrupted; finishing in-flight jobs and saving checkpoint")
+            pool.shutdown(wait=True, cancel_futures=True)
+        finally:
+            ckpt.save()
+    print(
+        f"Done {finished} jobs ({incomplete} incomplete, retried next run), {bars} bars "
+        f"in {time.perf_counter() - t0:.1f}s; checkpoint {ckpt_path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
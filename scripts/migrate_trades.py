@@ -0,0 +1,110 @@
+import os
+import time
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.db import TRADE_BUCKETS, TRADES, connect_mongo, ensure_indexes
+from app.repositories import trade_buckets
+
+DUPLICATE_KEY = 11000
+
+
+def _sizes(db, name: str) -> str:
+    try:
+        st = db.command("collStats", name)
+    except Exception:
+        return f"{name}: n/a"
+    mb = 1024 * 1024
+    return (
+        f"{name}: {st.get('count', 0)} docs, "
+        f"data {st.get('size', 0) / mb:.1f} MB, "
+        f"storage {st.get('storageSize', 0) / mb:.1f} MB, "
+        f"indexes {st.get('totalIndexSize', 0) / mb:.1f} MB"
+    )
+
+
+def _to_buckets(db, batch: int, resume_after: str) -> int:
+    query = {"_id": {"$gt": ObjectId(resume_after)}} if resume_after else {}
+    cur = db[TRADES].find(query).sort("_id", 1).batch_size(batch)
+    moved, chunk, t0 = 0, [], time.perf_counter()
+    for doc in cur:
+        chunk.append(doc)
+        if len(chunk) >= batch:
+            trade_buckets.insert_many(chunk)
+            moved += len(chunk)
+            rate = moved / max(time.perf_counter() - t0, 1e-9)
+            # RESUME_AFTER=<last _id> restarts from here
+            print(f"  {moved} trades ({rate:,.0f}/s), last _id {chunk[-1]['_id']}")
+            chunk = []
+    trade_buckets.insert_many(chunk)
+    return moved + len(chunk)
+
+
+def _to_documents(db, batch: int) -> int:
+    moved, chunk = 0, []
+
+    def flush():
+        try:
+            db[TRADES].insert_many(chunk, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                raise
+
+    for doc in trade_buckets.iter_replay(batch_size=max(1, batch // 100)):
+        chunk.append(doc)
+        if len(chunk) >= batch:
+            flush()
+            moved += len(chunk)
+            print(f"  {moved} trades")
+            chunk = []
+    if chunk:
+        flush()
+    return moved + len(chunk)
+
+
+def main():
+    db = connect_mongo()
+    ensure_indexes()
+
+    # TARGET=buckets|documents; copies are idempotent, so a rerun is safe
+    target = os.environ.get("TARGET", "buckets").strip().lower()
+    batch = int(os.environ.get("BATCH", "5000"))
+    drop_source = os.environ.get("DROP_SOURCE", "false").lower() in ("1", "true")
+    resume_after = os.environ.get("RESUME_AFTER", "").strip()
+    if target not in ("buckets", "documents"):
+        raise SystemExit("TARGET must be buckets or documents")
+
+    print("Before:")
+    print("  " + _sizes(db, TRADES))
+    print("  " + _sizes(db, TRADE_BUCKETS))
+    t0 = time.perf_counter()
+    if target == "buckets":
+        moved = _to_buckets(db, batch, resume_after)
+    else:
+        moved = _to_documents(db, batch)
+    print(f"Copied {moved} trades to {target} in {time.perf_counter() - t0:.1f}s")
+
+    in_docs = db[TRADES].estimated_document_count()
+    agg = list(
+        db[TRADE_BUCKETS].aggregate([{"$group": {"_id": None, "n": {"$sum": "$n"}}}])
+    )
+    in_buckets = agg[0]["n"] if agg else 0
+    print(f"Trades: documents={in_docs} buckets={in_buckets}")
+
+    if drop_source:
+        if in_docs != in_buckets:
+            raise SystemExit("Counts differ; not dropping the source collection")
+        db.drop_collection(TRADES if target == "buckets" else TRADE_BUCKETS)
+        ensure_indexes()
+        print("Source collection dropped")
+
+    print("After:")
+    print("  " + _sizes(db, TRADES))
+    print("  " + _sizes(db, TRADE_BUCKETS))
+    print(f"Set TRADES_STORAGE={target} and restart the API")
+
+
+if __name__ == "__main__":
+    main()
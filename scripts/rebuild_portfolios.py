@@ -0,0 +1,38 @@
+import os
+
+from app.db import connect_mongo, ensure_indexes
+from app.rebuild import rebuild
+from app.repositories import users as users_repo
+
+
+def main():
+    connect_mongo()
+    ensure_indexes()
+
+    # REBUILD_USER=<username> for one user (default: everyone); APPLY=1 to rewrite
+    username = os.environ.get("REBUILD_USER")
+    apply = os.environ.get("APPLY", "").strip().lower() in ("1", "true", "yes")
+    uid = None
+    if username:
+        user = users_repo.get_by_username(username)
+        if not user:
+            print(f"No such user: {username}")
+            return
+        uid = user["_id"]
+
+    report = rebuild(user_id=uid, apply=apply)
+    print(
+        f"Portfolios: {report.portfolios}, trades: {report.trades}, "
+        f"drifted: {report.drifted}, rewritten: {report.rewritten}, "
+        f"conflicts: {report.conflicts}, orphan users: {report.orphan_users}, "
+        f"without contributed (cash not checked): {report.missing_contributed}, "
+        f"{report.seconds}s"
+    )
+    for s in report.samples:
+        print(f"  {s['user_id']}: {'; '.join(s['problems'])}")
+    if report.drifted and not apply:
+        print("Dry run; set APPLY=1 to rewrite drifted portfolios")
+
+
+if __name__ == "__main__":
+    main()